@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Compare numpy.savetxt with the chunked CSV writer.
+
+Both write the same timed-combined waveform, the outputs are checked to
+be byte-identical, e.g.
+
+    python benchmarks/bench_csv.py --points 1000000 --channels 4
+"""
+
+import argparse
+import filecmp
+import numpy
+import os
+import tempfile
+import time
+
+from osccap.export import write_csv
+from osccap.waveform import TimeAxis, Waveform
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--channels', type=int, default=4)
+    args = parser.parse_args()
+
+    time_array = TimeAxis(-5e-4, 1e-9, args.points)
+    channels = [Waveform(numpy.random.randint(-32768, 32767, args.points)
+                         .astype('>i2'), 7.8125e-5, 0.0)
+                for _ in range(args.channels)]
+    columns = [time_array] + channels
+    fmts = ['%.4e'] + ['%.7e'] * args.channels
+
+    directory = tempfile.mkdtemp()
+    savetxt_file = os.path.join(directory, 'savetxt.csv')
+    chunked_file = os.path.join(directory, 'chunked.csv')
+
+    start = time.perf_counter()
+    array = numpy.asarray(time_array)
+    for channel in channels:
+        array = numpy.vstack((array, numpy.asarray(channel)))
+    numpy.savetxt(savetxt_file, numpy.transpose(array), delimiter=',',
+                  fmt=fmts)
+    savetxt_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_csv(chunked_file, columns, fmts)
+    chunked_time = time.perf_counter() - start
+
+    identical = filecmp.cmp(savetxt_file, chunked_file, shallow=False)
+    print('points={} channels={} size={} bytes'
+          .format(args.points, args.channels, os.path.getsize(savetxt_file)))
+    print('numpy.savetxt: {:.3f}s'.format(savetxt_time))
+    print('write_csv:     {:.3f}s ({:.1f}x)'
+          .format(chunked_time, savetxt_time / chunked_time))
+    print('identical:     {}'.format(identical))
+
+    os.remove(savetxt_file)
+    os.remove(chunked_file)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Compare the size and speed of the CSV and the npz waveform formats.
+
+    python benchmarks/bench_export.py --points 1000000 --channels 4
+"""
+
+import argparse
+import numpy
+import os
+import tempfile
+import time
+
+from osccap.container import load_container, save_container
+from osccap.export import write_csv
+from osccap.oscilloscope.agilent import Preamble
+from osccap.waveform import TimeAxis, Waveform
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--channels', type=int, default=4)
+    args = parser.parse_args()
+
+    preamble = Preamble(format=2, type=0, points=args.points, count=1,
+                        x_increment=1e-9, x_origin=-5e-4, x_reference=0,
+                        y_increment=7.8125e-5, y_origin=0.0, y_reference=0)
+    sources = ['CHANNEL{}'.format(i + 1) for i in range(args.channels)]
+    waveforms = dict((s, Waveform(numpy.random.randint(-32768, 32767,
+                                                       args.points)
+                                  .astype('>i2'), preamble.y_increment, 0.0))
+                     for s in sources)
+    preambles = dict((s, preamble) for s in sources)
+
+    directory = tempfile.mkdtemp()
+    csv_file = os.path.join(directory, 'waveform.csv')
+    npz_file = os.path.join(directory, 'waveform.npz')
+
+    start = time.perf_counter()
+    time_array = TimeAxis(-5e-4, 1e-9, args.points)
+    columns = [time_array] + [waveforms[s] for s in sources]
+    write_csv(csv_file, columns, ['%.4e'] + ['%.7e'] * len(sources))
+    csv_write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    numpy.loadtxt(csv_file, delimiter=',')
+    csv_read = time.perf_counter() - start
+
+    start = time.perf_counter()
+    save_container(npz_file, ['SIM'], waveforms, preambles)
+    npz_write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loaded = load_container(npz_file)
+    for s in sources:
+        numpy.asarray(loaded.waveform(s))
+    npz_read = time.perf_counter() - start
+
+    csv_size = os.path.getsize(csv_file)
+    npz_size = os.path.getsize(npz_file)
+    print('{:6} {:>12} {:>10} {:>10}'.format('format', 'bytes', 'write [s]',
+                                             'read [s]'))
+    print('{:6} {:>12} {:>10.3f} {:>10.3f}'.format('csv', csv_size, csv_write,
+                                                   csv_read))
+    print('{:6} {:>12} {:>10.3f} {:>10.3f}'.format('npz', npz_size, npz_write,
+                                                   npz_read))
+    print('npz is {:.1f}x smaller'.format(csv_size / npz_size))
+
+    del loaded
+    os.remove(csv_file)
+    os.remove(npz_file)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
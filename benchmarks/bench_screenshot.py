@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Compare the screenshot latency of each on-scope image format.
+
+The screenshot is fetched from a scope (or a local simulated instrument)
+in each format and re-encoded into the output format on the host, e.g.
+
+    python benchmarks/bench_screenshot.py --host 192.168.0.1 --model MSO58
+
+The fastest total is the best screenshot_format for that scope.
+"""
+
+import argparse
+import time
+
+from osccap.image import convert_image
+from osccap.oscilloscope import agilent, tektronix
+from osccap.oscilloscope.transport import Vxi11Transport
+from osccap.simulator import (create_instrument, Vxi11Server,
+                              serve_in_background)
+
+DRIVERS = {
+    'DSOX91604A': agilent,
+}
+DRIVERS.update((model, tektronix) for model in tektronix.MSO_MODELS)
+
+
+def measure(dev, driver, model, image_format, output_format, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        img_data = driver.take_screenshot(dev, model,
+                                          image_format=image_format)
+        transfer = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            convert_image(img_data, output_format)
+        except RuntimeError:
+            # Pillow is missing
+            return (len(img_data), transfer, float('nan'))
+        encode = time.perf_counter() - start
+        if best is None or transfer + encode < sum(best[1:]):
+            best = (len(img_data), transfer, encode)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', help='scope to measure, default is a '
+                        'local simulated instrument')
+    parser.add_argument('--model', default='DSOX91604A',
+                        choices=sorted(DRIVERS))
+    parser.add_argument('--formats', default='png,bmp',
+                        help='comma separated on-scope formats')
+    parser.add_argument('--output', default='png', help='host image format')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.host is None:
+        server = Vxi11Server(create_instrument(args.model),
+                             ('127.0.0.1', 0))
+        serve_in_background(server)
+        dev = Vxi11Transport('127.0.0.1', port=server.server_address[1])
+    else:
+        dev = Vxi11Transport(args.host)
+    dev.open()
+
+    driver = DRIVERS[args.model]
+    print('{:6} {:>10} {:>12} {:>10} {:>10}'.format(
+            'format', 'bytes', 'transfer [s]', 'encode [s]', 'total [s]'))
+    for image_format in args.formats.split(','):
+        size, transfer, encode = measure(dev, driver, args.model,
+                                         image_format, args.output,
+                                         args.repeat)
+        print('{:6} {:>10} {:>12.3f} {:>10.3f} {:>10.3f}'.format(
+                image_format, size, transfer, encode, transfer + encode))
+    dev.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+"""Benchmark the capture, conversion and export paths.
+
+Each case runs for every record length and channel count of the sweep,
+against in-memory data or a local simulated instrument. The latency (best
+of --repeat runs), the sample throughput and the peak RSS are written as
+JSON. By default a small sweep runs and is compared against
+benchmarks/baseline.json, the results of the same sweep from an earlier
+run. --full sweeps 1k to 64M points and 1 to 8 channels, other sweeps are
+compared against a baseline of an earlier run, e.g.
+
+    python benchmarks/bench_suite.py --points 1k,1M --channels 1,4 \
+            --output current.json --baseline baseline.json
+
+The exit status is 1 if a case regressed by more than --threshold.
+"""
+
+import argparse
+import json
+import multiprocessing
+import numpy
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from osccap.export import save_waveform_to_file, WAVEFORM_FORMATS
+from osccap.oscilloscope import Oscilloscope
+from osccap.oscilloscope.agilent import (binary_block, convert_waveform_data,
+                                         Preamble)
+from osccap.oscilloscope.liveness import LivenessCache
+from osccap.simulator import (block, create_instrument, Vxi11Server,
+                              serve_in_background)
+from osccap.waveform import time_info
+
+DEFAULT_POINTS = '1k,64k,1M'
+DEFAULT_CHANNELS = '1,8'
+FULL_POINTS = '1k,64k,1M,16M,64M'
+FULL_CHANNELS = '1,2,4,8'
+
+# results of the default sweep, see the README on updating it
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+
+# differences below these are noise, whatever the threshold
+NOISE_FLOOR = {
+    'latency': 0.01,
+    'peak_rss': 8e6,
+}
+
+_SUFFIXES = {'k': 1000, 'M': 1000000}
+
+
+def _parse_points(value):
+    points = list()
+    for v in value.split(','):
+        v = v.strip()
+        factor = _SUFFIXES.get(v[-1:], 1)
+        points.append(int(v.rstrip('kM')) * factor)
+    return points
+
+
+def _preamble(points):
+    return Preamble(format=2, type=1, points=points, count=1,
+                    x_increment=1e-9, x_origin=-points // 2 * 1e-9,
+                    x_reference=0, y_increment=1e-4, y_origin=0.0,
+                    y_reference=0)
+
+
+def _raw_samples(points, channels):
+    phase = numpy.linspace(0, 2 * numpy.pi, points)
+    return [(numpy.sin(phase * (c + 1)) * 24000).astype('>i2')
+            for c in range(channels)]
+
+
+class _MemoryScope(object):
+    """A scope which hands out the same in-memory waveforms."""
+
+    name = 'memory'
+    chunk_points = None
+    idn = ['SIMULATOR', 'MEMORY', 'SIM0001', '1.0']
+
+    def __init__(self, points, channels):
+        self.selected_sources = ['CHANNEL{}'.format(c + 1)
+                                 for c in range(channels)]
+        self._raw = dict(zip(self.selected_sources,
+                             _raw_samples(points, channels)))
+        self._preamble = _preamble(points)
+
+    def take_waveform(self, waveform_format='ASCII', window=None,
+                      transfer_format=None):
+        if waveform_format == 'BINARY':
+            return dict((s, r.tobytes()) for (s, r) in self._raw.items())
+        (time_array, time_fmt) = time_info(self._preamble)
+        waveforms = dict((s, convert_waveform_data(r.tobytes(), 1e-4, 0.0))
+                         for (s, r) in self._raw.items())
+        preambles = dict((s, self._preamble) for s in self._raw)
+        return (time_array, time_fmt, waveforms, preambles)
+
+
+# Each case is set up once with (points, channels, directory) and returns
+# the function to measure. The number of samples processed is
+# points * channels unless the case has a fixed size.
+
+def _case_binary_block(points, channels, directory):
+    blocks = [bytes(block(r.tobytes()))
+              for r in _raw_samples(points, channels)]
+    return lambda: [binary_block(b) for b in blocks]
+
+
+def _case_convert_waveform_data(points, channels, directory):
+    data = [r.tobytes() for r in _raw_samples(points, channels)]
+    return lambda: [numpy.asarray(convert_waveform_data(d, 1e-4, 0.0))
+                    for d in data]
+
+
+def _case_time_info(points, channels, directory):
+    preamble = _preamble(points)
+    return lambda: numpy.asarray(time_info(preamble)[0])
+
+
+def _export_case(fmt):
+    def case(points, channels, directory):
+        scope = _MemoryScope(points, channels)
+        filename = os.path.join(directory,
+                                'waveform' + WAVEFORM_FORMATS[fmt])
+        return lambda: save_waveform_to_file(scope, filename, fmt)
+    return case
+
+
+class _SimulatedScope(object):
+    def __init__(self, model, points, channels):
+        self.instrument = create_instrument(model, points=points)
+        self.server = Vxi11Server(self.instrument, ('127.0.0.1', 0))
+        serve_in_background(self.server)
+        port = self.server.server_address[1]
+        self.scope = Oscilloscope('127.0.0.1', model,
+                                  liveness=LivenessCache(), port=port)
+        self.scope.probe_port = port
+        self.scope.selected_sources = \
+                list(self.instrument.sources[:channels])
+        # generate the samples up front
+        for source in self.scope.selected_sources:
+            self.instrument.samples(source)
+
+
+def _take_waveform_case(model):
+    def case(points, channels, directory):
+        sim = _SimulatedScope(model, points, channels)
+        return sim.scope.take_waveform
+    return case
+
+
+def _take_screenshot_case(model):
+    def case(points, channels, directory):
+        sim = _SimulatedScope(model, 1000, 1)
+        return lambda: sim.scope.take_screenshot(image_format=None)
+    return case
+
+
+# name, setup and whether the case is swept over points and channels
+CASES = [
+    ('binary_block', _case_binary_block, True),
+    ('convert_waveform_data', _case_convert_waveform_data, True),
+    ('time_info', _case_time_info, True),
+] + [
+    ('export_' + fmt, _export_case(fmt), True)
+    for fmt in sorted(WAVEFORM_FORMATS)
+] + [
+    ('take_waveform_dsox91604a', _take_waveform_case('DSOX91604A'), True),
+    ('take_waveform_mso58', _take_waveform_case('MSO58'), True),
+    ('take_screenshot_dsox91604a', _take_screenshot_case('DSOX91604A'),
+     False),
+    ('take_screenshot_mso58', _take_screenshot_case('MSO58'), False),
+]
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _run_case(setup, points, channels, repeat):
+    directory = tempfile.mkdtemp()
+    try:
+        fct = setup(points, channels, directory)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fct()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return {'latency': best, 'peak_rss': _peak_rss()}
+    finally:
+        shutil.rmtree(directory)
+
+
+def _run_in_child(conn, *args):
+    try:
+        conn.send(_run_case(*args))
+    except Exception:
+        conn.send({'error': traceback.format_exc()})
+    conn.close()
+
+
+def run_case(setup, points, channels, repeat):
+    """Run a case in its own process, so the peak RSS is its own."""
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return _run_case(setup, points, channels, repeat)
+
+    ctx = multiprocessing.get_context('fork')
+    (parent, child) = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_in_child,
+                          args=(child, setup, points, channels, repeat))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {'error': 'exit code {}'.format(process.exitcode)}
+    process.join()
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Return the results which are slower or bigger than the baseline by
+    more than threshold (a fraction) and NOISE_FLOOR."""
+    previous = dict(((r['case'], r['points'], r['channels']), r)
+                    for r in baseline['results'] if 'latency' in r)
+    regressions = list()
+    for r in results:
+        old = previous.get((r['case'], r['points'], r['channels']))
+        if old is None or 'latency' not in r:
+            continue
+        for key in ('latency', 'peak_rss'):
+            if r.get(key) and old.get(key) and \
+                    r[key] > old[key] * (1 + threshold) and \
+                    r[key] - old[key] > NOISE_FLOOR[key]:
+                regressions.append(dict(r, metric=key, baseline=old[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points',
+                        help='comma separated record lengths, k and M '
+                        'suffixes are allowed, default ' + DEFAULT_POINTS)
+    parser.add_argument('--channels',
+                        help='comma separated channel counts, default ' +
+                        DEFAULT_CHANNELS)
+    parser.add_argument('--full', action='store_true',
+                        help='sweep {} points and {} channels'.format(
+                            FULL_POINTS, FULL_CHANNELS))
+    parser.add_argument('--cases', default='.',
+                        help='regular expression selecting the cases')
+    parser.add_argument('--max-samples', type=float,
+                        help='skip combinations with more samples')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='results of an earlier run, default '
+                        'benchmarks/baseline.json')
+    parser.add_argument('--no-baseline', action='store_true',
+                        help='do not compare the results')
+    # back to back runs differ by up to 50% on a busy machine
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='tolerated regression, default 0.5 (50%%)')
+    args = parser.parse_args()
+
+    points = _parse_points(args.points or
+                           (FULL_POINTS if args.full else DEFAULT_POINTS))
+    channels = [int(c) for c in (args.channels or (
+            FULL_CHANNELS if args.full else DEFAULT_CHANNELS)).split(',')]
+
+    results = list()
+    print('{:28} {:>10} {:>4} {:>12} {:>12} {:>10}'.format(
+            'case', 'points', 'ch', 'latency [s]', 'MSample/s', 'RSS [MB]'))
+    for (name, setup, sweep) in CASES:
+        if not re.search(args.cases, name):
+            continue
+        combinations = [(p, c) for p in points for c in channels] \
+                if sweep else [(None, None)]
+        for (p, c) in combinations:
+            if sweep and args.max_samples and p * c > args.max_samples:
+                continue
+            result = run_case(setup, p, c, args.repeat)
+            result.update(case=name, points=p, channels=c)
+            if 'error' in result:
+                print('{:28} {:>10} {:>4} failed'.format(name, p or '-',
+                                                         c or '-'))
+                print(result['error'], file=sys.stderr)
+            else:
+                if sweep:
+                    result['throughput'] = p * c / result['latency']
+                print('{:28} {:>10} {:>4} {:>12.6f} {:>12} {:>10}'.format(
+                        name, p or '-', c or '-', result['latency'],
+                        '{:.1f}'.format(result['throughput'] / 1e6)
+                        if sweep else '-',
+                        '{:.0f}'.format(result['peak_rss'] / 1e6)
+                        if result['peak_rss'] else '-'))
+            results.append(result)
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if not args.no_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('platform') != report['platform']:
+            print('note: the baseline was recorded on {}'
+                  .format(baseline.get('platform')))
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print('REGRESSION {} points={} channels={}: {} {:.6g} -> {:.6g}'
+                  .format(r['case'], r['points'], r['channels'],
+                          r['metric'], r['baseline'], r[r['metric']]))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Compare the throughput of the VXI-11 and the raw socket transport.
+
+Both transports fetch the same waveform block from a local simulated
+instrument, e.g.
+
+    python benchmarks/bench_transport.py --points 16000000
+"""
+
+import argparse
+import time
+
+from osccap.oscilloscope.transport import SocketTransport, Vxi11Transport
+from osccap.simulator import (create_instrument, ScpiServer, Vxi11Server,
+                              serve_in_background)
+
+
+def measure(dev, repeat):
+    dev.open()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        dev.write(':WAVEFORM:DATA?')
+        size = len(dev.read_raw())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    dev.close()
+    return size, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=4000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    instrument = create_instrument(points=args.points)
+    # generate the samples once, we don't want to measure numpy.sin()
+    instrument.samples('CHANNEL1')
+
+    vxi11_server = Vxi11Server(instrument, ('127.0.0.1', 0))
+    scpi_server = ScpiServer(instrument, ('127.0.0.1', 0))
+    serve_in_background(vxi11_server)
+    serve_in_background(scpi_server)
+
+    transports = [
+        ('vxi11', Vxi11Transport('127.0.0.1',
+                                 port=vxi11_server.server_address[1])),
+        ('socket', SocketTransport('127.0.0.1',
+                                   port=scpi_server.server_address[1])),
+    ]
+
+    print('{:9} {:>12} {:>10} {:>12}'.format('transport', 'bytes', 'time [s]',
+                                             'MB/s'))
+    for name, dev in transports:
+        size, elapsed = measure(dev, args.repeat)
+        print('{:9} {:>12} {:>10.3f} {:>12.1f}'
+              .format(name, size, elapsed, size / elapsed / 1e6))
+
+    vxi11_server.shutdown()
+    scpi_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
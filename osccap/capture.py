@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+
+from collections import namedtuple
+
+from osccap.errors import CaptureCancelled
+from osccap.export import save_waveform_to_file, WAVEFORM_FORMATS
+
+CaptureResult = namedtuple('CaptureResult', 'scope files error elapsed')
+
+
+def _capture_scope(scope, bundle, screenshot, waveform_fmt, image_format,
+                   started, timed_out, files, check_cancelled):
+    """Capture scope into bundle, the saved files are appended to files.
+
+    Once scope is in timed_out, no further file is started.
+    """
+    started[scope] = time.monotonic()
+
+    if screenshot:
+        filename = os.path.join(bundle, '{}.{}'.format(scope.name,
+                                                       image_format))
+        check_cancelled()
+        img_data = scope.take_screenshot(image_format=image_format)
+        if img_data is None:
+            raise Exception('no screenshot data')
+        check_cancelled()
+        with open(filename, 'wb') as f:
+            f.write(img_data)
+        files.append(filename)
+
+    if waveform_fmt is not None and scope.selected_sources:
+        if scope in timed_out:
+            raise CaptureCancelled()
+        filename = os.path.join(bundle, scope.name +
+                                WAVEFORM_FORMATS[waveform_fmt])
+        save_waveform_to_file(scope, filename, waveform_fmt,
+                              check_cancelled=check_cancelled)
+        files.append(filename)
+
+    return files
+
+
+def _make_bundle(directory):
+    """Create a new timestamped bundle directory below directory.
+
+    Bundles created within the same second get a -1, -2, ... suffix.
+    """
+    name = os.path.join(directory, time.strftime('osccap-%Y%m%d-%H%M%S'))
+    bundle = name
+    suffix = 0
+    while True:
+        try:
+            os.makedirs(bundle)
+            return bundle
+        except FileExistsError:
+            suffix += 1
+            bundle = '{}-{}'.format(name, suffix)
+
+
+def _write_report(bundle, results, late_files=None):
+    report = dict()
+    for r in results:
+        report[r.scope.name] = {
+            'host': r.scope.host,
+            'ok': r.error is None,
+            'error': r.error,
+            'files': [os.path.basename(f) for f in r.files],
+            'elapsed': r.elapsed,
+        }
+        if late_files and r.scope.name in late_files:
+            report[r.scope.name]['late_files'] = \
+                    [os.path.basename(f) for f in late_files[r.scope.name]]
+    with open(os.path.join(bundle, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def capture_all(oscilloscopes, directory, screenshot=True, waveform_fmt=None,
+                max_workers=8, timeout=60, image_format='png',
+                check_cancelled=None):
+    """Capture from all oscilloscopes concurrently.
+
+    The captures are run on a pool of at most max_workers threads and
+    written into a new timestamped bundle directory below directory,
+    together with a report.json. A capture which takes longer than
+    timeout seconds is reported as failed, as is any capture which
+    raises. The screenshots are saved in image_format. Returns the bundle
+    directory and a list of CaptureResults.
+
+    A timed out capture can't be interrupted while it waits for its scope.
+    It doesn't start another file, but a file it was writing is still
+    saved. Such files are added to the report as late_files once the
+    capture has returned.
+
+    check_cancelled is called before each file of each scope. If it
+    raises CaptureCancelled, the remaining files aren't captured and the
+    scopes are reported as cancelled.
+    """
+    bundle = _make_bundle(directory)
+    if check_cancelled is None:
+        check_cancelled = lambda: None
+
+    results = list()
+    if not oscilloscopes:
+        _write_report(bundle, results)
+        return (bundle, results)
+
+    started = dict()
+    timed_out = set()
+    files = dict((scope, list()) for scope in oscilloscopes)
+    executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(max_workers, len(oscilloscopes)),
+            thread_name_prefix='osccap-capture')
+    pending = dict()
+    late = list()
+    for scope in oscilloscopes:
+        future = executor.submit(_capture_scope, scope, bundle, screenshot,
+                                 waveform_fmt, image_format, started,
+                                 timed_out, files[scope],
+                                 check_cancelled)
+        pending[future] = scope
+
+    while pending:
+        now = time.monotonic()
+        deadlines = [started[s] + timeout for s in pending.values()
+                     if s in started]
+        wait_time = max(0, min(deadlines) - now) if deadlines else 0.1
+        done, _ = concurrent.futures.wait(
+                pending, timeout=wait_time,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+
+        now = time.monotonic()
+        for future in done:
+            scope = pending.pop(future)
+            elapsed = now - started.get(scope, now)
+            try:
+                future.result()
+                results.append(CaptureResult(scope, files[scope], None,
+                                             elapsed))
+            except CaptureCancelled:
+                logging.info('capture from {} cancelled'.format(scope.name))
+                results.append(CaptureResult(scope, list(files[scope]),
+                                             'cancelled', elapsed))
+            except Exception as e:
+                logging.error('cannot capture from {} {}'
+                              .format(scope.name, traceback.format_exc()))
+                results.append(CaptureResult(scope, list(files[scope]),
+                                             repr(e), elapsed))
+
+        for future, scope in list(pending.items()):
+            start = started.get(scope)
+            if start is not None and now - start >= timeout:
+                logging.error('capture from {} timed out'.format(scope.name))
+                timed_out.add(scope)
+                del pending[future]
+                results.append(CaptureResult(scope, list(files[scope]),
+                                             'timeout', now - start))
+                late.append((future, scope))
+
+    # don't wait for timed out captures, they are still blocked on I/O
+    executor.shutdown(wait=False)
+
+    _write_report(bundle, results)
+    lock = threading.Lock()
+    late_files = dict()
+
+    def report_late_files(future, scope):
+        # called on the capture thread once a timed out capture returned
+        with lock:
+            reported = [f for r in results if r.scope is scope
+                        for f in r.files]
+            new = [f for f in files[scope] if f not in reported]
+            if not new:
+                return
+            logging.warning('capture from {} saved {} after the timeout'
+                            .format(scope.name, new))
+            late_files[scope.name] = new
+            _write_report(bundle, results, late_files)
+
+    for (future, scope) in late:
+        future.add_done_callback(
+                lambda f, scope=scope: report_late_files(f, scope))
+
+    failed = [r.scope.name for r in results if r.error is not None]
+    logging.info('capture_all: {} of {} scopes captured to {}{}'
+                 .format(len(results) - len(failed), len(results), bundle,
+                         ', failed: {}'.format(failed) if failed else ''))
+
+    return (bundle, results)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Command line interface without a GUI, e.g. for headless test rigs.
+
+    osccap capture --scope osc01 --screenshot out.png \
+            --waveform out.npz --sources CHANNEL1,CHANNEL2
+    osccap daemon --directory /data/captures --interval 60
+
+Nothing in here imports wx.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from osccap.config import get_configuration
+from osccap.metrics import metrics, serve_metrics
+from osccap.oscilloscope import (create_oscilloscopes_from_config,
+                                 Oscilloscope)
+
+# waveform format of each file extension, if --format isn't given
+_EXTENSION_FORMATS = {
+    '.bin': 'binary',
+    '.csv': 'timed-separated',
+    '.npz': 'npz',
+}
+
+
+def _find_scope(config, args):
+    if args.host is not None:
+        return Oscilloscope(args.host, args.scope or args.host,
+                            transport=args.transport, port=args.port)
+
+    for scope in create_oscilloscopes_from_config(config):
+        if scope.name == args.scope:
+            return scope
+    raise SystemExit('osccap: no scope named {}'.format(args.scope))
+
+
+def _waveform_format(parser, args):
+    from osccap.export import WAVEFORM_FORMATS
+
+    if args.format is not None:
+        if args.format not in WAVEFORM_FORMATS:
+            parser.error('unknown waveform format {}, choose from {}'.format(
+                    args.format, ', '.join(sorted(WAVEFORM_FORMATS))))
+        return args.format
+    extension = os.path.splitext(args.waveform)[1].lower()
+    try:
+        return _EXTENSION_FORMATS[extension]
+    except KeyError:
+        parser.error('cannot guess the waveform format of {}, use --format'
+                     .format(args.waveform))
+
+
+def _check_args(parser, args):
+    """Check the file formats before connecting to any scope, an unknown
+    one exits with a usage message."""
+    from osccap.image import IMAGE_FORMATS
+
+    if getattr(args, 'screenshot', None) is not None:
+        image_format = os.path.splitext(args.screenshot)[1][1:].lower()
+        if image_format and image_format not in IMAGE_FORMATS:
+            parser.error('unknown image format {} of {}, choose from {}'
+                         .format(image_format, args.screenshot,
+                                 ', '.join(IMAGE_FORMATS)))
+    if args.format is not None or getattr(args, 'waveform', None) is not None:
+        args.format = _waveform_format(parser, args)
+
+
+def _sources(scope, args):
+    if args.sources:
+        return args.sources.split(',')
+    return scope.get_sources()
+
+
+def capture(config, args):
+    if args.scope is None and args.host is None:
+        raise SystemExit('osccap: either --scope or --host is needed')
+    if args.screenshot is None and args.waveform is None:
+        raise SystemExit('osccap: nothing to capture, use --screenshot '
+                         'and/or --waveform')
+
+    scope = _find_scope(config, args)
+    try:
+        if args.screenshot is not None:
+            image_format = os.path.splitext(args.screenshot)[1][1:].lower()
+            img_data = scope.take_screenshot(
+                    image_format=image_format or config.image_format)
+            if img_data is None:
+                raise SystemExit('osccap: no screenshot data from {}'
+                                 .format(scope.name))
+            with open(args.screenshot, 'wb') as f:
+                f.write(img_data)
+
+        if args.waveform is not None:
+            # numpy is only imported if waveforms are captured
+            from osccap.export import save_waveform_to_file
+            scope.selected_sources = _sources(scope, args)
+            save_waveform_to_file(scope, args.waveform, args.format)
+    finally:
+        scope.close()
+    return 0
+
+
+def daemon(config, args):
+    from osccap.capture import capture_all
+
+    oscilloscopes = create_oscilloscopes_from_config(config)
+    if args.scope:
+        names = args.scope.split(',')
+        oscilloscopes = [s for s in oscilloscopes if s.name in names]
+    if not oscilloscopes:
+        raise SystemExit('osccap: no scopes configured')
+
+    logging.info('capturing {} every {}s to {}'.format(
+            ', '.join(s.name for s in oscilloscopes), args.interval,
+            args.directory))
+    try:
+        while True:
+            start_time = time.monotonic()
+            if args.format is not None:
+                for scope in oscilloscopes:
+                    if not scope.selected_sources:
+                        scope.selected_sources = _sources(scope, args)
+            (bundle, results) = capture_all(oscilloscopes, args.directory,
+                                            waveform_fmt=args.format,
+                                            timeout=args.timeout,
+                                            image_format=config.image_format)
+            for r in results:
+                if r.error is not None:
+                    logging.error('capture of {} failed: {}'
+                                  .format(r.scope.name, r.error))
+            if args.once:
+                break
+            time.sleep(max(0, args.interval -
+                           (time.monotonic() - start_time)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for scope in oscilloscopes:
+            scope.close()
+    return 0
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='osccap',
+                                     description='Capture screenshots and '
+                                     'waveforms from oscilloscopes.')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve the command timing metrics on this port')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write a trace of all commands to FILE')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    p = commands.add_parser('capture', help='capture a single scope')
+    p.set_defaults(func=capture)
+    p.add_argument('--scope', help='name of a configured scope')
+    p.add_argument('--host', help='scope host, instead of a configured one')
+    p.add_argument('--transport', default='vxi11',
+                   help='transport to use with --host')
+    p.add_argument('--port', type=int, help='port to use with --host')
+    p.add_argument('--screenshot', metavar='FILE',
+                   help='save a screenshot, the extension selects the '
+                   'image format')
+    p.add_argument('--waveform', metavar='FILE', help='save the waveforms')
+    p.add_argument('--sources',
+                   help='comma separated sources, default are all sources')
+    p.add_argument('--format',
+                   help='waveform format, default is guessed from FILE')
+
+    p = commands.add_parser('daemon',
+                            help='capture all scopes periodically')
+    p.set_defaults(func=daemon)
+    p.add_argument('--directory', default='.',
+                   help='where the capture bundles are saved')
+    p.add_argument('--scope',
+                   help='comma separated scope names, default are all')
+    p.add_argument('--interval', type=float, default=60,
+                   help='seconds between two captures')
+    p.add_argument('--timeout', type=float, default=60,
+                   help='seconds a scope may take to capture')
+    p.add_argument('--format',
+                   help='also save the waveforms in this format')
+    p.add_argument('--sources',
+                   help='comma separated sources, default are all sources')
+    p.add_argument('--once', action='store_true',
+                   help='capture once and exit')
+    return parser
+
+
+def main(argv=None):
+    parser = _parser()
+    args = parser.parse_args(argv)
+    _check_args(parser, args)
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.DEBUG if args.verbose else
+                        logging.WARNING)
+
+    config = get_configuration()
+    config.load()
+
+    metrics_port = args.metrics_port or config.metrics_port
+    if metrics_port:
+        serve_metrics(('', metrics_port))
+    trace_file = args.trace or config.trace_file
+    if trace_file:
+        metrics.open_trace(trace_file)
+    try:
+        return args.func(config, args)
+    finally:
+        metrics.close_trace()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
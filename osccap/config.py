@@ -12,7 +12,11 @@ else:
     from configparser import ConfigParser
     import configparser
 
-OscProperties = namedtuple('OscProperties', 'name host')
+OscProperties = namedtuple('OscProperties',
+                           'name host transport port chunk_points '
+                           'transfer_format hardcopy screenshot_format',
+                           defaults=('vxi11', None, None, 'WORD', False,
+                                     'png'))
 HotKey = namedtuple('HotKey', 'modifiers keycode')
 
 
@@ -28,6 +32,14 @@ class ConfigSettings(object):
         self.active_scope_name = None
         self.scopes = list()
         self.hotkey = None
+        # seconds a cached liveness state is trusted before probing again
+        self.liveness_max_age = 10
+        # format of the saved screenshots
+        self.image_format = 'png'
+        # serve the command timing metrics on this port, if set
+        self.metrics_port = None
+        # write a trace of all commands to this file, if set
+        self.trace_file = None
 
     def load(self):
         pass
@@ -35,6 +47,27 @@ class ConfigSettings(object):
     def save(self):
         pass
 
+    def _image_format(self, value, name):
+        """Return the image format value of option name, or png if it is
+        unknown."""
+        from osccap.image import IMAGE_FORMATS
+
+        if value.lower() in IMAGE_FORMATS:
+            return value.lower()
+        logging.error('unknown {} {}, choose from {}, using png'.format(
+                name, value, ', '.join(IMAGE_FORMATS)))
+        return 'png'
+
+    def _boolean(self, value, name):
+        """Return the boolean value of option name, parsed like
+        ConfigParser.getboolean, or False if it is unknown."""
+        value = str(value).strip().lower()
+        if value in ('1', 'yes', 'true', 'on'):
+            return True
+        if value not in ('0', 'no', 'false', 'off'):
+            logging.error('unknown {} {}, using false'.format(name, value))
+        return False
+
 
 class ConfigSettingsWindows(ConfigSettings):
     def __init__(self):
@@ -62,7 +95,31 @@ class ConfigSettingsWindows(ConfigSettings):
                 try:
                     entry = winreg.OpenKey(key, name)
                     scope_host = winreg.QueryValueEx(entry, 'host')[0]
-                    self.scopes.append(OscProperties(name, scope_host))
+                    transport = self._try_query_value(entry, 'transport',
+                                                      'vxi11')
+                    port = self._try_query_value(entry, 'port', None)
+                    if port is not None:
+                        port = int(port)
+                    chunk_points = self._try_query_value(entry,
+                                                         'chunk_points', None)
+                    if chunk_points is not None:
+                        chunk_points = int(chunk_points)
+                    transfer_format = self._try_query_value(
+                            entry, 'transfer_format', 'WORD')
+                    # REG_SZ values are strings, REG_DWORD values integers
+                    hardcopy = self._boolean(
+                            self._try_query_value(entry, 'hardcopy', 0),
+                            'hardcopy')
+                    screenshot_format = self._image_format(
+                            self._try_query_value(entry, 'screenshot_format',
+                                                  'png'),
+                            'screenshot_format')
+                    self.scopes.append(OscProperties(name, scope_host,
+                                                     transport, port,
+                                                     chunk_points,
+                                                     transfer_format,
+                                                     hardcopy,
+                                                     screenshot_format))
                 except WindowsError:
                     logging.error('Error loading config oscilloscope %s', name)
                 index += 1
@@ -83,6 +140,18 @@ class ConfigSettingsWindows(ConfigSettings):
         hk_keycode = self._try_query_value(key, 'HotKeyKeycode', None)
         if (hk_modifiers, hk_keycode) != (None, None):
             self.hotkey = HotKey(hk_modifiers, hk_keycode)
+        # REG_SZ values are strings
+        self.liveness_max_age = float(self._try_query_value(
+                key, 'LivenessMaxAge', self.liveness_max_age))
+        self.image_format = self._image_format(
+                self._try_query_value(key, 'ImageFormat', self.image_format),
+                'ImageFormat')
+        self.metrics_port = self._try_query_value(key, 'MetricsPort',
+                                                  self.metrics_port)
+        if self.metrics_port is not None:
+            self.metrics_port = int(self.metrics_port)
+        self.trace_file = self._try_query_value(key, 'TraceFile',
+                                                self.trace_file)
         winreg.CloseKey(key)
 
         # load local user properties
@@ -112,12 +181,22 @@ class ConfigSettingsLinux(ConfigSettings):
 
         [global]
         last_active_name = osc01
+        liveness_max_age = 10
+        image_format = png
+        metrics_port = 9105
+        trace_file = /tmp/osccap-trace.json
 
         [scope_osc01]
         host=osc1
 
         [scope_osc02]
         host=osc2
+        transport=socket
+        port=5025
+        chunk_points=1000000
+        transfer_format=auto
+        hardcopy=yes
+        screenshot_format=bmp
         """
         parser = ConfigParser()
 
@@ -133,12 +212,41 @@ class ConfigSettingsLinux(ConfigSettings):
         except configparser.NoOptionError:
             pass
 
+        try:
+            self.liveness_max_age = parser.getfloat('global',
+                                                    'liveness_max_age')
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            pass
+
+        self.image_format = self._image_format(
+                parser.get('global', 'image_format',
+                           fallback=self.image_format), 'image_format')
+        self.metrics_port = parser.getint('global', 'metrics_port',
+                                          fallback=self.metrics_port)
+        self.trace_file = parser.get('global', 'trace_file',
+                                     fallback=self.trace_file)
+
         for s in parser.sections():
             if s.startswith('scope_'):
                 try:
                     name = s[len('scope_'):]
                     host = parser.get(s, 'host')
-                    self.scopes.append(OscProperties(name, host))
+                    transport = parser.get(s, 'transport', fallback='vxi11')
+                    port = parser.getint(s, 'port', fallback=None)
+                    chunk_points = parser.getint(s, 'chunk_points',
+                                                 fallback=None)
+                    transfer_format = parser.get(s, 'transfer_format',
+                                                 fallback='WORD')
+                    hardcopy = parser.getboolean(s, 'hardcopy',
+                                                 fallback=False)
+                    screenshot_format = self._image_format(
+                            parser.get(s, 'screenshot_format',
+                                       fallback='png'), 'screenshot_format')
+                    self.scopes.append(OscProperties(name, host, transport,
+                                                     port, chunk_points,
+                                                     transfer_format,
+                                                     hardcopy,
+                                                     screenshot_format))
                 except configparser.NoOptionError:
                     pass
         self.scopes.sort(key=lambda e: e.name)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Self-describing binary waveform container.
+
+The container is a plain, uncompressed .npz file. It holds the raw
+samples of each source as transferred from the scope (<source>.npy) and
+a JSON document (meta.npy) with the scaling of each source, the time base
+and the IDN of the scope:
+
+    {
+      "version": 1,
+      "idn": ["KEYSIGHT TECHNOLOGIES", "DSOX91604A", ...],
+      "time": {"points": ..., "x_increment": ..., "x_origin": ...,
+               "x_reference": ...},
+      "sources": {"CHANNEL1": {"y_increment": ..., "y_origin": ...,
+                               "y_reference": ..., "format": ...,
+                               "dtype": ">i2"}, ...}
+    }
+
+The physical value of a sample is
+(raw - y_reference) * y_increment + y_origin. dtype is the transfer format
+of the samples, ">i2" for WORD and "|i1" for BYTE. Because the members are
+stored uncompressed, they can be memory mapped by load_container().
+Any numpy can read the file with numpy.load() as well.
+"""
+
+import json
+import numpy
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+from osccap.waveform import TimeAxis, Waveform
+
+CONTAINER_VERSION = 1
+
+# size and layout of a zip local file header
+_ZIP_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+
+
+def _meta(idn, points, preambles, dtypes):
+    preamble = next(iter(preambles.values()))
+    return {
+        'version': CONTAINER_VERSION,
+        'idn': list(idn) if idn is not None else None,
+        'time': {
+            'points': points,
+            'x_increment': preamble.x_increment,
+            'x_origin': preamble.x_origin,
+            'x_reference': preamble.x_reference,
+        },
+        'sources': dict((s, {
+            'y_increment': p.y_increment,
+            'y_origin': p.y_origin,
+            'y_reference': p.y_reference,
+            'format': p.format,
+            'dtype': numpy.dtype(dtypes[s]).str,
+        }) for (s, p) in preambles.items()),
+    }
+
+
+def save_container(filename, idn, waveforms, preambles):
+    """Save the Waveforms with their preambles to filename.
+
+    Only the raw samples are stored."""
+    sources = list(waveforms)
+    if not sources:
+        raise ValueError('no sources to save')
+    meta = _meta(idn, len(waveforms[sources[0]]),
+                 dict((s, preambles[s]) for s in sources),
+                 dict((s, waveforms[s].raw.dtype) for s in sources))
+
+    arrays = dict((s, waveforms[s].raw) for s in sources)
+    arrays['meta'] = numpy.array(json.dumps(meta))
+    numpy.savez(filename, **arrays)
+
+
+class ContainerWriter(object):
+    """Write a container chunk by chunk.
+
+    The raw samples of each source are appended to temporary files, which
+    are copied into the container on close(), so only the current chunk
+    has to be held in memory.
+    """
+
+    def __init__(self, filename, idn, preambles):
+        if not preambles:
+            raise ValueError('no sources to save')
+        self.filename = filename
+        self.idn = idn
+        self.preambles = preambles
+        self.points = 0
+        self.dtypes = dict((s, numpy.dtype('>i2')) for s in preambles)
+        self.tmpdir = tempfile.mkdtemp(prefix='osccap-')
+        self.files = dict((s, open(os.path.join(self.tmpdir, s), 'w+b'))
+                          for s in preambles)
+
+    def write(self, waveforms):
+        """Append the next chunk of Waveforms."""
+        for (source, waveform) in waveforms.items():
+            self.dtypes[source] = waveform.raw.dtype
+            self.files[source].write(waveform.raw.tobytes())
+        self.points += len(next(iter(waveforms.values())))
+
+    def close(self):
+        try:
+            meta = _meta(self.idn, self.points, self.preambles, self.dtypes)
+            with zipfile.ZipFile(self.filename, 'w', zipfile.ZIP_STORED,
+                                 allowZip64=True) as zf:
+                for (source, f) in self.files.items():
+                    header = {
+                        'descr': numpy.lib.format.dtype_to_descr(
+                                self.dtypes[source]),
+                        'fortran_order': False,
+                        'shape': (self.points,),
+                    }
+                    with zf.open(source + '.npy', 'w',
+                                 force_zip64=True) as member:
+                        numpy.lib.format.write_array_header_1_0(member,
+                                                                header)
+                        f.seek(0)
+                        shutil.copyfileobj(f, member)
+                with zf.open('meta.npy', 'w') as member:
+                    numpy.lib.format.write_array(
+                            member, numpy.array(json.dumps(meta)))
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._cleanup()
+
+
+def _memmap_member(filename, f, info):
+    f.seek(info.header_offset)
+    header = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+    name_len, extra_len = header[-2:]
+    f.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + name_len + extra_len)
+
+    version = numpy.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran, dtype = numpy.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran, dtype = numpy.lib.format.read_array_header_2_0(f)
+
+    return numpy.memmap(filename, dtype=dtype, mode='r', offset=f.tell(),
+                        shape=shape, order='F' if fortran else 'C')
+
+
+class Container(object):
+    """A loaded waveform container.
+
+    raw maps each source to its raw samples, meta is the metadata
+    document.
+    """
+
+    def __init__(self, meta, raw):
+        self.meta = meta
+        self.raw = raw
+
+    @property
+    def sources(self):
+        return list(self.meta['sources'])
+
+    def waveform(self, source):
+        """Return the samples of source as a Waveform.
+
+        The raw samples are not copied, they are scaled on access."""
+        scale = self.meta['sources'][source]
+        increment = scale['y_increment']
+        offset = scale['y_origin'] - scale['y_reference'] * increment
+        return Waveform(self.raw[source], increment, offset)
+
+    def time_array(self):
+        """Return the time of each sample as a TimeAxis."""
+        time = self.meta['time']
+        return TimeAxis(time['x_origin'] - time['x_reference'] *
+                        time['x_increment'], time['x_increment'],
+                        time['points'])
+
+
+def load_container(filename, mmap=True):
+    """Load a waveform container.
+
+    If mmap is true, the raw samples are memory mapped instead of read.
+    """
+    raw = dict()
+    with zipfile.ZipFile(filename) as zf:
+        meta = json.loads(str(numpy.load(zf.open('meta.npy'))))
+        with open(filename, 'rb') as f:
+            for info in zf.infolist():
+                source = info.filename[:-len('.npy')]
+                if source == 'meta':
+                    continue
+                if mmap and info.compress_type == zipfile.ZIP_STORED:
+                    raw[source] = _memmap_member(filename, f, info)
+                else:
+                    raw[source] = numpy.load(zf.open(info))
+    return Container(meta, raw)
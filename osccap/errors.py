@@ -5,3 +5,11 @@ class NotAliveError(Exception):
 
 class NoDataAvailable(Exception):
     pass
+
+
+class CompletionTimeout(Exception):
+    pass
+
+
+class CaptureCancelled(Exception):
+    pass
@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import numpy
+import os
+import re
+
+from osccap.container import ContainerWriter, save_container
+from osccap.errors import CaptureCancelled
+from osccap.metrics import phase
+from osccap.waveform import Waveform
+
+# file extension of each waveform format
+WAVEFORM_FORMATS = {
+    'binary': '.bin',
+    'combined': '.csv',
+    'separated': '.csv',
+    'timed-combined': '.csv',
+    'timed-separated': '.csv',
+    'npz': '.npz',
+}
+
+
+# rows formatted at once by write_csv()
+CSV_CHUNK_ROWS = 65536
+
+_E_FORMAT = re.compile(r'%\.(\d+)e$')
+
+# relative error of the scaled mantissa in _format_e()
+_E_ERROR = 1e-14
+
+# the four decimal digits of 0 to 9999 as one word each, and the powers of
+# ten 1e-400 to 1e400
+_DIGITS = numpy.array(['%04d' % i for i in range(10000)],
+                      dtype='S4').view(numpy.uint32)
+_POWERS_OFFSET = 400
+with numpy.errstate(over='ignore'):
+    _POWERS = numpy.power(10.0,
+                          numpy.arange(-_POWERS_OFFSET, _POWERS_OFFSET + 1))
+
+
+def _format_python(values, fmt):
+    """Format values with fmt, see _format_column()."""
+    n = len(values)
+    if n == 0:
+        return numpy.zeros((0, 1), numpy.uint8)
+    text = ((fmt + '\0') * n) % tuple(numpy.asarray(values).tolist())
+    strings = numpy.array(text.split('\0')[:-1], dtype=bytes)
+    return strings.view(numpy.uint8).reshape(n, -1)
+
+
+def _format_e(values, precision):
+    """Format values like '%.<precision>e', see _format_column().
+
+    The mantissa is rounded in floating point. Values whose rounding is
+    too close to call, and NaN or infinity, are formatted with Python's
+    % instead, so the result is the same as with fmt % value.
+    """
+    n = len(values)
+    a = numpy.abs(values)
+    with numpy.errstate(all='ignore'):
+        nonzero = a > 0
+        exponent = numpy.zeros(n, numpy.int64)
+        exponent[nonzero] = numpy.floor(numpy.log10(a[nonzero]))
+        # NaN and infinity have a garbage exponent, they fall back anyway
+        power = numpy.clip(precision - exponent, -_POWERS_OFFSET,
+                           _POWERS_OFFSET)
+        m = a * _POWERS[power + _POWERS_OFFSET]
+        r = numpy.rint(m)
+        fallback = ~numpy.isfinite(m) | \
+                (numpy.abs(m - numpy.floor(m) - 0.5) <= m * _E_ERROR)
+
+    # the mantissa rounded up to the next power of ten
+    carry = r == 10.0 ** (precision + 1)
+    r[carry] = 10.0 ** precision
+    exponent[carry] += 1
+    fallback |= nonzero & ((r < 10.0 ** precision) |
+                           (r >= 10.0 ** (precision + 1)))
+    r[fallback] = 0
+    mantissa = r.astype(numpy.int64)
+
+    # -d.ddde+xxx, the sign and the third exponent digit are NUL if unused
+    chars = numpy.empty((n, precision + 8), numpy.uint8)
+    chars[:, 0] = numpy.where(numpy.signbit(values), ord('-'), 0)
+    # the digits are looked up four at a time
+    groups = (precision + 4) // 4
+    digits = numpy.empty((n, groups), numpy.uint32)
+    for i in range(groups - 1, -1, -1):
+        (mantissa, group) = numpy.divmod(mantissa, 10000)
+        digits[:, i] = _DIGITS[group]
+    digits = digits.view(numpy.uint8)[:, -(precision + 1):]
+    chars[:, 1] = digits[:, 0]
+    chars[:, 2] = ord('.')
+    chars[:, 3:3+precision] = digits[:, 1:]
+    chars[:, 3+precision] = ord('e')
+    chars[:, 4+precision] = numpy.where(exponent < 0, ord('-'), ord('+'))
+    e = numpy.abs(exponent)
+    wide = e >= 100
+    chars[:, 5+precision] = numpy.where(wide, e // 100, e // 10 % 10) + \
+            ord('0')
+    chars[:, 6+precision] = numpy.where(wide, e // 10 % 10, e % 10) + \
+            ord('0')
+    chars[:, 7+precision] = numpy.where(wide, e % 10 + ord('0'), 0)
+
+    if fallback.any():
+        text = _format_python(values[fallback], '%.{}e'.format(precision))
+        if text.shape[1] > chars.shape[1]:
+            chars = numpy.pad(chars,
+                              ((0, 0), (0, text.shape[1] - chars.shape[1])))
+        chars[fallback] = 0
+        chars[fallback, :text.shape[1]] = text
+    return chars
+
+
+def _format_column(values, fmt):
+    """Format each value with fmt.
+
+    Returns a uint8 matrix, row i is the text of value i padded with NUL
+    bytes, which may be anywhere in the row.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    match = _E_FORMAT.match(fmt)
+    # the mantissa has to fit into an int64 with a few digits to spare,
+    # '%.0e' has no decimal point
+    if match and 1 <= int(match.group(1)) <= 12:
+        return _format_e(values, int(match.group(1)))
+    return _format_python(values, fmt)
+
+
+def _lookup_table(waveform, fmt):
+    """Return the formatted values of all raw codes of waveform, or None if
+    the waveform is too short for the table to pay off."""
+    if not isinstance(waveform, Waveform):
+        return None
+    if waveform.raw.dtype.kind not in 'iu' or waveform.raw.dtype.itemsize > 2:
+        return None
+    (codes, values) = waveform.value_table()
+    if len(waveform) <= len(codes):
+        return None
+    return _format_column(values, fmt)
+
+
+class _BlockCache(object):
+    """The formatted columns of the current block, shared by CsvWriters
+    writing the same column (the time axis) to several files."""
+
+    def __init__(self):
+        self.block = None
+        self.columns = dict()
+
+    def get(self, column, fmt, start, stop):
+        if self.block != (start, stop):
+            self.block = (start, stop)
+            self.columns.clear()
+        key = (id(column), fmt)
+        if key not in self.columns:
+            # the column is kept, so its id is not reused
+            self.columns[key] = (column, _format_column(column[start:stop],
+                                                        fmt))
+        return self.columns[key][1]
+
+
+class CsvWriter(object):
+    """Write columns to an open CSV file, block by block.
+
+    The output is byte-identical to
+    numpy.savetxt(f, numpy.transpose(columns), delimiter=',', fmt=fmts).
+    Each block of chunk_rows rows is formatted by numpy into a byte
+    matrix, see _format_e(), only one block is held in memory besides the
+    columns themselves. write() can be called repeatedly with consecutive
+    chunks of the columns.
+
+    Waveform columns with more samples than possible raw codes are
+    formatted through a lookup table, so each distinct value is only
+    formatted once. Writers given the same cache format a column they
+    have in common only once per block, see write_csv_blocks().
+    """
+
+    def __init__(self, f, fmts, chunk_rows=CSV_CHUNK_ROWS, cache=None):
+        if not fmts:
+            raise ValueError('no columns to write')
+        self.f = f
+        self.fmts = fmts
+        self.chunk_rows = chunk_rows
+        self.cache = cache
+        self.tables = None
+
+    def _format(self, column, table, fmt, start, stop):
+        if table is not None:
+            raw = column.raw[start:stop].astype(numpy.intp)
+            raw -= numpy.iinfo(column.raw.dtype).min
+            return table[raw]
+        if self.cache is not None:
+            return self.cache.get(column, fmt, start, stop)
+        return _format_column(column[start:stop], fmt)
+
+    def _prepare(self, columns):
+        """Check the columns and return their length."""
+        if len(columns) != len(self.fmts):
+            raise ValueError('expected {} columns, got {}'
+                             .format(len(self.fmts), len(columns)))
+        lengths = set(len(c) for c in columns)
+        if len(lengths) != 1:
+            raise ValueError('columns differ in length: {}'.format(lengths))
+
+        if self.tables is None:
+            self.tables = [_lookup_table(c, fmt)
+                           for (c, fmt) in zip(columns, self.fmts)]
+        return lengths.pop()
+
+    def _write_block(self, columns, start, stop):
+        fields = [self._format(c, t, fmt, start, stop) for (c, t, fmt)
+                  in zip(columns, self.tables, self.fmts)]
+
+        # each field is followed by a ',' or the newline, then the NUL
+        # padding is squeezed out
+        rows = numpy.empty((stop - start, sum(f.shape[1] + 1
+                                              for f in fields)),
+                           numpy.uint8)
+        pos = 0
+        for (i, field) in enumerate(fields):
+            rows[:, pos:pos+field.shape[1]] = field
+            pos += field.shape[1]
+            rows[:, pos] = ord('\n' if i == len(fields) - 1 else ',')
+            pos += 1
+        self.f.write(rows[rows != 0].tobytes().decode('ascii'))
+
+    def write(self, columns):
+        points = self._prepare(columns)
+        for start in range(0, points, self.chunk_rows):
+            self._write_block(columns, start,
+                              min(start + self.chunk_rows, points))
+
+
+def write_csv_blocks(writers, check_cancelled=None):
+    """Write (writer, columns) pairs of CsvWriters block by block.
+
+    The files are written alternately, so writers sharing a cache format
+    their common columns only once. check_cancelled is called before
+    each block.
+    """
+    lengths = [writer._prepare(columns) for (writer, columns) in writers]
+    if len(set(lengths)) > 1:
+        raise ValueError('columns differ in length: {}'.format(lengths))
+    if not writers:
+        return
+    chunk_rows = min(writer.chunk_rows for (writer, _) in writers)
+    for start in range(0, lengths[0], chunk_rows):
+        if check_cancelled is not None:
+            check_cancelled()
+        stop = min(start + chunk_rows, lengths[0])
+        for (writer, columns) in writers:
+            writer._write_block(columns, start, stop)
+
+
+def write_csv(filename, columns, fmts, chunk_rows=CSV_CHUNK_ROWS):
+    """Write the columns to a CSV file, see CsvWriter."""
+    with open(filename, 'w') as f:
+        CsvWriter(f, fmts, chunk_rows).write(columns)
+
+
+def _csv_files(filename, fmt, sources, time_fmt):
+    """Return (filename, columns, fmts) for each CSV file written for fmt.
+
+    The columns are source names, None stands for the time axis.
+    """
+    if fmt.endswith('combined'):
+        groups = [(filename, sources)]
+    else:
+        groups = [(filename.replace('.csv', '_{}.csv'.format(source)),
+                   [source]) for source in sources]
+
+    files = list()
+    for (name, columns) in groups:
+        if fmt.startswith('timed-'):
+            columns = [None] + columns
+        fmts = [time_fmt if c is None else '%.7e' for c in columns]
+        files.append((name, columns, fmts))
+    return files
+
+
+def _container_preambles(preambles, t0):
+    """Return the preambles with the time base moved to t0, the time of
+    the first saved sample, e.g. the start of a window."""
+    return dict((s, p._replace(x_origin=float(t0), x_reference=0))
+                for (s, p) in preambles.items())
+
+
+def _save_waveform_chunked(scope, filename, fmt, progress, window,
+                           transfer_format, written, check_cancelled):
+    """Stream the waveforms chunk by chunk to the file(s)."""
+    with contextlib.ExitStack() as stack:
+        writers = list()
+
+        def consume(time_array, time_fmt, waveforms, preambles):
+            check_cancelled()
+            if not writers:
+                if fmt == 'npz':
+                    # the container is only written if all chunks arrived
+                    writers.append(stack.enter_context(ContainerWriter(
+                            filename, scope.idn,
+                            _container_preambles(preambles, time_array[0]))))
+                else:
+                    cache = _BlockCache()
+                    for (name, columns, fmts) in _csv_files(
+                            filename, fmt, list(waveforms), time_fmt):
+                        f = stack.enter_context(open(name, 'w'))
+                        written.append(name)
+                        writers.append((CsvWriter(f, fmts, cache=cache),
+                                        columns))
+
+            if fmt == 'npz':
+                writers[0].write(waveforms)
+            else:
+                write_csv_blocks([(writer, [time_array if c is None
+                                            else waveforms[c]
+                                            for c in columns])
+                                  for (writer, columns) in writers])
+
+        scope.take_waveform_chunked(consume, progress, window,
+                                    transfer_format)
+
+
+def _not_cancelled():
+    pass
+
+
+def save_waveform_to_file(scope, filename, fmt, progress=None, window=None,
+                          transfer_format=None, check_cancelled=None):
+    """Save the waveforms of the selected sources of scope to filename.
+
+    If the scope has chunk_points set, the waveforms are read and written
+    in chunks (except for the binary format), so the memory usage does not
+    depend on the record length. progress is then called with the number
+    of points saved so far and the total number of points. If window is
+    given, only the samples within it are saved. transfer_format overrides
+    the scope's transfer format.
+
+    check_cancelled is called between the transfer, each chunk and each
+    block of CSV rows, it raises CaptureCancelled to stop the save. The files written
+    so far are removed then.
+    """
+    written = list()
+    try:
+        _save_waveform_to_file(scope, filename, fmt, progress, window,
+                               transfer_format, written,
+                               check_cancelled or _not_cancelled)
+    except CaptureCancelled:
+        for name in written:
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+        raise
+
+
+def _save_waveform_to_file(scope, filename, fmt, progress, window,
+                           transfer_format, written, check_cancelled):
+    if fmt == 'binary':
+        waveforms = scope.take_waveform('BINARY', window=window)
+        with phase(scope.name, 'export', fmt) as event:
+            for source in scope.selected_sources:
+                check_cancelled()
+                save_filename = filename.replace('.bin',
+                                                 '_{}.bin'.format(source))
+                written.append(save_filename)
+                with open(save_filename, 'wb') as f:
+                    f.write(waveforms[source])
+                event.nbytes += len(waveforms[source])
+        return
+
+    if scope.chunk_points:
+        # the chunks are read while saving, so this includes the transfer
+        with phase(scope.name, 'export', fmt):
+            _save_waveform_chunked(scope, filename, fmt, progress, window,
+                                   transfer_format, written, check_cancelled)
+        return
+
+    (time_array, time_fmt, waveforms, preambles) = \
+            scope.take_waveform(window=window,
+                                transfer_format=transfer_format)
+    sources = list(waveforms)
+
+    with phase(scope.name, 'export', fmt) as event:
+        if fmt == 'npz':
+            check_cancelled()
+            save_container(filename, scope.idn, waveforms,
+                           _container_preambles(preambles, time_array[0]))
+            if os.path.exists(filename):
+                event.nbytes = os.path.getsize(filename)
+        else:
+            # the files are written together, so the time axis is
+            # formatted only once for all of them
+            with contextlib.ExitStack() as stack:
+                cache = _BlockCache()
+                writers = list()
+                for (name, columns, fmts) in _csv_files(filename, fmt,
+                                                        sources, time_fmt):
+                    check_cancelled()
+                    f = stack.enter_context(open(name, 'w'))
+                    written.append(name)
+                    writers.append((CsvWriter(f, fmts, cache=cache),
+                                    [time_array if c is None
+                                     else waveforms[c] for c in columns]))
+                write_csv_blocks(writers, check_cancelled)
+            for name in written:
+                event.nbytes += os.path.getsize(name)
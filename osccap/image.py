@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Host side conversion of screenshots.
+
+Scopes can send their screenshots in a format which is cheap to produce
+on the instrument (e.g. BMP), the host re-encodes it into the output
+format. The conversion needs Pillow, which is optional.
+"""
+
+import io
+
+from osccap.metrics import phase
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# leading bytes of each image format
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'BM', 'bmp'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF8', 'gif'),
+    (b'II*\x00', 'tif'),
+    (b'MM\x00*', 'tif'),
+)
+
+# Pillow's name of each image format
+_PIL_FORMATS = {
+    'png': 'PNG',
+    'bmp': 'BMP',
+    'jpg': 'JPEG',
+    'gif': 'GIF',
+    'tif': 'TIFF',
+}
+
+IMAGE_FORMATS = tuple(_PIL_FORMATS)
+
+
+def image_format(data):
+    """Return the format of the image data, or None if it is unknown."""
+    for (signature, fmt) in _SIGNATURES:
+        if data.startswith(signature):
+            return fmt
+    return None
+
+
+def convert_image(data, output_format, scope=None):
+    """Return the image data encoded in output_format.
+
+    The data is returned as it is if it already is in output_format. The
+    conversion is recorded as the convert phase of scope, if given.
+    """
+    output_format = output_format.lower()
+    if output_format not in _PIL_FORMATS:
+        raise ValueError('unknown image format {}'.format(output_format))
+
+    input_format = image_format(data)
+    if input_format == output_format:
+        return data
+    if Image is None:
+        raise RuntimeError('Pillow is needed to convert screenshots from {} '
+                           'to {}'.format(input_format, output_format))
+
+    with phase(scope, 'convert', output_format) as event:
+        event.nbytes = len(data)
+        with Image.open(io.BytesIO(data)) as image:
+            if output_format == 'jpg' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            out = io.BytesIO()
+            image.save(out, _PIL_FORMATS[output_format])
+    return out.getvalue()
+
@@ -17,11 +17,9 @@
 
 import io
 import logging
-import numpy
 import os
 import socket
 import sys
-import threading
 import time
 import traceback
 import wx
@@ -29,9 +27,15 @@ import wx.adv
 
 from functools import partial
 
+from osccap.capture import capture_all
 from osccap.config import get_configuration
-from osccap.errors import NotAliveError, NoDataAvailable
+from osccap.errors import (CaptureCancelled, NotAliveError,
+                           NoDataAvailable)
+from osccap.export import save_waveform_to_file, WAVEFORM_FORMATS
+from osccap.metrics import metrics, serve_metrics
 from osccap.oscilloscope import create_oscilloscopes_from_config
+from osccap.oscilloscope.monitor import LivenessMonitor
+from osccap.worker import CaptureQueue
 
 
 if sys.platform.startswith('win'):
@@ -80,76 +84,6 @@ TRAY_ICON_BUSY = os.path.join(DATA_PATH, 'osccap-busy-16.png')
 TRAY_TOOLTIP = 'OscCap v%s' % __version__
 
 
-def save_waveform_to_file(scope, filename, fmt):
-
-    if fmt == 'binary':
-        waveforms = scope.take_waveform('BINARY')
-        for source in scope.selected_sources:
-            save_filename = filename.replace('.bin', '_{}.bin'.format(source))
-            with open(save_filename, 'wb') as f:
-                f.write(waveforms[source])
-
-    else:
-        (time_array, time_fmt, waveforms) = scope.take_waveform()
-        if fmt == 'combined':
-            save_fmt = list()
-
-            array = numpy.array(list(waveforms.values()))
-
-            for source in scope.selected_sources:
-                save_fmt.append('%.7e')
-
-            start_time = time.time()
-            numpy.savetxt(filename, numpy.transpose(array),
-                          delimiter=",", fmt=save_fmt)
-            logging.debug('save_waveform_to_file: {} save_time={}'
-                          .format(scope.selected_sources,
-                                  str(time.time() - start_time)))
-
-        elif fmt == 'separated':
-
-            for source in scope.selected_sources:
-                save_filename = filename.replace('.csv', '_{}.csv'.format(source))
-                start_time = time.time()
-                numpy.savetxt(save_filename, waveforms[source],
-                              delimiter=",", fmt='%.7e')
-                logging.debug('save_waveform_to_file: {} save_time={}'
-                              .format(source, str(time.time() - start_time)))
-
-        elif fmt == 'timed-combined':
-            save_fmt = list()
-
-            array = time_array
-            save_fmt.append(time_fmt)
-
-            for source in scope.selected_sources:
-                array = numpy.vstack((array, waveforms[source]))
-                save_fmt.append('%.7e')
-
-            start_time = time.time()
-            numpy.savetxt(filename, numpy.transpose(array),
-                          delimiter=",", fmt=save_fmt)
-            logging.debug('save_waveform_to_file: {} save_time={}'
-                          .format(source, str(time.time() - start_time)))
-
-        elif fmt == 'timed-separated':
-            save_fmt = list()
-            save_fmt.append(time_fmt)
-            save_fmt.append('%.7e')
-
-            for source in scope.selected_sources:
-
-                save_filename = filename.replace('.csv', '_{}.csv'.format(source))
-                array = time_array
-                array = numpy.vstack((array, waveforms[source]))
-
-                start_time = time.time()
-                numpy.savetxt(save_filename, numpy.transpose(array),
-                              delimiter=",", fmt=save_fmt)
-                logging.debug('save_waveform_to_file: {} save_time={}'
-                              .format(source, str(time.time() - start_time)))
-
-
 # There is only one configuration, create it
 config = get_configuration()
 
@@ -157,6 +91,8 @@ ID_HOTKEY = wx.NewIdRef(count=1)
 ID_TO_CLIPBOARD = wx.NewIdRef(count=1)
 ID_TO_FILE = wx.NewIdRef(count=1)
 ID_WAVEFORM_TO_FILE = wx.NewIdRef(count=1)
+ID_CAPTURE_ALL = wx.NewIdRef(count=1)
+ID_CANCEL_CAPTURE = wx.NewIdRef(count=1)
 
 
 EVT_RESULT_ID = wx.ID_ANY
@@ -177,25 +113,16 @@ class ScopeAliveEvent(wx.PyEvent):
         self.alive = alive
 
 
-class CheckScopeThread(threading.Thread):
-    running = False
+EVT_CAPTURE_ID = wx.NewEventType()
 
-    def __init__(self, wxObject, scope, interval=5):
-        self.wxObject = wxObject
-        self.scope = scope
-        self.interval = interval
-        threading.Thread.__init__(self)
-        self.running = True
-        self.start()
-
-    def run(self):
-        while True and self.running:
-            alive = True if self.scope.is_alive() else False
-            wx.PostEvent(self.wxObject, ScopeAliveEvent(self.scope, alive))
-            time.sleep(self.interval)
-
-    def stop(self):
-        self.running = False
+class CaptureEvent(wx.PyEvent):
+    """Posted by the capture queue when a job has finished or the number
+    of pending jobs has changed."""
+    def __init__(self, job=None, pending=None):
+        wx.PyEvent.__init__(self)
+        self.SetEventType(EVT_CAPTURE_ID)
+        self.job = job
+        self.pending = pending
 
 
 class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
@@ -205,23 +132,28 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
     def __init__(self, oscilloscopes):
         self.busy = False
         self.ready = False
-        self.all_check_threads = []
 
         wx.adv.TaskBarIcon.__init__(self)
         self.Bind(wx.adv.EVT_TASKBAR_LEFT_DOWN, self.on_left_down)
         self.set_tray_icon(busy=False, ready=False)
 
         for scope in oscilloscopes:
-            check = CheckScopeThread(self, scope)
-            self.all_check_threads.append(check)
             if scope.name == config.active_scope_name:
                 self._set_active_scope(scope)
 
         self.oscilloscopes = oscilloscopes
+        self.monitor = LivenessMonitor(oscilloscopes,
+                                       callback=self._post_scope_alive)
+        self.monitor.start()
+
+        self.queue = CaptureQueue(callback=self._post_capture_done,
+                                  state_callback=self._post_capture_state)
+        self.queue.start()
 
         self.frame = wx.Frame(None, -1)
 
         EVT_RESULT(self, self.check_scope_ready)
+        self.Connect(-1, -1, EVT_CAPTURE_ID, self.on_capture_event)
 
         # just for global hotkey binding
         if on_win and config.hotkey is not None:
@@ -279,7 +211,7 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
                 raise Exception('Icon window not found')
         return self._chwnd
 
-    def set_tray_icon(self, busy=None, ready=None):
+    def set_tray_icon(self, busy=None, ready=None, progress=None):
         if busy is not None:
             self.busy = busy
         if ready is not None:
@@ -291,7 +223,10 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
             path = TRAY_ICON_READY if self.ready else TRAY_ICON
             self.icon = wx.Icon(path)
 
-        self.SetIcon(self.icon, TRAY_TOOLTIP)
+        tooltip = TRAY_TOOLTIP
+        if self.busy and progress is not None:
+            tooltip += ' - {}%'.format(progress)
+        self.SetIcon(self.icon, tooltip)
 
     def _update_sources_menu_for_scope(self, scope):
         for source in scope.get_sources():
@@ -325,7 +260,7 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
         menu.Append(item)
         menu_waveform_format = wx.Menu()
         menu.AppendSubMenu(menu_waveform_format, 'Waveform Format')
-        for fmt in ['binary', 'combined', 'separated', 'timed-combined', 'timed-separated']:
+        for fmt in WAVEFORM_FORMATS:
             id = wx.NewIdRef(count=1)
             item = menu_waveform_format.AppendCheckItem(id, fmt)
             self.Bind(wx.EVT_MENU,
@@ -334,6 +269,14 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
             if fmt == self.selected_waveform_fmt:
                 menu_waveform_format.Check(id, True)
 
+        item = wx.MenuItem(menu, ID_CAPTURE_ALL, 'Capture all to folder..')
+        menu.Bind(wx.EVT_MENU, self.on_capture_all, id=item.GetId())
+        menu.Append(item)
+        item = wx.MenuItem(menu, ID_CANCEL_CAPTURE, 'Cancel capture')
+        menu.Bind(wx.EVT_MENU, self.on_cancel_capture, id=item.GetId())
+        menu.Append(item)
+        menu.Enable(ID_CANCEL_CAPTURE, self.busy)
+
         menu.AppendSeparator()
         if len(self.oscilloscopes) == 0:
             item = wx.MenuItem(menu, -1, 'No scopes')
@@ -342,6 +285,7 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
             menu.Enable(ID_TO_CLIPBOARD, False)
             menu.Enable(ID_TO_FILE, False)
             menu.Enable(ID_WAVEFORM_TO_FILE, False)
+            menu.Enable(ID_CAPTURE_ALL, False)
         else:
             for scope in self.oscilloscopes:
                 id = wx.NewIdRef(count=1)
@@ -371,72 +315,118 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
 
         return menu
 
-    def _get_screenshot(self):
-        screenshot = None
-
-        if self.active_scope:
-            try:
-                self.set_tray_icon(busy=True)
-                screenshot = self.active_scope.take_screenshot()
-            except NotAliveError:
-                self.ShowBallon('Error', 'Scope not alive. Cannot capture '
-                                'the screenshot!',
-                                flags=wx.ICON_ERROR)
-            except Exception as exp:
-                exp = sys.exc_info()[0]
-                logging.error('cannot take screenshot from {} {}'
-                              .format(self.active_scope.name,
-                                      traceback.format_exc()))
-                self.ShowBallon('Unknown Error while taking screenshot',
-                                traceback.format_exc(),
-                                flags=wx.ICON_ERROR)
-            finally:
-                self.set_tray_icon(busy=False)
-
-        return screenshot
-
-    def _copy_screenshot_to_clipboard(self):
-        screenshot = self._get_screenshot()
-
-        if screenshot is not None:
-            stream = io.BytesIO(screenshot)
-            bmp = wx.Bitmap(wx.Image(stream))
-            cbbmp = wx.BitmapDataObject(bmp)
-            if wx.TheClipboard.Open():
-                wx.TheClipboard.SetData(cbbmp)
-                wx.TheClipboard.Close()
-
-    def _save_screenshot_to_file(self, filename):
-        screenshot = self._get_screenshot()
+    # The following methods run on the capture queue's worker thread.
+
+    def _get_screenshot(self, scope, image_format='png'):
+        try:
+            return scope.take_screenshot(image_format=image_format)
+        except NotAliveError:
+            wx.CallAfter(self.ShowBallon, 'Error', 'Scope not alive. Cannot '
+                         'capture the screenshot!', flags=wx.ICON_ERROR)
+            raise
+        except Exception:
+            logging.error('cannot take screenshot from {} {}'
+                          .format(scope.name, traceback.format_exc()))
+            wx.CallAfter(self.ShowBallon,
+                         'Unknown Error while taking screenshot',
+                         traceback.format_exc(), flags=wx.ICON_ERROR)
+            raise
+
+    def _take_clipboard_screenshot(self, scope):
+        start_time = time.monotonic()
+        # wx decodes any format the scope sends, don't convert it
+        screenshot = self._get_screenshot(scope, image_format=None)
+        self.queue.check_cancelled()
+        return (screenshot, start_time)
+
+    def _save_screenshot_to_file(self, scope, filename):
+        screenshot = self._get_screenshot(scope, config.image_format)
+        self.queue.check_cancelled()
 
         if screenshot is not None:
             with open(filename, 'wb') as f:
                 f.write(screenshot)
 
-    def _save_waveform_to_file(self, filename, fmt):
+    def _post_progress(self, done, total):
+        self.queue.check_cancelled()
+        wx.CallAfter(self.set_tray_icon, progress=100 * done // total)
+
+    def _save_waveform_to_file(self, scope, filename, fmt):
+        try:
+            save_waveform_to_file(scope, filename, fmt,
+                                  progress=self._post_progress,
+                                  check_cancelled=self.queue.check_cancelled)
+        except CaptureCancelled:
+            raise
+        except NotAliveError:
+            wx.CallAfter(self.ShowBallon, 'Error', 'Scope not alive. Cannot '
+                         'capture the waveform!', flags=wx.ICON_ERROR)
+        except NoDataAvailable:
+            logging.error('no waveform data available from {} {}'
+                          .format(scope.name, traceback.format_exc()))
+            wx.CallAfter(self.ShowBallon, 'Error',
+                         'No waveform data available.', flags=wx.ICON_ERROR)
+        except Exception as exc:
+            logging.error('cannot take waveform from {} {}'
+                          .format(scope.name, traceback.format_exc()))
+            wx.CallAfter(self.ShowBallon,
+                         'Unknown Error while taking waveform',
+                         traceback.format_exc(), flags=wx.ICON_ERROR)
+
+    def _capture_all(self, directory, fmt):
+        # the captures of the scopes are done concurrently
+        try:
+            (bundle, results) = capture_all(
+                    self.oscilloscopes, directory, waveform_fmt=fmt,
+                    image_format=config.image_format,
+                    check_cancelled=self.queue.check_cancelled)
+            self.queue.check_cancelled()
+            failed = [r.scope.name for r in results if r.error is not None]
+            if failed:
+                wx.CallAfter(self.ShowBallon, 'Error',
+                             'Capture failed for {}'.format(', '.join(failed)),
+                             flags=wx.ICON_ERROR)
+        except CaptureCancelled:
+            raise
+        except Exception:
+            logging.error('cannot capture all {}'
+                          .format(traceback.format_exc()))
+
+    def _post_capture_done(self, job):
+        wx.PostEvent(self, CaptureEvent(job=job))
+
+    def _post_capture_state(self, pending):
+        wx.PostEvent(self, CaptureEvent(pending=pending))
+
+    # UI thread
+
+    def _copy_screenshot_to_clipboard(self):
         if self.active_scope:
-            try:
-                self.set_tray_icon(busy=True)
-                save_waveform_to_file(self.active_scope, filename, fmt)
-            except NotAliveError:
-                self.ShowBallon('Error', 'Scope not alive. Cannot capture '
-                                'the waveform!',
-                                flags=wx.ICON_ERROR)
-            except NoDataAvailable:
-                logging.error('no waveform data available from {} {}'
-                              .format(self.active_scope.name,
-                                      traceback.format_exc()))
-                self.ShowBallon('Error', 'No waveform data available.',
-                                flags=wx.ICON_ERROR)
-            except Exception as exc:
-                logging.error('cannot take waveform from {} {}'
-                              .format(self.active_scope.name,
-                                      traceback.format_exc()))
-                self.ShowBallon('Unknown Error while taking waveform',
-                                traceback.format_exc(),
-                                flags=wx.ICON_ERROR)
-            finally:
-                self.set_tray_icon(busy=False)
+            scope = self.active_scope
+            self.queue.submit(('clipboard', scope),
+                              self._take_clipboard_screenshot, scope)
+
+    def _screenshot_to_clipboard_done(self, job):
+        (screenshot, start_time) = job.result
+        if screenshot is None:
+            return
+
+        stream = io.BytesIO(screenshot)
+        bmp = wx.Bitmap(wx.Image(stream))
+        cbbmp = wx.BitmapDataObject(bmp)
+        if wx.TheClipboard.Open():
+            wx.TheClipboard.SetData(cbbmp)
+            wx.TheClipboard.Close()
+        logging.info('screenshot to clipboard latency={:.3f}s'
+                     .format(time.monotonic() - start_time))
+
+    def on_capture_event(self, event):
+        if event.pending is not None:
+            self.set_tray_icon(busy=event.pending > 0)
+        job = event.job
+        if job is not None and job.error is None and \
+                job.key[0] == 'clipboard':
+            self._screenshot_to_clipboard_done(job)
 
     def _set_active_scope(self, scope):
         self.active_scope = scope
@@ -445,24 +435,40 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
         self._copy_screenshot_to_clipboard()
 
     def on_to_file(self, event):
-        d = wx.FileDialog(None, "Save to", wildcard="*.png",
+        d = wx.FileDialog(None, "Save to",
+                          wildcard='*.' + config.image_format,
                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
         if d.ShowModal() == wx.ID_OK:
             filename = os.path.join(d.GetDirectory(), d.GetFilename())
-            self._save_screenshot_to_file(filename)
+            if self.active_scope:
+                self.queue.submit(('file', filename),
+                                  self._save_screenshot_to_file,
+                                  self.active_scope, filename)
         d.Destroy()
 
     def on_waveform_to_file(self, event, fmt):
-        wildcard = '*.bin' if fmt == 'binary' else '*.cvs'
+        wildcard = '*' + WAVEFORM_FORMATS[fmt]
         d = wx.FileDialog(None, "Save to", wildcard=wildcard,
                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
 
-        if d.ShowModal() == wx.ID_OK:
+        if d.ShowModal() == wx.ID_OK and self.active_scope:
             filename = os.path.join(d.GetDirectory(), d.GetFilename())
-            self._save_waveform_to_file(filename, fmt)
+            self.queue.submit(('waveform', filename),
+                              self._save_waveform_to_file,
+                              self.active_scope, filename, fmt)
+
+        d.Destroy()
 
+    def on_capture_all(self, event):
+        d = wx.DirDialog(None, "Capture all to")
+        if d.ShowModal() == wx.ID_OK:
+            self.queue.submit(('all', d.GetPath()), self._capture_all,
+                              d.GetPath(), self.selected_waveform_fmt)
         d.Destroy()
 
+    def on_cancel_capture(self, event):
+        self.queue.cancel()
+
     def on_scope_select(self, event, scope):
         logging.info('select scope {}'.format(scope))
         self._set_active_scope(scope)
@@ -475,7 +481,15 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
         else:
             self.active_scope.add_selected_source(source)
 
+    def _post_scope_alive(self, scope, alive):
+        # called from the monitor thread
+        wx.PostEvent(self, ScopeAliveEvent(scope, alive))
+
     def check_scope_ready(self, msg):
+        # bound to any event type, let the other events pass
+        if not isinstance(msg, ScopeAliveEvent):
+            msg.Skip()
+            return
         if msg.scope == self.active_scope:
             self.set_tray_icon(ready=msg.alive)
 
@@ -486,8 +500,12 @@ class OscCapTaskBarIcon(wx.adv.TaskBarIcon):
         self._copy_screenshot_to_clipboard()
 
     def on_exit(self, event):
-        for thread in self.all_check_threads:
-            thread.stop()
+        self.monitor.stop()
+        self.queue.stop()
+
+        for scope in self.oscilloscopes:
+            scope.close()
+        metrics.close_trace()
 
         if self.active_scope:
             config.active_scope_name = self.active_scope.name
@@ -517,6 +535,10 @@ def main():
                         level=logging.DEBUG)
 
     config.load()
+    if config.metrics_port:
+        serve_metrics(('', config.metrics_port))
+    if config.trace_file:
+        metrics.open_trace(config.trace_file)
     oscilloscopes = create_oscilloscopes_from_config(config)
     app = wx.App()
     OscCapTaskBarIcon(oscilloscopes)
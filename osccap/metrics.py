@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Timing and byte counts of the scope commands.
+
+Each event has a scope, a command, a phase and the seconds and bytes it
+took. The phases are:
+
+    query     a command and its response, from the write to the last byte
+    transfer  the block data of a response, from its first to its last byte
+    command   a command without a response
+    convert   re-encoding a screenshot on the host
+    export    saving the waveforms to a file, the samples are scaled
+              while they are written
+
+The events are collected in a histogram per scope, phase and command,
+which render() formats in the Prometheus text format. serve_metrics()
+serves it over HTTP, open_trace() additionally writes every event to a
+trace file which can be loaded into chrome://tracing or Perfetto.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+# upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def command_header(message):
+    """Return the header of the first program unit of message, e.g.
+    ':WAVEFORM:DATA?' for ':WAVEFORM:DATA? 1,1000;:WAVEFORM:POINTS?'.
+    """
+    words = message.split(';', 1)[0].split(None, 1)
+    return words[0] if words else ''
+
+
+class Histogram(object):
+    """Latency histogram and byte count of one series."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.bytes = 0
+
+    def observe(self, seconds, nbytes=0):
+        for (i, bound) in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.bytes += nbytes
+
+    def cumulative(self):
+        """Return (bound, count) pairs, the count of each bucket includes
+        all smaller ones. The last bound is infinity."""
+        total = 0
+        pairs = list()
+        for (bound, count) in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        pairs.append((float('inf'), self.count))
+        return pairs
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+            .replace('\n', '\\n')
+
+
+def _bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Metrics(object):
+    """Thread safe collection of the timing events."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = dict()
+        self._trace = None
+        self._trace_epoch = None
+
+    def record(self, scope, phase, command, seconds, nbytes=0, start=None):
+        """Record an event of seconds duration.
+
+        start is its time.perf_counter() start, it defaults to seconds
+        before now.
+        """
+        if start is None:
+            start = time.perf_counter() - seconds
+        key = (scope, phase, command)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = Histogram(self.buckets)
+            series.observe(seconds, nbytes)
+            if self._trace is not None:
+                self._write_trace_event(scope, phase, command, seconds,
+                                        nbytes, start)
+
+    def get(self, scope, phase, command):
+        """Return the histogram of a series or None."""
+        with self._lock:
+            return self._series.get((scope, phase, command))
+
+    def series(self):
+        """Return the keys (scope, phase, command) of all series."""
+        with self._lock:
+            return sorted(self._series)
+
+    def reset(self):
+        with self._lock:
+            self._series = dict()
+
+    def render(self):
+        """Return the histograms in the Prometheus text format."""
+        with self._lock:
+            series = sorted(self._series.items())
+            lines = [
+                '# HELP osccap_command_seconds Duration of the scope '
+                'commands.',
+                '# TYPE osccap_command_seconds histogram',
+            ]
+            for ((scope, phase, command), h) in series:
+                labels = 'scope="{}",phase="{}",command="{}"'.format(
+                        _label(scope), _label(phase), _label(command))
+                for (bound, count) in h.cumulative():
+                    lines.append('osccap_command_seconds_bucket{{{},le="{}"}} '
+                                 '{}'.format(labels, _bound(bound), count))
+                lines.append('osccap_command_seconds_sum{{{}}} {!r}'
+                             .format(labels, h.sum))
+                lines.append('osccap_command_seconds_count{{{}}} {}'
+                             .format(labels, h.count))
+            lines += [
+                '# HELP osccap_command_bytes_total Bytes moved by the scope '
+                'commands.',
+                '# TYPE osccap_command_bytes_total counter',
+            ]
+            for ((scope, phase, command), h) in series:
+                lines.append('osccap_command_bytes_total{{scope="{}",'
+                             'phase="{}",command="{}"}} {}'.format(
+                                     _label(scope), _label(phase),
+                                     _label(command), h.bytes))
+        return '\n'.join(lines) + '\n'
+
+    def open_trace(self, filename):
+        """Write all following events to filename.
+
+        The file is in the JSON array form of the Chrome trace event
+        format. It stays loadable if osccap doesn't close it.
+        """
+        f = open(filename, 'w')
+        f.write('[\n')
+        f.flush()
+        with self._lock:
+            self._close_trace()
+            self._trace = f
+            self._trace_epoch = time.perf_counter()
+
+    def _write_trace_event(self, scope, phase, command, seconds, nbytes,
+                           start):
+        event = {
+            'name': command,
+            'cat': phase,
+            'ph': 'X',
+            'ts': round((start - self._trace_epoch) * 1e6, 1),
+            'dur': round(seconds * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {'scope': scope, 'bytes': nbytes},
+        }
+        try:
+            self._trace.write(json.dumps(event) + ',\n')
+            self._trace.flush()
+        except (OSError, ValueError) as e:
+            logging.error('metrics: cannot write the trace ({})'.format(e))
+            self._trace = None
+
+    def _close_trace(self):
+        if self._trace is not None:
+            # a trailing comma is allowed by the trace viewers, the empty
+            # object keeps the file valid JSON
+            self._trace.write('{}]\n')
+            self._trace.close()
+            self._trace = None
+
+    def close_trace(self):
+        with self._lock:
+            self._close_trace()
+
+
+metrics = Metrics()
+
+
+class _Event(object):
+    def __init__(self):
+        self.nbytes = 0
+
+
+@contextmanager
+def phase(scope, name, command, metrics=metrics):
+    """Record the duration of the with block as an event.
+
+    The yielded event's nbytes may be set to the number of bytes handled.
+    Nothing is recorded if scope is None or the block raises.
+    """
+    event = _Event()
+    start = time.perf_counter()
+    yield event
+    if scope is not None:
+        metrics.record(scope, name, command, time.perf_counter() - start,
+                       event.nbytes, start)
+
+
+class InstrumentedTransport(object):
+    """Wrap a transport and record each command on scope.
+
+    A command which is followed by a read is recorded as a query once the
+    response has been read, otherwise as a command. If the response was
+    read with readinto(), i.e. it is a block, its data is recorded as a
+    transfer as well.
+    """
+
+    def __init__(self, dev, scope, metrics=metrics):
+        self._dev = dev
+        self.scope = scope
+        self.metrics = metrics
+        # [command, bytes written, start, end of the write,
+        #  first byte of a block, bytes read]
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._dev, name)
+
+    @property
+    def timeout(self):
+        return self._dev.timeout
+
+    @timeout.setter
+    def timeout(self, val):
+        self._dev.timeout = val
+
+    def open(self):
+        self._dev.open()
+
+    def close(self):
+        self._finish()
+        self._dev.close()
+
+    def _finish(self, response=None):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        (command, written, start, written_at, first, nbytes) = pending
+        if response is None and first is None:
+            self.metrics.record(self.scope, 'command', command,
+                                written_at - start, written, start)
+            return
+        end = time.perf_counter()
+        nbytes += len(response or b'')
+        if first is not None:
+            self.metrics.record(self.scope, 'transfer', command, end - first,
+                                nbytes, first)
+        self.metrics.record(self.scope, 'query', command, end - start,
+                            nbytes, start)
+
+    def write(self, message):
+        self._finish()
+        start = time.perf_counter()
+        self._dev.write(message)
+        self._pending = [command_header(message), len(message), start,
+                         time.perf_counter(), None, 0]
+
+    def read(self):
+        data = self._dev.read()
+        self._finish(data)
+        return data
+
+    def read_raw(self):
+        data = self._dev.read_raw()
+        self._finish(data)
+        return data
+
+    def read_raw_file(self):
+        data = self._dev.read_raw_file()
+        self._finish(data)
+        return data
+
+    def readinto(self, view):
+        pending = self._pending
+        if pending is not None and pending[4] is None:
+            pending[4] = time.perf_counter()
+        n = self._dev.readinto(view)
+        if pending is not None:
+            pending[5] += n
+        return n
+
+
+def instrumented(factory, scope, metrics=metrics):
+    """Return a transport factory which wraps factory's transports."""
+    def create(host):
+        return InstrumentedTransport(factory(host), scope, metrics)
+    return create
+
+
+def serve_metrics(address, metrics=metrics):
+    """Serve the metrics at http://address/metrics in the background.
+
+    Returns the server, call shutdown() on it to stop.
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug('metrics: ' + format % args)
+
+    server = HTTPServer(address, MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='osccap-metrics')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -1,31 +1,97 @@
+import importlib
 import logging
 import socket
-import vxi11
+
+from functools import partial
 
 from osccap.errors import NotAliveError
-from osccap.oscilloscope import (agilent, tektronix)
+from osccap.metrics import instrumented
+from osccap.oscilloscope.liveness import liveness_cache, PORTMAPPER_PORT
+from osccap.oscilloscope.session import Session
+from osccap.oscilloscope.transport import (get_transport, SCPI_PORT,
+                                           SocketTransport, Vxi11Transport)
+
+
+# driver module of each manufacturer, imported when first used
+DRIVERS = {
+    'TEKTRONIX': 'osccap.oscilloscope.tektronix',
+    'KEYSIGHT TECHNOLOGIES': 'osccap.oscilloscope.agilent',
+}
+
+
+def _driver_function(manufacturer, name):
+    """Return the function name of the manufacturer's driver.
+
+    Raises KeyError if there is no such driver or function.
+    """
+    driver = importlib.import_module(DRIVERS[manufacturer])
+    try:
+        return getattr(driver, name)
+    except AttributeError:
+        raise KeyError(name)
 
 
 def create_oscilloscopes_from_config(config):
     oscs = list()
     for scope in config.scopes:
-        osc = Oscilloscope(scope.host, scope.name)
+        osc = Oscilloscope(scope.host, scope.name,
+                           liveness_max_age=config.liveness_max_age,
+                           transport=scope.transport, port=scope.port,
+                           chunk_points=scope.chunk_points,
+                           transfer_format=scope.transfer_format,
+                           hardcopy=scope.hardcopy,
+                           screenshot_format=scope.screenshot_format)
         oscs.append(osc)
 
     return oscs
 
 
+def _query_idn(dev):
+    dev.write('*IDN?')
+    return dev.read()
+
+
 class Oscilloscope(object):
     host = None
     name = None
+    probe_port = PORTMAPPER_PORT
 
     _manufacturer = None
     _model = None
+    idn = None
 
-    def __init__(self, host, name):
+    def __init__(self, host, name, liveness=liveness_cache,
+                 liveness_max_age=10, transport='vxi11', port=None,
+                 chunk_points=None, transfer_format='WORD', hardcopy=False,
+                 screenshot_format='png'):
         self.host = host
         self.name = name
         self.selected_sources = list()
+        # read waveforms in chunks of this many points, if set
+        self.chunk_points = chunk_points
+        # waveform transfer format: WORD, BYTE or AUTO
+        self.transfer_format = transfer_format
+        # stream screenshots instead of saving them on the scope first
+        self.hardcopy = hardcopy
+        # image format the screenshots are transferred in
+        self.screenshot_format = screenshot_format
+
+        factory = get_transport(transport)
+        # probe the port the transport connects to: the given one, the SCPI
+        # socket or the portmapper the VXI-11 core channel is looked up at
+        if port is not None:
+            self.probe_port = port
+            factory = partial(factory, port=port)
+        elif factory is SocketTransport:
+            self.probe_port = SCPI_PORT
+        fallback = None if factory is Vxi11Transport else Vxi11Transport
+        # record the timing of each command under the scope's name
+        factory = instrumented(factory, name)
+        if fallback is not None:
+            fallback = instrumented(fallback, name)
+        self.session = Session(host, factory=factory, fallback=fallback)
+        self.liveness = liveness
+        self.liveness_max_age = liveness_max_age
 
     def __str__(self):
         return '[name: {} host: {}]'.format(self.name, self.host)
@@ -33,41 +99,56 @@ class Oscilloscope(object):
     def _update_manufacturer_model(self):
         """For legacy purpose we update the type."""
         try:
-            (self._manufacturer, self._model) = self.get_idn()[0:2]
+            self.idn = self.get_idn()
+            (self._manufacturer, self._model) = self.idn[0:2]
         except Exception as e:
             pass
 
     def get_manufacturer(self):
-        if self.is_alive() and self._manufacturer == None:
+        if self._manufacturer is None and self.is_alive():
             self._update_manufacturer_model()
         return self._manufacturer
 
     def get_model(self):
-        if self.is_alive() and self._model == None:
+        if self._model is None and self.is_alive():
             self._update_manufacturer_model()
         return self._model
 
-    def is_alive(self, timeout=0.1):
-        """Check if the oscilloscope's network connection is alive."""
+    def probe(self, timeout=0.1):
+        """Probe the oscilloscope's network connection.
+
+        The result is published to the liveness cache.
+        """
         try:
             with socket.socket(socket.AF_INET) as sock:
                 sock.settimeout(timeout)
-                sock.connect((self.host, 111))
-        except socket.timeout:
-            return False
+                sock.connect((self.host, self.probe_port))
+            alive = True
+        except OSError:
+            alive = False
+
+        self.liveness.update(self.host, alive)
+        return alive
 
-        return True
+    def is_alive(self, timeout=0.1, max_age=None):
+        """Check if the oscilloscope's network connection is alive.
+
+        The cached state is used unless it is older than max_age seconds
+        (defaults to liveness_max_age), only then the scope is probed.
+        """
+        if max_age is None:
+            max_age = self.liveness_max_age
+        alive = self.liveness.get(self.host, max_age)
+        if alive is None:
+            alive = self.probe(timeout)
+        return alive
 
     def get_idn(self):
         """This query might return :TEKTRONIX,TDS5104,CF:91.1CT
         FV:01.00.912, indicating the instrument model number,
         configured number, and firmware version number.
         """
-        dev = vxi11.Instrument("TCPIP::" + self.host + "::INSTR")
-        dev.open()
-        dev.write('*IDN?')
-        idn = dev.read()
-        dev.close()
+        idn = self.session.run(_query_idn)
         logging.info('IDN: {}'.format(idn))
         return idn.split(',')
 
@@ -87,45 +168,111 @@ class Oscilloscope(object):
             return DEFAULT_CHANNELS
 
         try:
-            fct = {
-                'TEKTRONIX': tektronix.get_sources,
-                'KEYSIGHT TECHNOLOGIES': agilent.get_sources
-            }[self.get_manufacturer()]
+            fct = _driver_function(self.get_manufacturer(), 'get_sources')
             return fct(self._model)
         except KeyError:
             logging.warning('unsupported scope {}'.format(self._manufacturer))
             return DEFAULT_CHANNELS
 
     def take_screenshot(self, fullscreen=True, image_format='png'):
+        """Take a screenshot and return it in image_format.
+
+        The scope sends the screenshot in its screenshot_format, which is
+        converted on the calling thread if it is not image_format. If
+        image_format is None, the screenshot is returned as sent. If the
+        scope can't send screenshot_format, png is used instead.
+        """
 
         if not self.is_alive():
             raise NotAliveError()
 
         try:
-            fct = {
-                'TEKTRONIX': tektronix.take_screenshot,
-                'KEYSIGHT TECHNOLOGIES': agilent.take_screenshot
-            }[self.get_manufacturer()]
-            return fct(self.host, self._model)
+            fct = _driver_function(self.get_manufacturer(),
+                                   'take_screenshot')
         except KeyError:
             logging.warning('unsupported scope {}'.format(self._manufacturer))
             raise NotImplementedError()
 
-    def take_waveform(self, waveform_format='ASCII'):
+        formats = _driver_function(self._manufacturer, 'IMAGE_FORMATS')
+        if self.screenshot_format not in formats:
+            logging.warning('{} cannot send {} screenshots, using png'
+                            .format(self.name, self.screenshot_format))
+            self.screenshot_format = 'png'
+
+        try:
+            img_data = self.session.run(fct, self._model,
+                                        fullscreen=fullscreen,
+                                        image_format=self.screenshot_format,
+                                        defer=self.session.defer,
+                                        hardcopy=self.hardcopy)
+        finally:
+            logging.debug('{}: {}'.format(self.name, self.session))
+
+        if img_data is None or image_format is None:
+            return img_data
+
+        from osccap.image import convert_image
+        return convert_image(img_data, image_format, self.name)
+
+    def take_waveform(self, waveform_format='ASCII', window=None,
+                      transfer_format=None):
+        """Read the waveforms of the selected sources.
+
+        If window is a SampleWindow or TimeWindow, only the samples within
+        the window are transferred and the time axis starts at the first
+        of them. transfer_format overrides the scope's transfer format.
+        """
 
         if not self.is_alive():
             raise NotAliveError()
 
         self._update_manufacturer_model()
         try:
-            fct = {
-                'TEKTRONIX': tektronix.take_waveform,
-                'KEYSIGHT TECHNOLOGIES': agilent.take_waveform
-            }[self.get_manufacturer()]
-            return fct(self.host,
-                       self._model,
-                       self.selected_sources,
-                       waveform_format=waveform_format)
+            fct = _driver_function(self.get_manufacturer(), 'take_waveform')
         except KeyError:
             logging.warning('unsupported scope {}'.format(self._manufacturer))
             raise NotImplementedError()
+
+        try:
+            return self.session.run(fct, self._model, self.selected_sources,
+                                    waveform_format=waveform_format,
+                                    window=window,
+                                    transfer_format=(transfer_format or
+                                                     self.transfer_format))
+        finally:
+            logging.debug('{}: {}'.format(self.name, self.session))
+
+    def take_waveform_chunked(self, consume, progress=None, window=None,
+                              transfer_format=None):
+        """Read the waveforms in chunks of chunk_points samples.
+
+        consume is called with each chunk as (time_array, time_fmt,
+        waveforms, preambles), progress with the number of points read so
+        far and the total number of points. See take_waveform() for window
+        and transfer_format.
+        """
+
+        if not self.is_alive():
+            raise NotAliveError()
+
+        self._update_manufacturer_model()
+        try:
+            fct = _driver_function(self.get_manufacturer(),
+                                   'take_waveform_chunked')
+        except KeyError:
+            logging.warning('chunked waveforms are not supported by {}'
+                            .format(self._manufacturer))
+            raise NotImplementedError()
+
+        try:
+            return self.session.run(fct, self._model, self.selected_sources,
+                                    consume, self.chunk_points,
+                                    progress=progress, window=window,
+                                    transfer_format=(transfer_format or
+                                                     self.transfer_format))
+        finally:
+            logging.debug('{}: {}'.format(self.name, self.session))
+
+    def close(self):
+        """Close the link to the oscilloscope."""
+        self.session.close()
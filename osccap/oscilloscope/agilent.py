@@ -16,22 +16,35 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
-import math
-import numpy as np
-import time
-import vxi11
 
-from osccap.errors import NoDataAvailable
+from collections import namedtuple
 
+from osccap.oscilloscope.scpi import read_block
 
-#class Timeit(object):
-#    def __init__(self):
-#        self.time = time.time()
-#        print('{}: {}'.format('start', str(time.time() - self.time)))
-#
-#    def print(self, msg):
-#        print('{}: {}'.format(msg, str(time.time() - self.time)))
-#        self.time = time.time()
+
+# :DISPLAY:DATA? type of each screenshot format
+IMAGE_FORMATS = {
+    'png': 'PNG',
+    'bmp': 'BMP',
+    'jpg': 'JPG',
+    'gif': 'GIF',
+    'tif': 'TIF',
+}
+
+# acquisition modes with more than 8 bits of resolution
+HIGH_RESOLUTION_MODES = ('HRES', 'SEGH')
+
+# numpy dtype of the samples of each preamble format
+SAMPLE_DTYPES = {
+    1: 'i1',    # BYTE
+    2: '>i2',   # WORD, MSB first
+}
+
+# The leading fields of the :WAVEFORM:PREAMBLE? response. A sample value
+# is (raw - y_reference) * y_increment + y_origin, the time of sample i is
+# (i - x_reference) * x_increment + x_origin.
+Preamble = namedtuple('Preamble', 'format type points count x_increment '
+                      'x_origin x_reference y_increment y_origin y_reference')
 
 
 def binary_block(data):
@@ -48,10 +61,16 @@ def binary_block(data):
        |   |   ` Number L of bytes of waveform data to follow
        |   ` Number N of bytes in Length block
        ` Start of response
+
+    If the response is read from the instrument, use scpi.read_block(),
+    which doesn't need the whole response in memory.
     """
     len_digits = int(chr(data[1]))
-    bytes_to_read = data[2:2+len_digits]
-    result = data[2+len_digits:-1]
+    bytes_to_read = int(data[2:2+len_digits])
+    result = data[2+len_digits:2+len_digits+bytes_to_read]
+    if len(result) != bytes_to_read:
+        raise ValueError('short block, expected {} bytes, got {}'
+                         .format(bytes_to_read, len(result)))
     return result
 
 
@@ -70,23 +89,24 @@ def get_sources(model):
     return SOURCES
 
 
-def take_screenshot(host, model=None, fullscreen=True, image_format='png'):
+def take_screenshot(dev, model=None, fullscreen=True, image_format='png',
+                    defer=None, hardcopy=False):
+    # the image is always streamed with :DISPLAY:DATA?, there is nothing
+    # to clean up, so defer and hardcopy are not used
 
     logging.debug('agilent: take_screenshot')
 
-    if image_format.lower() != 'png':
-        logging.warning('currently only png format supported')
-        raise Exception()
+    try:
+        image_type = IMAGE_FORMATS[image_format.lower()]
+    except KeyError:
+        raise ValueError('unsupported image format {}'.format(image_format))
 
     if model != 'DSOX91604A':
         raise NotImplementedError()
 
     try:
-        dev = vxi11.Instrument("TCPIP::" + host + "::INSTR")
-        dev.open()
-        dev.write(':DISPLAY:DATA? PNG')
-        img_data = binary_block(dev.read_raw())
-        dev.close()
+        dev.write(':DISPLAY:DATA? ' + image_type)
+        img_data = read_block(dev)
     except Exception as exp:
         logging.error('agilent error taking screenshot')
         print(exp)
@@ -110,6 +130,21 @@ def get_waveform_preamble(dev):
     dev.write(':WAVEFORM:PREAMBLE?')
     preamble = dev.read_raw()[:-1].decode('utf-8')
     preamble = preamble.replace('"', '').split(',')
+    return parse_waveform_preamble(preamble)
+
+
+def parse_waveform_preamble(fields):
+    """Parse the leading fields of the preamble into a Preamble."""
+    return Preamble(format=int(fields[0]),
+                    type=int(fields[1]),
+                    points=int(fields[2]),
+                    count=int(fields[3]),
+                    x_increment=float(fields[4]),
+                    x_origin=float(fields[5]),
+                    x_reference=int(float(fields[6])),
+                    y_increment=float(fields[7]),
+                    y_origin=float(fields[8]),
+                    y_reference=int(float(fields[9])))
 
 
 def get_source_display(dev, source):
@@ -124,128 +159,226 @@ def get_source_display(dev, source):
     return bool(int(display))
 
 
-def convert_waveform_data(bin_data, increment, offset):
-    """Convert the values in the (numpy) array.
+def convert_waveform_data(bin_data, increment, offset, dtype='>i2'):
+    """Wrap the raw samples in a Waveform.
 
-    Multiply the values with 'increment' and add the 'offset'."""
+    The samples are of the given dtype, '>i2' for WORD and 'i1' for BYTE.
+    The values are multiplied with 'increment' and the 'offset' is added
+    when they are accessed."""
 
-    bin_data = np.frombuffer(bin_data, dtype='>i2')
-    return np.multiply(bin_data, increment) + offset
+    import numpy as np
+    from osccap.waveform import Waveform
 
+    return Waveform(np.frombuffer(bin_data, dtype=dtype), increment, offset)
 
-def take_waveform(host, model, active_sources, waveform_format='ASCII'):
 
-    dev = vxi11.Instrument("TCPIP::" + host + "::INSTR")
-    dev.open()
-    if waveform_format == 'ASCII':
-        # waveforms is tuple of 
-        # (time_array, time_fmt, waveforms[sources]) here:
-        waveforms = _take_waveform(dev, active_sources)
+def select_transfer_format(dev, transfer_format):
+    """Return the waveform transfer format, BYTE or WORD.
 
-    elif waveform_format == 'BINARY':
-        dev.write(':WAVEFORM:FORMAT BINARY')
+    AUTO selects BYTE unless the acquisition has more than 8 bits of
+    resolution, i.e. averaging or a high resolution mode is enabled.
+    """
+    transfer_format = transfer_format.upper()
+    if transfer_format == 'AUTO':
+        dev.write(':ACQUIRE:MODE?')
+        mode = dev.read().strip().upper()
+        dev.write(':ACQUIRE:AVERAGE?')
+        average = bool(int(dev.read()))
+        transfer_format = ('WORD' if average or mode in HIGH_RESOLUTION_MODES
+                           else 'BYTE')
+        logging.debug('agilent: acquire mode={} average={} -> {}'
+                      .format(mode, average, transfer_format))
+    elif transfer_format not in ('BYTE', 'WORD'):
+        raise ValueError('unknown transfer format {}'.format(transfer_format))
+    return transfer_format
+
+
+def _window_span(dev, window):
+    """Return (first, count) of the samples of the current source within
+    window, or None for the whole record."""
+    from osccap.waveform import time_info
+
+    if window is None:
+        return None
+    (time_array, time_fmt) = time_info(get_waveform_preamble(dev))
+    return time_array.window_points(window)
 
-        waveforms = {}
-        for source in active_sources:
-            dev.write(':WAVEFORM:SOURCE ' + source)
-            dev.write(':WAVEFORM:DATA?')
-            waveforms[source] = binary_block(dev.read_raw())
 
-    dev.close()
-    return waveforms
+def _data_query(span):
+    if span is None:
+        return ':WAVEFORM:DATA?'
+    # the start point is one based
+    return ':WAVEFORM:DATA? {},{}'.format(span[0] + 1, span[1])
 
 
-def _take_time_info(dev):
-    logging.debug('agilent: take_waveform TIME')
+def take_waveform(dev, model, active_sources, waveform_format='ASCII',
+                  window=None, transfer_format='WORD'):
+    """Read the waveforms of the active sources.
 
-    dev.write(':WAVEFORM:POINTS?')
-    points = int(dev.read())
+    If window is a SampleWindow or TimeWindow, only the samples within
+    the window are transferred. transfer_format is BYTE, WORD or AUTO,
+    see select_transfer_format().
+    """
 
-    dev.write(':WAVEFORM:XINCREMENT?')
-    delta_t = float(dev.read())
+    if waveform_format == 'ASCII':
+        # waveforms is tuple of
+        # (time_array, time_fmt, waveforms[sources], preambles[sources])
+        waveforms = _take_waveform(dev, active_sources, window,
+                                   transfer_format)
 
-    dev.write(':WAVEFORM:XORIGIN?')
-    t_start = float(dev.read())
+    elif waveform_format == 'BINARY':
+        dev.write(':WAVEFORM:FORMAT BINARY')
 
-    logging.debug('points={} delta_t={} t_start={}'.format(points, delta_t, t_start))
+        waveforms = {}
+        span = None
+        for source in active_sources:
+            dev.write(':WAVEFORM:SOURCE ' + source)
+            if span is None:
+                span = _window_span(dev, window)
+            dev.write(_data_query(span))
+            waveforms[source] = read_block(dev)
 
-    if delta_t == 0.0:
-        raise NoDataAvailable()
+    else:
+        raise ValueError('unsupported waveform format {}'
+                         .format(waveform_format))
 
-    # round t_start accuracy to floor of delta_t
-    # -> timebase is closer to zero
-    t_start = math.floor(t_start / delta_t) * delta_t
+    return waveforms
 
-    t_end = t_start + points * delta_t
 
-    # determine the precision of the mantisse for the format output
-    mantisse_corner = math.floor( \
-            math.log(max(abs(t_start),abs(t_end)),10))
-    mantisse_delta_t = len(("%e" % delta_t).split('e')[0].rstrip('0')) - \
-            2 - math.floor(math.log(delta_t,10))
-    mantisse_time = str(mantisse_corner + mantisse_delta_t)
+def _scaling(preamble):
+    increment = preamble.y_increment
+    return (increment, preamble.y_origin - preamble.y_reference * increment)
 
-    time_fmt = '%.{}e'.format(mantisse_time)
 
-    logging.debug('agilent: TIME t_start={} t_end={} delta_t={} time_format={}'
-                  .format(t_start, t_end, delta_t, time_fmt))
+def _sample_dtype(preamble):
+    try:
+        return SAMPLE_DTYPES[preamble.format]
+    except KeyError:
+        raise ValueError('unsupported waveform format {}'
+                         .format(preamble.format))
 
-    time_array = np.arange(t_start, t_end, delta_t)
 
-    return (time_array, time_fmt)
+def _setup_waveform_transfer(dev, transfer_format):
+    # Disable output header response
+    dev.write(':SYSTEM:HEADER 0')
 
+    # Set waveform read format. ASCII, BYTE, WORD, BINARY
+    transfer_format = select_transfer_format(dev, transfer_format)
+    dev.write(':WAVEFORM:FORMAT ' + transfer_format)
+    dev.write(':WAVEFORM:BYTEORDER MSBFIRST')
 
-def _take_waveform_from_source(dev, source):
 
-    dev.write(':ACQUIRE:POINTS?')
-    points = int(dev.read())
+def _take_waveform_from_source(dev, source, span=None, preamble=None):
 
     dev.write(':WAVEFORM:SOURCE ' + source)
-    start_time = time.time()
 
-    dev.write(':WAVEFORM:BYTEORDER MSBFIRST')
+    if preamble is None:
+        preamble = get_waveform_preamble(dev)
+    (increment, offset) = _scaling(preamble)
 
-    dev.write(':WAVEFORM:YINCREMENT?')
-    increment = float(dev.read())
+    logging.debug('agilent: {} points={} increment={} offset={}'
+                  .format(source, preamble.points, increment, offset))
 
-    dev.write(':WAVEFORM:YORIGIN?')
-    offset = float(dev.read())
+    dev.write(_data_query(span))
+    waveform = convert_waveform_data(read_block(dev), increment, offset,
+                                     _sample_dtype(preamble))
 
-    logging.debug('agilent: {} points={} increment={} offset={}'
-                  .format(source, points, increment, offset))
+    return (waveform, preamble)
 
-    dev.write(':WAVEFORM:DATA?')
-    binary = binary_block(dev.read_raw())
-    waveform = convert_waveform_data(binary, increment, offset)
 
-    logging.debug('agilent: {} read_time={}'
-                  .format(source, str(time.time() - start_time)))
+def _take_waveform(dev, active_sources, window=None, transfer_format='WORD'):
+    from osccap.waveform import time_info
 
-    return waveform
+    logging.debug('agilent: take_waveform sources {} window {}'
+                  .format(active_sources, window))
 
+    _setup_waveform_transfer(dev, transfer_format)
 
-def _take_waveform(dev, active_sources):
+    sources = [x for x in active_sources if x != 'TIME']
+    span = None
+    preambles = {}
+    if sources and window is not None:
+        # the preamble of the first source is reused for its transfer
+        dev.write(':WAVEFORM:SOURCE ' + sources[0])
+        preambles[sources[0]] = get_waveform_preamble(dev)
+        (time_array, time_fmt) = time_info(preambles[sources[0]])
+        span = time_array.window_points(window)
 
-    logging.debug('agilent: take_waveform sources {}'.format(active_sources))
+    waveforms = {}
+    for source in sources:
+        (waveforms[source], preambles[source]) = \
+                _take_waveform_from_source(dev, source, span,
+                                           preambles.get(source))
+
+    if preambles:
+        # all sources share the same timebase, the time axis has exactly
+        # as many points as there are samples
+        source = next(iter(preambles))
+        (time_array, time_fmt) = time_info(preambles[source])
+        time_array = time_array.window(0 if span is None else span[0],
+                                       len(waveforms[source]))
+    else:
+        (time_array, time_fmt) = time_info(get_waveform_preamble(dev))
+
+    return (time_array, time_fmt, waveforms, preambles)
+
+
+def take_waveform_chunked(dev, model, active_sources, consume, chunk_points,
+                          progress=None, window=None, transfer_format='WORD'):
+    """Read the waveforms chunk_points samples at a time.
+
+    Each chunk is passed to consume as (time_array, time_fmt, waveforms,
+    preambles), like the result of take_waveform() for the whole record,
+    and dropped afterwards. progress is called with the number of points
+    read so far and the total number of points after each chunk. If
+    window is given, only the samples within the window are read.
+    transfer_format is BYTE, WORD or AUTO, see select_transfer_format().
+    """
+    from osccap.waveform import time_info
 
-    # Disable output header response
-    dev.write(':SYSTEM:HEADER 0')
+    logging.debug('agilent: take_waveform_chunked sources {} chunk_points={}'
+                  .format(active_sources, chunk_points))
 
-    # Set waveform read format. ASCII, BYTE, WORD, BINARY
-    dev.write(':WAVEFORM:FORMAT WORD')
+    _setup_waveform_transfer(dev, transfer_format)
 
-    waveforms = {}
+    preambles = {}
     for source in [x for x in active_sources if x != 'TIME']:
-        waveforms[source] = _take_waveform_from_source(dev, source)
-
-    (time_array, time_fmt) = _take_time_info(dev)
+        dev.write(':WAVEFORM:SOURCE ' + source)
+        preambles[source] = get_waveform_preamble(dev)
+    if not preambles:
+        return
+
+    # all sources share the same timebase
+    (time_array, time_fmt) = time_info(next(iter(preambles.values())))
+    if window is None:
+        (first, points) = (0, len(time_array))
+    else:
+        (first, points) = time_array.window_points(window)
+
+    for start in range(first, first + points, chunk_points):
+        size = min(chunk_points, first + points - start)
+        waveforms = {}
+        for (source, preamble) in preambles.items():
+            dev.write(':WAVEFORM:SOURCE ' + source)
+            dev.write(_data_query((start, size)))
+            waveforms[source] = convert_waveform_data(
+                    read_block(dev), *_scaling(preamble),
+                    dtype=_sample_dtype(preamble))
+            if len(waveforms[source]) != size:
+                raise ValueError('{}: expected {} points, got {}'.format(
+                        source, size, len(waveforms[source])))
 
-    return (time_array, time_fmt, waveforms)
+        consume(time_array[start:start+size], time_fmt, waveforms, preambles)
+        if progress is not None:
+            progress(start + size - first, points)
 
 
 if __name__ == '__main__':
     logging.basicConfig(format='%(levelname)s: %(message)s',
                         level=logging.DEBUG)
-    (time_array, waveform) = take_waveform('osc05',
-                                           ['TIME', 'CHANNEL1', 'CHANNEL2'])
+    import numpy as np
+    from osccap.oscilloscope import Oscilloscope
+    scope = Oscilloscope('osc05', 'osc05')
+    scope.selected_sources = ['CHANNEL1', 'CHANNEL2']
+    (time_array, time_fmt, waveform, preambles) = scope.take_waveform()
     np.savetxt("foo.csv", waveform['CHANNEL1'], delimiter=",", fmt='%.7e')
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from collections import namedtuple
+
+# The scopes are probed by connecting to their portmapper
+PORTMAPPER_PORT = 111
+
+LivenessEntry = namedtuple('LivenessEntry', 'alive timestamp valid_until')
+
+
+class LivenessCache(object):
+    """Timestamped liveness state of the oscilloscopes, keyed by host.
+
+    The cache is filled by the background monitor and read by the hot
+    paths, so that these don't have to probe the network themselves. The
+    monitor passes the time of its next probe of a host as valid_until,
+    until then its result is used regardless of its age.
+    """
+
+    def __init__(self):
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+    def update(self, host, alive, timestamp=None, valid_until=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            self._entries[host] = LivenessEntry(alive, timestamp, valid_until)
+
+    def get(self, host, max_age):
+        """Return the cached state of host.
+
+        Returns None if there is no entry or if the entry is older than
+        max_age seconds and past its valid_until.
+        """
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry.timestamp > max_age and \
+                (entry.valid_until is None or now > entry.valid_until):
+            return None
+        return entry.alive
+
+    def invalidate(self, host):
+        with self._lock:
+            self._entries.pop(host, None)
+
+
+# The cache shared by all oscilloscopes and the monitor
+liveness_cache = LivenessCache()
@@ -0,0 +1,196 @@
+import concurrent.futures
+import errno
+import logging
+import random
+import selectors
+import socket
+import threading
+import time
+
+from osccap.oscilloscope.liveness import liveness_cache
+
+_CONNECT_IN_PROGRESS = (0, errno.EINPROGRESS, errno.EWOULDBLOCK,
+                        getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK))
+
+
+class _HostState(object):
+    def __init__(self, scope, due):
+        self.scope = scope
+        self.due = due
+        self.failures = 0
+        self.address = None
+        # pending host name lookup
+        self.resolving = None
+        self.sock = None
+        self.deadline = None
+
+
+class LivenessMonitor(threading.Thread):
+    """Monitor the liveness of all oscilloscopes from a single thread.
+
+    All scopes are probed with non-blocking connects which are multiplexed
+    with a selector. Alive scopes are probed every `interval` seconds,
+    scopes which stay down are probed with an exponential backoff up to
+    `max_interval` seconds. All intervals are jittered so the probes of a
+    large fleet don't happen in lockstep.
+
+    Each result is published to the liveness cache, valid until the next
+    probe of the scope, and passed to callback(scope, alive). Host names are resolved on a small thread
+    pool, so a slow lookup doesn't hold up the other probes.
+    """
+
+    def __init__(self, oscilloscopes, callback=None, interval=5,
+                 max_interval=60, timeout=1, jitter=0.2,
+                 liveness=liveness_cache):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.callback = callback
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.jitter = jitter
+        self.liveness = liveness
+        # set here, so a stop() before the thread runs isn't lost
+        self.running = True
+
+        now = time.monotonic()
+        # don't probe all scopes at the very same moment on startup
+        self._states = [_HostState(scope,
+                                   now + random.uniform(0, jitter * interval))
+                        for scope in oscilloscopes]
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._resolver = concurrent.futures.ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix='osccap-resolve')
+
+    def _jittered(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _next_interval(self, state):
+        if state.failures == 0:
+            return self._jittered(self.interval)
+        backoff = self.interval * 2 ** (state.failures - 1)
+        return self._jittered(min(backoff, self.max_interval))
+
+    def _wakeup(self, *args):
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+
+    def _resolve(self, state):
+        scope = state.scope
+        state.resolving = self._resolver.submit(
+                socket.getaddrinfo, scope.host, scope.probe_port,
+                socket.AF_INET, socket.SOCK_STREAM)
+        state.resolving.add_done_callback(self._wakeup)
+
+    def _is_due(self, state, now):
+        if state.sock is not None:
+            return False
+        if state.resolving is not None:
+            return state.resolving.done()
+        return state.due <= now
+
+    def _start_probe(self, state, now):
+        if state.address is None:
+            if state.resolving is None:
+                self._resolve(state)
+                return
+            resolving, state.resolving = state.resolving, None
+            try:
+                state.address = resolving.result()[0][4]
+            except OSError:
+                self._finish_probe(state, False, now)
+                return
+
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        except OSError:
+            self._finish_probe(state, False, now)
+            return
+
+        sock.setblocking(False)
+        err = sock.connect_ex(state.address)
+        if err in _CONNECT_IN_PROGRESS:
+            state.sock = sock
+            state.deadline = now + self.timeout
+            self._selector.register(sock, selectors.EVENT_WRITE, state)
+        else:
+            sock.close()
+            self._finish_probe(state, False, now)
+
+    def _finish_probe(self, state, alive, now):
+        if state.sock is not None:
+            self._selector.unregister(state.sock)
+            state.sock.close()
+            state.sock = None
+            state.deadline = None
+
+        if alive:
+            state.failures = 0
+        else:
+            state.failures += 1
+            # re-resolve the host name on the next probe
+            state.address = None
+
+        state.due = now + self._next_interval(state)
+        # the next result is in by then, with an interval of slack for a
+        # slow lookup, so a backed off scope is not probed by is_alive()
+        self.liveness.update(state.scope.host, alive, now,
+                             state.due + self.timeout + self.interval)
+        if self.callback is not None:
+            try:
+                self.callback(state.scope, alive)
+            except Exception:
+                logging.exception('liveness callback failed')
+
+    def _wait_time(self, now):
+        # lookups in progress wake the selector up once they are done
+        times = [s.deadline if s.sock is not None else s.due
+                 for s in self._states if s.resolving is None]
+        if not times:
+            return None
+        return max(0, min(times) - now)
+
+    def run(self):
+        while self.running:
+            now = time.monotonic()
+            for state in self._states:
+                if self._is_due(state, now):
+                    self._start_probe(state, now)
+
+            events = self._selector.select(self._wait_time(now))
+
+            now = time.monotonic()
+            for key, mask in events:
+                if key.fileobj is self._wakeup_r:
+                    try:
+                        self._wakeup_r.recv(64)
+                    except BlockingIOError:
+                        pass
+                    continue
+                state = key.data
+                err = state.sock.getsockopt(socket.SOL_SOCKET,
+                                            socket.SO_ERROR)
+                self._finish_probe(state, err == 0, now)
+
+            for state in self._states:
+                if state.sock is not None and state.deadline <= now:
+                    self._finish_probe(state, False, now)
+
+        for state in self._states:
+            if state.sock is not None:
+                self._selector.unregister(state.sock)
+                state.sock.close()
+                state.sock = None
+        self._resolver.shutdown(wait=False)
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def stop(self):
+        self.running = False
+        self._wakeup()
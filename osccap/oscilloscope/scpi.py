@@ -0,0 +1,145 @@
+import logging
+import time
+
+from osccap.errors import CompletionTimeout
+
+# *ESR? bit set by *OPC once all pending operations are complete
+ESR_OPC = 0x01
+
+# bytes requested from the transport at once while reading a block
+BLOCK_CHUNK_SIZE = 1024 * 1024
+
+
+def _read_exactly(dev, view, chunk_size=BLOCK_CHUNK_SIZE):
+    pos = 0
+    while pos < len(view):
+        n = dev.readinto(view[pos:pos+chunk_size])
+        if n == 0:
+            raise EOFError('short read, expected {} bytes, got {}'
+                           .format(len(view), pos))
+        pos += n
+
+
+def read_block(dev, chunk_size=BLOCK_CHUNK_SIZE):
+    """Read an IEEE 488.2 block response and return its payload.
+
+    The header is parsed first, then a buffer of the declared length is
+    allocated and filled in chunks, so the payload is held in memory only
+    once. The returned bytearray can be passed to np.frombuffer() without
+    copying.
+
+    The indefinite length form (#0) is read up to the end of the message.
+    """
+    header = bytearray(2)
+    _read_exactly(dev, memoryview(header))
+    if header[0:1] != b'#' or not header[1:2].isdigit():
+        raise ValueError('invalid block header {!r}'.format(bytes(header)))
+
+    len_digits = int(chr(header[1]))
+    if len_digits == 0:
+        data = bytearray(dev.read_raw())
+        if data.endswith(b'\n'):
+            del data[-1:]
+        return data
+
+    payload = _read_block_payload(dev, len_digits, chunk_size)
+    _read_terminator(dev, len(payload))
+    return payload
+
+
+def _read_block_payload(dev, len_digits, chunk_size):
+    length = bytearray(len_digits)
+    _read_exactly(dev, memoryview(length))
+    if not length.isdigit():
+        raise ValueError('invalid block length {!r}'.format(bytes(length)))
+
+    payload = bytearray(int(length))
+    _read_exactly(dev, memoryview(payload), chunk_size)
+    return payload
+
+
+def _read_terminator(dev, length):
+    # consume the message terminator, unless the transport saw the end of
+    # the message with the last data byte (VXI-11 END), then there is
+    # nothing left to read and read_raw() would wait for the I/O timeout
+    if getattr(dev, 'message_end', False) is True:
+        return
+    rest = dev.read_raw()
+    if rest.strip():
+        raise ValueError('{} unexpected bytes after block of length {}'
+                         .format(len(rest), length))
+
+
+def read_blocks(dev, count, chunk_size=BLOCK_CHUNK_SIZE):
+    """Read a response of count definite length blocks separated by ';'.
+
+    Returns a list of the payloads, see read_block().
+    """
+    payloads = list()
+    for i in range(count):
+        header = bytearray(3 if i else 2)
+        _read_exactly(dev, memoryview(header))
+        if i:
+            if header[0:1] != b';':
+                raise ValueError('invalid block separator {!r}'
+                                 .format(bytes(header[0:1])))
+            del header[0]
+        if (header[0:1] != b'#' or not header[1:2].isdigit()
+                or header[1:2] == b'0'):
+            raise ValueError('invalid block header {!r}'
+                             .format(bytes(header)))
+        payloads.append(_read_block_payload(dev, int(chr(header[1])),
+                                            chunk_size))
+    _read_terminator(dev, sum(len(p) for p in payloads))
+    return payloads
+
+
+def _poll_esr(dev, timeout):
+    """Wait for the operation complete bit in the event status register.
+
+    The poll interval starts small and is doubled on each poll, so short
+    operations are detected quickly and long ones don't flood the
+    instrument with queries.
+    """
+    deadline = time.monotonic() + timeout
+
+    # clear the event status register, then arm the OPC bit
+    dev.write('*ESR?')
+    dev.read()
+    dev.write('*OPC')
+
+    delay = 0.01
+    while True:
+        dev.write('*ESR?')
+        if int(dev.read()) & ESR_OPC:
+            return
+        if time.monotonic() > deadline:
+            raise CompletionTimeout('operation takes longer than {} seconds'
+                                    .format(timeout))
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def wait_for_completion(dev, timeout=10):
+    """Wait until all pending operations of the instrument are complete.
+
+    A single *OPC? query is sent, which the instrument only answers once
+    all pending operations are done. The I/O timeout is raised to
+    `timeout` seconds for this query. If the instrument answers anything
+    but 1, the event status register is polled instead.
+    """
+    saved_timeout = dev.timeout
+    dev.timeout = timeout
+    start = time.monotonic()
+    try:
+        dev.write('*OPC?')
+        complete = '1' in dev.read()
+    finally:
+        dev.timeout = saved_timeout
+
+    if not complete:
+        logging.debug('scpi: *OPC? not supported, polling *ESR?')
+        _poll_esr(dev, timeout)
+
+    logging.debug('scpi: operation complete after {:.3f}s'
+                  .format(time.monotonic() - start))
@@ -0,0 +1,183 @@
+import logging
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+
+from osccap.oscilloscope.transport import transport_errors, Vxi11Transport
+
+
+class Session(object):
+    """A persistent link to one oscilloscope.
+
+    The link is opened on first use and reused by all following
+    operations. If it was not used for `idle_timeout` seconds it is closed
+    in the background and transparently reopened on the next use.
+
+    The link is created by factory(host). If that fails and a fallback
+    factory is given, the fallback is used instead.
+    """
+
+    def __init__(self, host, idle_timeout=30, factory=Vxi11Transport,
+                 fallback=None):
+        self.host = host
+        self.idle_timeout = idle_timeout
+        self._factory = factory
+        self._fallback = fallback
+        self._dev = None
+        self._last_used = 0
+        self._idle_timer = None
+        self._lock = threading.RLock()
+        self._deferred = list()
+
+        # statistics
+        self.opens = 0
+        self.uses = 0
+        self.reconnects = 0
+
+    def __str__(self):
+        return '[session host: {} opens: {} uses: {} saved: {}]'.format(
+                self.host, self.opens, self.uses, self.saved_opens)
+
+    @property
+    def saved_opens(self):
+        """Number of link setups saved by reusing the open link."""
+        return self.uses - self.opens
+
+    @property
+    def is_open(self):
+        return self._dev is not None
+
+    def _open(self):
+        dev = self._factory(self.host)
+        try:
+            dev.open()
+        except transport_errors() as e:
+            if self._fallback is None:
+                raise
+            logging.warning('session: cannot open link to {} ({}), '
+                            'falling back'.format(self.host, e))
+            dev = self._fallback(self.host)
+            dev.open()
+        self.opens += 1
+        logging.debug('session: opened link to {}'.format(self.host))
+        return dev
+
+    def _drop(self):
+        dev, self._dev = self._dev, None
+        if dev is None:
+            return
+        try:
+            dev.close()
+        except transport_errors():
+            pass
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _arm_idle_timer(self):
+        self._cancel_idle_timer()
+        if self._dev is None or self.idle_timeout is None:
+            return
+        self._idle_timer = threading.Timer(self.idle_timeout,
+                                           self._close_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _close_if_idle(self):
+        with self._lock:
+            if time.monotonic() - self._last_used >= self.idle_timeout:
+                logging.debug('session: closing idle link to {}'
+                              .format(self.host))
+                self._idle_timer = None
+                self._drop()
+
+    @contextmanager
+    def device(self):
+        """Lock the session and yield the open instrument.
+
+        If an operation fails with a link error, the link is dropped so
+        that the next use reconnects.
+        """
+        with self._lock:
+            self._cancel_idle_timer()
+            if self._dev is None:
+                self._dev = self._open()
+            self.uses += 1
+            try:
+                yield self._dev
+            except transport_errors():
+                self._drop()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+                self._arm_idle_timer()
+
+    def defer(self, fct, *args):
+        """Call fct(dev, *args) after the current operation has returned.
+
+        Deferred calls run in the background while holding the session
+        lock. If the next operation gets the lock first, it runs them
+        itself before its own call, so it always sees them done. This is
+        meant for cleanups the caller does not need to wait for.
+        """
+        with self._lock:
+            self._deferred.append((fct, args))
+
+    def _run_deferred(self):
+        with self._lock:
+            deferred, self._deferred = self._deferred, list()
+            if not deferred:
+                return
+            try:
+                with self.device() as dev:
+                    for (fct, args) in deferred:
+                        fct(dev, *args)
+            except Exception as e:
+                logging.warning('session: deferred call on {} failed ({})'
+                                .format(self.host, e))
+
+    def _start_deferred(self):
+        if self._deferred:
+            thread = threading.Thread(target=self._run_deferred,
+                                      name='osccap-deferred')
+            thread.daemon = True
+            thread.start()
+
+    def run(self, fct, *args, **kwargs):
+        """Call fct(dev, *args, **kwargs) on the open instrument.
+
+        If a reused link turns out to be stale, it is reopened and the call
+        is retried once. Calls deferred by fct are started once it has
+        returned, calls still pending from earlier operations are run
+        first.
+        """
+        with self._lock:
+            self._run_deferred()
+            reused = self._dev is not None
+            try:
+                with self.device() as dev:
+                    return fct(dev, *args, **kwargs)
+            except socket.timeout:
+                raise
+            except transport_errors() as e:
+                if not reused:
+                    raise
+                logging.warning('session: stale link to {} ({}), reconnecting'
+                                .format(self.host, e))
+                self.reconnects += 1
+                # the failed attempt defers its calls again
+                self._deferred = list()
+                with self.device() as dev:
+                    return fct(dev, *args, **kwargs)
+            finally:
+                self._start_deferred()
+
+    def close(self):
+        with self._lock:
+            self._deferred = list()
+            self._cancel_idle_timer()
+            self._drop()
@@ -16,21 +16,46 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
-import time
-import vxi11
 
+from collections import namedtuple
 
-def get_source_list(host):
+from osccap.oscilloscope.scpi import read_blocks, wait_for_completion
+
+# seconds the scope may take to save an image or a waveform
+SAVE_TIMEOUT = 10
+
+# EXPORT:FORMAT and HARDCOPY:FORMAT of each screenshot format
+IMAGE_FORMATS = {
+    'png': 'PNG',
+    'bmp': 'BMP',
+    'jpg': 'JPEG',
+}
+
+# the MSO 5 and 6 series
+MSO_MODELS = ['MSO54', 'MSO56', 'MSO58', 'MSO64']
+
+# numpy dtype of the samples for each WFMOUTPRE:BYT_NR with SRIBINARY
+# encoding (signed, LSB first)
+SAMPLE_DTYPES = {
+    1: 'i1',
+    2: '<i2',
+}
+
+# The WFMOUTPRE? fields in the names of agilent.Preamble. A sample value
+# is (raw - y_reference) * y_increment + y_origin, the time of sample i is
+# (i - x_reference) * x_increment + x_origin.
+Preamble = namedtuple('Preamble', 'format points x_increment x_origin '
+                      'x_reference y_increment y_origin y_reference')
+
+
+def get_source_list(dev):
     """This query returns a list of the available waveforms that can be
     specified as the source for the SAVe:WAVEform command. Source
     waveforms must have their display mode set to On to appear in this
     list and to be saved.
     """
-    dev = vxi11.Instrument("TCPIP::" + host + "::INSTR")
-    dev.open()
     dev.write('SAVE:WAVEFORM:SOURCELIST?')
     source_list = dev.read()
-    dev.close()
     return source_list
 
 
@@ -55,19 +80,30 @@ def get_sources(model):
     return sources
 
 
-def take_screenshot(host, model, fullscreen=True, image_format='png'):
+def _delete_file(dev, filename):
+    dev.write('FILESYSTEM:DELETE "{}"'.format(filename))
 
-    if image_format.lower() != 'png':
-        logging.warning('currently only png format supported')
-        raise Exception()
 
-    dev = vxi11.Instrument("TCPIP::" + host + "::INSTR")
-    dev.open()
-    dev.io_timeout = 10
+def take_screenshot(dev, model, fullscreen=True, image_format='png',
+                    defer=None, hardcopy=False):
+    """Take a screenshot and return the image data.
+
+    If defer is given, cleanups on the scope (deleting the image file) are
+    passed to it instead of done before returning. With hardcopy, the
+    MSO5/6 models stream the image with HARDCOPY START instead of saving
+    it to the scope's disk first; not all firmware versions support this.
+    """
+
+    image_format = image_format.lower()
+    try:
+        export_format = IMAGE_FORMATS[image_format]
+    except KeyError:
+        raise ValueError('unsupported image format {}'.format(image_format))
 
     if model in ['TDS5104', 'TDS7704B']:
-        dev.write(r'EXPORT:FILENAME "C:\TEMP\SCREEN.PNG"')
-        dev.write('EXPORT:FORMAT PNG')
+        filename = r'C:\TEMP\SCREEN.{}'.format(image_format.upper())
+        dev.write('EXPORT:FILENAME "{}"'.format(filename))
+        dev.write('EXPORT:FORMAT ' + export_format)
         dev.write('EXPORT:IMAGE NORMAL')
         dev.write('EXPORT:PALETTE COLOR')
         if fullscreen:
@@ -76,62 +112,234 @@ def take_screenshot(host, model, fullscreen=True, image_format='png'):
             dev.write('EXPORT:VIEW GRATICULE')
             dev.write('EXPORT:VIEW FULLNO')
         dev.write('EXPORT START')
-        time.sleep(3)
-        dev.write(r'FILESYSTEM:PRINT "C:\TEMP\SCREEN.PNG", GPIB')
-        time.sleep(0.5)
-        img_data = dev.read_raw()
-        dev.write(r'FILESYSTEM:DELETE "C:\TEMP\SCREEN.PNG"')
-
-    elif model in ['MSO54', 'MSO56', 'MSO58', 'MSO64']:
-        dev.write(r'SAVE:IMAGE "screen.png"')
-        save_time = 0
-        dev.write('*OPC?')
-
-        while '1' not in dev.read():
-            time.sleep(0.01)
-            save_time += 1
-            dev.write('*OPC?')
-            if save_time > 10000:
-                raise Exception('save image takes longer than 10 seconds')
-        dev.write('FILESYSTEM:READFILE "screen.png"')
-        img_data = dev.read_raw()
-        dev.write(r'FILESYSTEM:DELETE "screen.png"')
+        wait_for_completion(dev, SAVE_TIMEOUT)
+        dev.write('FILESYSTEM:PRINT "{}", GPIB'.format(filename))
+        img_data = dev.read_raw_file()
+        delete_file = filename
+
+    elif model in MSO_MODELS and hardcopy:
+        dev.write('HARDCOPY:FORMAT ' + export_format)
+        dev.write('HARDCOPY:PORT GPIB')
+        dev.write('HARDCOPY START')
+        img_data = dev.read_raw_file()
+        delete_file = None
+
+    elif model in MSO_MODELS:
+        # the format is selected by the file extension
+        filename = 'screen.' + image_format
+        dev.write('SAVE:IMAGE "{}"'.format(filename))
+        wait_for_completion(dev, SAVE_TIMEOUT)
+        dev.write('FILESYSTEM:READFILE "{}"'.format(filename))
+        img_data = dev.read_raw_file()
+        delete_file = filename
 
     else:
         raise Exception('scope type not known')
 
-    dev.close()
+    if delete_file is not None:
+        if defer is None:
+            _delete_file(dev, delete_file)
+        else:
+            defer(_delete_file, delete_file)
+
+    logging.debug('tektronix: screenshot {} bytes'.format(len(img_data)))
 
     return img_data
 
-def take_waveform(host, model, active_sources, waveform_format=None):
 
-    dev = vxi11.Instrument("TCPIP::" + host + "::INSTR")
-    dev.open()
-    dev = vxi11.Instrument("TCPIP::" + host + "::INSTR")
-    dev.open()
-    dev.io_timeout = 10
+def _query_preamble(dev):
+    dev.write('WFMOUTPRE:BYT_NR?;NR_PT?;XINCR?;XZERO?;PT_OFF?;YMULT?;YZERO?;'
+              'YOFF?')
+    return parse_waveform_preamble(dev.read().split(';'))
+
+
+def parse_waveform_preamble(fields):
+    """Parse the WFMOUTPRE:BYT_NR?;NR_PT?;XINCR?;XZERO?;PT_OFF?;YMULT?;
+    YZERO?;YOFF? response (with HEADER OFF)."""
+    return Preamble(format=int(fields[0]),
+                    points=int(fields[1]),
+                    x_increment=float(fields[2]),
+                    x_origin=float(fields[3]),
+                    x_reference=int(float(fields[4])),
+                    y_increment=float(fields[5]),
+                    y_origin=float(fields[6]),
+                    y_reference=float(fields[7]))
 
-    if model in ['TDS5104', 'TDS7704']:
-        raise('not supported')
 
-    elif model in ['MSO54', 'MSO56', 'MSO58', 'MSO64']:
+def _setup_curves(dev, active_sources, transfer_format):
+    """Set up the CURVE? transfer and return the preambles by source."""
+    # MSO5/6 have 12 bit ADCs, so AUTO always selects WORD
+    byte_nr = 1 if (transfer_format or '').upper() == 'BYTE' else 2
 
-        waveforms = {}
-        for source in active_sources:
-            dev.write('SAVE:WAVEFORM {},"waveform.wfm"'.format(source))
-            dev.write('*OPC?')
+    dev.write('HEADER OFF')
+    dev.write('DATA:ENCDG SRIBINARY')
+    dev.write('WFMOUTPRE:BYT_NR {}'.format(byte_nr))
+    dev.write('HORIZONTAL:RECORDLENGTH?')
+    record_length = int(dev.read())
+    dev.write('DATA:START 1;STOP {}'.format(record_length))
 
-            while '1' not in dev.read():
-                time.sleep(0.01)
-                save_time += 1
-                dev.write('*OPC?')
-                if save_time > 10000:
-                    raise Exception('save waveform takes longer than 10 seconds')
+    preambles = {}
+    for source in active_sources:
+        dev.write('DATA:SOURCE ' + source)
+        preambles[source] = _query_preamble(dev)
+    return preambles
 
-            dev.write(r'FILESYSTEM:READFILE "waveform.wfm"')
-            waveforms[source] = dev.read_raw()
-            dev.write(r'FILESYSTEM:DELETE "waveform.wfm"')
 
-    dev.close()
+def _read_curves(dev, preambles, first=None, count=None):
+    """Read the samples first to first + count - 1 of all sources with a
+    single CURVE? query, all samples if first is None."""
+    import numpy as np
+    from osccap.waveform import Waveform
+
+    if first is not None:
+        dev.write('DATA:START {};STOP {}'.format(first + 1, first + count))
+    dev.write('DATA:SOURCE ' + ','.join(preambles))
+    dev.write('CURVE?')
+    curves = read_blocks(dev, len(preambles))
+
+    waveforms = {}
+    for (source, curve) in zip(preambles, curves):
+        preamble = preambles[source]
+        increment = preamble.y_increment
+        waveforms[source] = Waveform(
+                np.frombuffer(curve, dtype=SAMPLE_DTYPES[preamble.format]),
+                increment,
+                preamble.y_origin - preamble.y_reference * increment)
+        if count is not None and len(waveforms[source]) != count:
+            raise ValueError('{}: expected {} points, got {}'.format(
+                    source, count, len(waveforms[source])))
     return waveforms
+
+
+def _take_curves(dev, active_sources, window, transfer_format):
+    """Read the waveforms of all sources with a single CURVE? query."""
+    from osccap.waveform import time_info
+
+    logging.debug('tektronix: take_waveform sources {} window {}'
+                  .format(active_sources, window))
+
+    preambles = _setup_curves(dev, active_sources, transfer_format)
+
+    # all sources share the same timebase
+    (time_array, time_fmt) = time_info(next(iter(preambles.values())))
+    if window is None:
+        waveforms = _read_curves(dev, preambles)
+    else:
+        (first, count) = time_array.window_points(window)
+        waveforms = _read_curves(dev, preambles, first, count)
+        time_array = time_array.window(first, count)
+
+    return (time_array, time_fmt, waveforms, preambles)
+
+
+def take_waveform_chunked(dev, model, active_sources, consume, chunk_points,
+                          progress=None, window=None, transfer_format='WORD'):
+    """Read the waveforms chunk_points samples at a time.
+
+    Each chunk is read with CURVE? after narrowing DATA:START and
+    DATA:STOP to it, see agilent.take_waveform_chunked() for consume,
+    progress and window.
+    """
+    from osccap.waveform import time_info
+
+    if model not in MSO_MODELS:
+        raise NotImplementedError('waveforms of {} are not supported'
+                                  .format(model))
+
+    logging.debug('tektronix: take_waveform_chunked sources {} '
+                  'chunk_points={}'.format(active_sources, chunk_points))
+
+    preambles = _setup_curves(dev, active_sources, transfer_format)
+    if not preambles:
+        return
+
+    # all sources share the same timebase
+    (time_array, time_fmt) = time_info(next(iter(preambles.values())))
+    if window is None:
+        (first, points) = (0, len(time_array))
+    else:
+        (first, points) = time_array.window_points(window)
+
+    for start in range(first, first + points, chunk_points):
+        size = min(chunk_points, first + points - start)
+        waveforms = _read_curves(dev, preambles, start, size)
+        consume(time_array[start:start+size], time_fmt, waveforms, preambles)
+        if progress is not None:
+            progress(start + size - first, points)
+
+
+def _save_waveforms(dev, active_sources):
+    """Save each source to a .wfm file on the scope and read it back."""
+    waveforms = {}
+    for source in active_sources:
+        dev.write('SAVE:WAVEFORM {},"waveform.wfm"'.format(source))
+        wait_for_completion(dev, SAVE_TIMEOUT)
+
+        dev.write(r'FILESYSTEM:READFILE "waveform.wfm"')
+        waveforms[source] = dev.read_raw_file()
+        dev.write(r'FILESYSTEM:DELETE "waveform.wfm"')
+    return waveforms
+
+
+def waveforms_from_wfm(files, window=None):
+    """Convert the contents of .wfm files, by source, to the result of
+    take_waveform()."""
+    from osccap.waveform import time_info
+    from osccap.wfm import parse_wfm
+
+    waveforms = {}
+    preambles = {}
+    for (source, data) in files.items():
+        wfm = parse_wfm(data)
+        preambles[source] = Preamble(format=wfm.bytes_per_point,
+                                     points=wfm.points,
+                                     x_increment=wfm.x_scale,
+                                     x_origin=wfm.x_start,
+                                     x_reference=0,
+                                     y_increment=wfm.y_scale,
+                                     y_origin=wfm.y_offset,
+                                     y_reference=0)
+        waveforms[source] = wfm.waveform
+
+    # all sources share the same timebase
+    (time_array, time_fmt) = time_info(next(iter(preambles.values())))
+    if window is not None:
+        (first, count) = time_array.window_points(window)
+        time_array = time_array.window(first, count)
+        waveforms = dict((s, w.window(first, count))
+                         for (s, w) in waveforms.items())
+
+    return (time_array, time_fmt, waveforms, preambles)
+
+
+def take_waveform(dev, model, active_sources, waveform_format='ASCII',
+                  window=None, transfer_format='WORD'):
+    """Read the waveforms of the active sources.
+
+    With the ASCII format, the waveforms are transferred with CURVE? and
+    returned like agilent.take_waveform() does. With the BINARY format,
+    the .wfm file of each source is returned as saved by the scope. The
+    WFM format saves the .wfm files as well, but returns them parsed like
+    the ASCII format.
+    """
+
+    if model not in MSO_MODELS:
+        raise NotImplementedError('waveforms of {} are not supported'
+                                  .format(model))
+
+    if waveform_format == 'BINARY':
+        if window is not None:
+            # SAVE:WAVEFORM always saves the whole record
+            raise NotImplementedError('waveform windows are not supported')
+        return _save_waveforms(dev, active_sources)
+
+    if waveform_format == 'WFM':
+        # the window is applied after the whole records were transferred
+        return waveforms_from_wfm(_save_waveforms(dev, active_sources),
+                                  window)
+
+    if waveform_format != 'ASCII':
+        raise ValueError('unsupported waveform format {}'
+                         .format(waveform_format))
+
+    return _take_curves(dev, active_sources, window, transfer_format)
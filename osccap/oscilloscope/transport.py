@@ -0,0 +1,320 @@
+import logging
+import socket
+import struct
+import sys
+
+
+def transport_errors():
+    """Return the errors which are raised by the transports if the link is
+    broken.
+
+    vxi11 is imported by the first Vxi11Transport, its errors can't occur
+    before.
+    """
+    vxi11 = sys.modules.get('vxi11')
+    if vxi11 is None:
+        return (OSError, EOFError)
+    return (OSError, EOFError, vxi11.vxi11.Vxi11Exception, vxi11.rpc.RPCError)
+
+
+SCPI_PORT = 5025
+
+
+class Vxi11Transport(object):
+    """Talk to the instrument by VXI-11.
+
+    If port is given, the core channel is connected directly and the
+    portmapper lookup is skipped. message_end is set if the instrument
+    marked the last byte read by readinto() as the end of the message.
+    """
+
+    def __init__(self, host, port=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.message_end = False
+        import vxi11
+        self._dev = vxi11.Instrument("TCPIP::" + host + "::INSTR")
+        self._dev.timeout = timeout
+
+    @property
+    def timeout(self):
+        return self._dev.timeout
+
+    @timeout.setter
+    def timeout(self, val):
+        self._dev.timeout = val
+
+    def open(self):
+        if self.port is not None and self._dev.client is None:
+            from vxi11.vxi11 import CoreClient
+            self._dev.client = CoreClient(self.host, self.port)
+        self._dev.open()
+
+    def close(self):
+        self._dev.close()
+
+    def write(self, message):
+        self._dev.write(message)
+
+    def read(self):
+        return self.read_raw().decode('utf-8').rstrip('\r\n')
+
+    def readinto(self, view):
+        """Read at most len(view) bytes of the response into view."""
+        from vxi11.vxi11 import RX_CHR, RX_END, Vxi11Exception
+
+        if self._dev.link is None:
+            self._dev.open()
+        # a single device_read, vxi11 does not tell whether its read_raw()
+        # stopped at the end of the message
+        (error, reason, data) = self._dev.client.device_read(
+                self._dev.link, min(len(view), self._dev.max_recv_size),
+                int(self._dev.timeout * 1000),
+                int(self._dev.lock_timeout * 1000), 0, 0)
+        if error:
+            self._raise(Vxi11Exception(error, 'read'))
+        view[:len(data)] = data
+        self.message_end = bool(reason & (RX_END | RX_CHR))
+        return len(data)
+
+    def read_raw(self):
+        return self._read_raw()
+
+    def read_raw_file(self):
+        """Read an unframed response, e.g. the contents of a file.
+
+        VXI-11 marks the end of each message, so this is read_raw().
+        """
+        return self._read_raw()
+
+    def _read_raw(self, num=-1):
+        from vxi11.vxi11 import Vxi11Exception
+
+        try:
+            data = self._dev.read_raw(num)
+        except Vxi11Exception as e:
+            self._raise(e)
+        self.message_end = True
+        return data
+
+    def _raise(self, e):
+        from vxi11.vxi11 import ERR_IO_TIMEOUT
+
+        # report I/O timeouts the same way as the socket transport
+        if e.err == ERR_IO_TIMEOUT:
+            raise socket.timeout('I/O timeout reading from {}'
+                                 .format(self.host))
+        raise e
+
+
+def _png_length(data):
+    pos = 8
+    while len(data) >= pos + 8:
+        (length, kind) = struct.unpack_from('>I4s', data, pos)
+        pos += 12 + length
+        if kind == b'IEND':
+            return pos
+    return None
+
+
+def _jpeg_length(data):
+    pos = 2
+    while len(data) >= pos + 4:
+        if data[pos] != 0xff:
+            raise ValueError('invalid JPEG marker at {}'.format(pos))
+        if data[pos + 1] == 0xda:
+            # the entropy coded data can't contain an end of image marker
+            end = data.find(b'\xff\xd9', pos)
+            return None if end < 0 else end + 2
+        pos += 2 + struct.unpack_from('>H', data, pos + 2)[0]
+    return None
+
+
+def _wfm_length(data):
+    if len(data) < 15:
+        return None
+    byte_order = '<' if data[0:2] == b'\x0f\x0f' else '>'
+    # the byte count to EOF follows the version and the number of digits
+    return 15 + struct.unpack_from(byte_order + 'I', data, 11)[0]
+
+
+def file_length(data):
+    """Return the length of the file which starts with data, or None if
+    more of it is needed to tell.
+
+    PNG, JPEG and BMP images and .wfm waveforms are known, a ValueError
+    is raised for other files.
+    """
+    if len(data) < 8:
+        return None
+    if data[0:8] == b'\x89PNG\r\n\x1a\n':
+        return _png_length(data)
+    if data[0:2] == b'\xff\xd8':
+        return _jpeg_length(data)
+    if data[0:2] == b'BM':
+        return struct.unpack_from('<I', data, 2)[0]
+    if data[0:2] in (b'\x0f\x0f', b'\xf0\xf0') and data[2:7] == b':WFM#':
+        return _wfm_length(data)
+    raise ValueError('unknown file format {!r}, the length of the file '
+                     'is not known'.format(bytes(data[0:8])))
+
+
+class SocketTransport(object):
+    """Talk to the instrument by SCPI over a raw TCP socket.
+
+    Most instruments listen on port 5025. Messages are terminated by a
+    newline, binary blocks are framed by their IEEE 488.2 header. Raw file
+    contents have no framing, their length is taken from the file header,
+    see file_length().
+    """
+
+    # the end of a message is only known from its newline
+    message_end = False
+
+    def __init__(self, host, port=None, timeout=10, rcvbuf=4*1024*1024,
+                 chunk_size=1024*1024):
+        self.host = host
+        self.port = SCPI_PORT if port is None else port
+        self.rcvbuf = rcvbuf
+        self.chunk_size = chunk_size
+        self._timeout = timeout
+        self._sock = None
+        self._buf = bytearray()
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, val):
+        self._timeout = val
+        if self._sock is not None:
+            self._sock.settimeout(val)
+
+    def open(self):
+        if self._sock is not None:
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            # must be set before connecting to get a large window
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(self._timeout)
+            sock.connect((self.host, self.port))
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._buf = bytearray()
+
+    def close(self):
+        if self._sock is None:
+            return
+        self._sock.close()
+        self._sock = None
+
+    def write(self, message):
+        if self._sock is None:
+            self.open()
+        self._sock.sendall(str(message).encode('utf-8') + b'\n')
+
+    def _fill(self, size):
+        """Receive until at least size bytes are buffered."""
+        while len(self._buf) < size:
+            data = self._sock.recv(max(self.chunk_size, size - len(self._buf)))
+            if not data:
+                raise EOFError('connection closed by instrument')
+            self._buf += data
+
+    def _take(self, size):
+        self._fill(size)
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def _read_exact(self, size):
+        """Read size bytes, large payloads are received in place."""
+        data = bytearray(size)
+        view = memoryview(data)
+        pos = min(len(self._buf), size)
+        view[:pos] = self._buf[:pos]
+        del self._buf[:pos]
+        while pos < size:
+            n = self._sock.recv_into(view[pos:])
+            if n == 0:
+                raise EOFError('connection closed by instrument')
+            pos += n
+        return data
+
+    def readinto(self, view):
+        """Read at most len(view) bytes of the response into view."""
+        if self._sock is None:
+            self.open()
+        if self._buf:
+            n = min(len(self._buf), len(view))
+            view[:n] = self._buf[:n]
+            del self._buf[:n]
+            return n
+        n = self._sock.recv_into(view)
+        if n == 0:
+            raise EOFError('connection closed by instrument')
+        return n
+
+    def _read_line(self):
+        start = 0
+        while True:
+            pos = self._buf.find(b'\n', start)
+            if pos >= 0:
+                return self._take(pos + 1)
+            start = len(self._buf)
+            self._fill(start + 1)
+
+    def read_raw(self):
+        """Read one complete response message including its terminator."""
+        if self._sock is None:
+            self.open()
+        self._fill(1)
+        if self._buf[0:1] != b'#':
+            return self._read_line()
+        self._fill(2)
+        if self._buf[1:2] == b'0':
+            return self._read_line()
+
+        # definite length block: #<N><length><data><newline>
+        len_digits = int(chr(self._buf[1]))
+        self._fill(2 + len_digits)
+        length = int(self._buf[2:2+len_digits])
+        # include the terminating newline
+        return self._read_exact(2 + len_digits + length + 1)
+
+    def read_raw_file(self):
+        """Read an unframed response, e.g. the contents of a file.
+
+        Exactly as many bytes as the file header declares are read, a
+        stall raises socket.timeout instead of returning part of the file.
+        """
+        if self._sock is None:
+            self.open()
+        self._fill(1)
+        while True:
+            length = file_length(self._buf)
+            if length is not None:
+                return self._take(length)
+            self._fill(len(self._buf) + 1)
+
+    def read(self):
+        return self.read_raw().decode('utf-8').rstrip('\r\n')
+
+
+TRANSPORTS = {
+    'vxi11': Vxi11Transport,
+    'socket': SocketTransport,
+}
+
+
+def get_transport(name):
+    try:
+        return TRANSPORTS[name]
+    except KeyError:
+        logging.warning('unknown transport {}, using vxi11'.format(name))
+        return Vxi11Transport
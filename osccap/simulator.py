@@ -0,0 +1,652 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A local stand-in for an oscilloscope.
+
+The simulated instrument can be reached by VXI-11 (including a portmapper)
+and by a raw SCPI socket, so the drivers and both transports can be
+exercised without a lab scope. There are personalities for the Keysight
+DSOX91604A and the Tektronix MSO5/6 series, e.g.
+
+    python -m osccap.simulator --model MSO58 --points 10000000 \
+            --latency 0.001 --bandwidth 50e6
+"""
+
+import argparse
+import logging
+import numpy
+import socketserver
+import struct
+import threading
+import time
+import zlib
+
+from vxi11 import rpc
+from vxi11 import vxi11
+
+from osccap.wfm import WFM_VERSION
+
+
+def bmp_image(width, height, pixels):
+    """Return an uncompressed 24 bit BMP image of the RGB pixel rows."""
+    stride = (width * 3 + 3) & ~3
+    rows = b''.join(pixels[y * width * 3:(y + 1) * width * 3].ljust(stride,
+                    b'\0') for y in reversed(range(height)))
+    header = struct.pack('<2sIHHI', b'BM', 54 + len(rows), 0, 0, 54)
+    info = struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0,
+                       len(rows), 0, 0, 0, 0)
+    return header + info + rows
+
+
+def png_image(width, height, pixels):
+    """Return a truecolor PNG image of the RGB pixel rows."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data)))
+    rows = b''.join(b'\0' + pixels[y * width * 3:(y + 1) * width * 3]
+                    for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0,
+                                       0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows)) +
+            chunk(b'IEND', b''))
+
+
+def wfm_file(samples, y_scale, y_offset, x_scale, x_start):
+    """Return a little endian WFM#003 file of the int16 samples."""
+    curve_offset = 838
+    samples = numpy.asarray(samples, dtype='<i2')
+    data = bytearray(curve_offset)
+    data[0:2] = b'\x0f\x0f'
+    for (offset, fmt, value) in (
+            (2, '8s', WFM_VERSION),
+            (10, 'B', 4),
+            (11, 'I', curve_offset + samples.nbytes - 15),
+            (15, 'B', 2),
+            (16, 'i', curve_offset),
+            (168, 'd', y_scale),
+            (176, 'd', y_offset),
+            (240, 'i', 0),
+            (488, 'd', x_scale),
+            (496, 'd', x_start),
+            (822, 'I', 0),
+            (826, 'I', samples.nbytes)):
+        struct.pack_into('<' + fmt, data, offset, value)
+    return bytes(data) + samples.tobytes()
+
+
+def _block(data):
+    length = str(len(data)).encode()
+    return b'#' + str(len(length)).encode() + length + data
+
+
+def block(data):
+    """Wrap data into an IEEE 488.2 definite length block."""
+    return _block(data) + b'\n'
+
+
+class RawResponse(bytes):
+    """A response which is sent as it is, without a terminator, e.g. the
+    contents of a file."""
+
+
+def _split_units(message):
+    """Split a program message into its units, outside of quotes."""
+    units = ['']
+    quoted = False
+    for c in message:
+        if c == '"':
+            quoted = not quoted
+        if c == ';' and not quoted:
+            units.append('')
+        else:
+            units[-1] += c
+    return [u.strip() for u in units if u.strip()]
+
+
+def program_units(message):
+    """Return the (header, arguments) of each unit of a program message.
+
+    Headers are upper case without a leading colon. A header without a
+    leading colon after the first one is relative to the path of the
+    previous header, e.g. 'DATA:START 1;STOP 10' sets DATA:STOP.
+    """
+    units = list()
+    path = None
+    for unit in _split_units(message):
+        (header, _, args) = unit.partition(' ')
+        header = header.upper()
+        if path and not header.startswith((':', '*')):
+            header = path + ':' + header
+        header = header.lstrip(':')
+        path = header.rpartition(':')[0] or None
+        units.append((header, args.strip()))
+    return units
+
+
+def _unquote(args):
+    return args.strip().strip('"')
+
+
+class Instrument(object):
+    """The simulated instrument.
+
+    query() takes one program message and returns the response, or None
+    if there is none. Each message takes latency seconds and responses are
+    sent with at most bandwidth bytes per second, if they are set.
+
+    The commands map upper case headers to the method names handling
+    them. A header starting with <SOURCE> matches every source, the
+    method is called with the source instead of the arguments.
+    """
+    model = None
+    manufacturer = 'SIMULATOR'
+    sources = ()
+    commands = {
+        '*IDN?': '_idn',
+        '*OPC?': '_opc_query',
+        '*OPC': '_opc',
+        '*ESR?': '_esr_query',
+        '*CLS': '_cls',
+    }
+
+    def __init__(self, model=None, points=1000, latency=None,
+                 bandwidth=None):
+        if model is not None:
+            self.model = model
+        self.idn = '{},{},SIM0001,1.0'.format(self.manufacturer, self.model)
+        self.points = points
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.screen_size = (1024, 768)
+        # appended to each response, VXI-11 marks the end of a message
+        # with END anyway, so instruments may leave it out there
+        self.terminator = b'\n'
+        # files on the scope's disk by name
+        self.files = dict()
+        self._esr = 0
+        self._samples = dict()
+        self._lock = threading.Lock()
+
+    def samples(self, source):
+        """Return the int16 samples of the whole record of source.
+
+        Each source is a sine wave with a different frequency and
+        amplitude, so the sources can be told apart.
+        """
+        samples = self._samples.get(source)
+        if samples is None or len(samples) != self.points:
+            n = int(''.join(c for c in source if c.isdigit()) or 1)
+            phase = numpy.arange(self.points) * (2 * numpy.pi * n /
+                                                 self.points)
+            samples = (numpy.sin(phase) * (24000 // n)).astype(numpy.int16)
+            self._samples[source] = samples
+        return samples
+
+    def screenshot_data(self, image_type='PNG'):
+        # a mostly black screen with a few traces, like a real one
+        (width, height) = self.screen_size
+        pixels = bytearray(width * height * 3)
+        for (row, color) in ((height // 4, b'\xff\xff\x00'),
+                             (height // 2, b'\x00\xff\x00')):
+            start = row * width * 3
+            pixels[start:start + width * 3] = color * width
+        if image_type == 'BMP':
+            return bmp_image(width, height, bytes(pixels))
+        return png_image(width, height, bytes(pixels))
+
+    def throttle(self, size):
+        """Wait as long as sending size bytes takes with the bandwidth."""
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def _execute(self, header, args):
+        name = self.commands.get(header)
+        if name is not None:
+            return getattr(self, name)(args)
+
+        (source, _, rest) = header.partition(':')
+        name = self.commands.get('<SOURCE>:' + rest)
+        if name is not None and source in self.sources:
+            return getattr(self, name)(source)
+
+        if header.endswith('?'):
+            logging.warning('simulator: unknown query {}'.format(header))
+            return '0'
+        logging.debug('simulator: ignored {} {}'.format(header, args))
+        return None
+
+    def query(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+
+        responses = list()
+        with self._lock:
+            for (header, args) in program_units(message):
+                response = self._execute(header, args)
+                if response is not None:
+                    responses.append(response)
+
+        if not responses:
+            return None
+        if isinstance(responses[-1], RawResponse):
+            return bytes(responses[-1])
+        return b';'.join(r.encode() if isinstance(r, str) else r
+                         for r in responses) + self.terminator
+
+    def _idn(self, args):
+        return self.idn
+
+    def _opc_query(self, args):
+        # all operations complete immediately
+        return '1'
+
+    def _opc(self, args):
+        self._esr |= 1
+
+    def _esr_query(self, args):
+        (esr, self._esr) = (self._esr, 0)
+        return str(esr)
+
+    def _cls(self, args):
+        self._esr = 0
+
+
+class InfiniiumInstrument(Instrument):
+    """A Keysight Infiniium oscilloscope."""
+    model = 'DSOX91604A'
+    manufacturer = 'KEYSIGHT TECHNOLOGIES'
+    sources = (['CHANNEL{}'.format(i) for i in range(1, 5)] +
+               ['FUNCTION{}'.format(i) for i in range(1, 17)] +
+               ['WMEMORY{}'.format(i) for i in range(1, 5)])
+    commands = dict(Instrument.commands, **{
+        'WAVEFORM:FORMAT': '_waveform_format',
+        'WAVEFORM:BYTEORDER': '_waveform_byteorder',
+        'WAVEFORM:SOURCE': '_waveform_source',
+        'WAVEFORM:PREAMBLE?': '_waveform_preamble',
+        'WAVEFORM:DATA?': '_waveform_data',
+        'ACQUIRE:MODE?': '_acquire_mode',
+        'ACQUIRE:AVERAGE?': '_acquire_average',
+        'DISPLAY:DATA?': '_display_data',
+        '<SOURCE>:DISPLAY?': '_source_display',
+    })
+
+    # preamble codes of the transfer formats
+    FORMATS = {'BYTE': 1, 'WORD': 2}
+    x_increment = 1e-9
+    y_increment = 1e-4
+
+    def __init__(self, model=None, points=1000, latency=None,
+                 bandwidth=None):
+        Instrument.__init__(self, model, points, latency, bandwidth)
+        self.acquire_mode = 'RTIM'
+        self.waveform_format = 'WORD'
+        self.byteorder = 'MSBFIRST'
+        self.source = 'CHANNEL1'
+
+    def _waveform_format(self, args):
+        self.waveform_format = args.upper()
+
+    def _waveform_byteorder(self, args):
+        self.byteorder = args.upper()
+
+    def _waveform_source(self, args):
+        self.source = args.upper()
+
+    def _waveform_preamble(self, args):
+        y_increment = self.y_increment
+        if self.waveform_format == 'BYTE':
+            y_increment *= 256
+        return ('{},1,{},1,{:e},{:e},0,{:e},0,0,3,{:e},{:e},8.0,0,'
+                '"1 JAN 2026","00:00:00:00","{}:SIM0001",1,100,2,1,16e9,0'
+                .format(self.FORMATS.get(self.waveform_format, 0),
+                        self.points, self.x_increment,
+                        -(self.points // 2) * self.x_increment, y_increment,
+                        self.points * self.x_increment,
+                        -(self.points // 2) * self.x_increment, self.model))
+
+    def _waveform_data(self, args):
+        samples = self.samples(self.source)
+        if args:
+            # start is one based, the size defaults to the rest
+            fields = [int(f) for f in args.split(',')]
+            start = fields[0] - 1
+            stop = start + fields[1] if len(fields) > 1 else None
+            samples = samples[start:stop]
+
+        if self.waveform_format == 'BYTE':
+            data = (samples >> 8).astype('i1')
+        elif self.byteorder == 'LSBFIRST':
+            data = samples.astype('<i2')
+        else:
+            data = samples.astype('>i2')
+        return _block(data.tobytes())
+
+    def _acquire_mode(self, args):
+        return self.acquire_mode
+
+    def _acquire_average(self, args):
+        return '0'
+
+    def _display_data(self, args):
+        return _block(self.screenshot_data(args.upper() or 'PNG'))
+
+    def _source_display(self, source):
+        return '1'
+
+
+class MsoInstrument(Instrument):
+    """A Tektronix MSO5/6 series oscilloscope."""
+    model = 'MSO58'
+    manufacturer = 'TEKTRONIX'
+    commands = dict(Instrument.commands, **{
+        'HORIZONTAL:RECORDLENGTH?': '_record_length',
+        'DATA:SOURCE': '_data_source',
+        'DATA:START': '_data_start',
+        'DATA:STOP': '_data_stop',
+        'WFMOUTPRE:BYT_NR': '_byt_nr',
+        'WFMOUTPRE:BYT_NR?': '_byt_nr_query',
+        'WFMOUTPRE:NR_PT?': '_nr_pt',
+        'WFMOUTPRE:XINCR?': '_xincr',
+        'WFMOUTPRE:XZERO?': '_xzero',
+        'WFMOUTPRE:PT_OFF?': '_zero',
+        'WFMOUTPRE:YMULT?': '_ymult',
+        'WFMOUTPRE:YZERO?': '_zero',
+        'WFMOUTPRE:YOFF?': '_zero',
+        'CURVE?': '_curve',
+        'SAVE:IMAGE': '_save_image',
+        'SAVE:WAVEFORM': '_save_waveform',
+        'SAVE:WAVEFORM:SOURCELIST?': '_source_list',
+        'FILESYSTEM:READFILE': '_read_file',
+        'FILESYSTEM:DELETE': '_delete_file',
+        'HARDCOPY:FORMAT': '_hardcopy_format',
+        'HARDCOPY': '_hardcopy',
+    })
+
+    x_increment = 1e-9
+    y_increment = 1e-4
+
+    def __init__(self, model=None, points=1000, latency=None,
+                 bandwidth=None):
+        Instrument.__init__(self, model, points, latency, bandwidth)
+        # the last digit of the model is the number of channels
+        self.sources = (['CH{}'.format(i)
+                         for i in range(1, int(self.model[-1]) + 1)] +
+                        ['MATH{}'.format(i) for i in range(1, 5)])
+        self.data_sources = ['CH1']
+        self.start = 1
+        self.stop = points
+        self.byt_nr = 1
+        self.hardcopy_format = 'PNG'
+
+    def _record_length(self, args):
+        return str(self.points)
+
+    def _data_source(self, args):
+        self.data_sources = [s.strip().upper() for s in args.split(',')]
+
+    def _data_start(self, args):
+        self.start = int(args)
+
+    def _data_stop(self, args):
+        self.stop = int(args)
+
+    def _byt_nr(self, args):
+        self.byt_nr = int(args)
+
+    def _byt_nr_query(self, args):
+        return str(self.byt_nr)
+
+    def _nr_pt(self, args):
+        return str(min(self.stop, self.points) - self.start + 1)
+
+    def _xincr(self, args):
+        return '{:e}'.format(self.x_increment)
+
+    def _xzero(self, args):
+        return '{:e}'.format(-(self.points // 2) * self.x_increment)
+
+    def _ymult(self, args):
+        y_increment = self.y_increment
+        if self.byt_nr == 1:
+            y_increment *= 256
+        return '{:e}'.format(y_increment)
+
+    def _zero(self, args):
+        return '0'
+
+    def _curve(self, args):
+        blocks = list()
+        for source in self.data_sources:
+            samples = self.samples(source)[self.start - 1:self.stop]
+            if self.byt_nr == 1:
+                data = (samples >> 8).astype('i1')
+            else:
+                data = samples.astype('<i2')
+            blocks.append(_block(data.tobytes()))
+        return b';'.join(blocks)
+
+    def _save_image(self, args):
+        filename = _unquote(args)
+        image_type = 'BMP' if filename.lower().endswith('.bmp') else 'PNG'
+        self.files[filename] = self.screenshot_data(image_type)
+
+    def _save_waveform(self, args):
+        (source, _, filename) = args.partition(',')
+        self.files[_unquote(filename)] = wfm_file(
+                self.samples(source.strip().upper()), self.y_increment, 0,
+                self.x_increment, -(self.points // 2) * self.x_increment)
+
+    def _source_list(self, args):
+        return ','.join(self.sources)
+
+    def _read_file(self, args):
+        filename = _unquote(args)
+        if filename not in self.files:
+            logging.warning('simulator: no file {}'.format(filename))
+            return None
+        return RawResponse(self.files[filename])
+
+    def _delete_file(self, args):
+        self.files.pop(_unquote(args), None)
+
+    def _hardcopy_format(self, args):
+        self.hardcopy_format = args.upper()
+
+    def _hardcopy(self, args):
+        if args.upper() == 'START':
+            return RawResponse(self.screenshot_data(self.hardcopy_format))
+
+
+# simulated instrument of each model
+PERSONALITIES = {
+    'DSOX91604A': InfiniiumInstrument,
+    'MSO54': MsoInstrument,
+    'MSO56': MsoInstrument,
+    'MSO58': MsoInstrument,
+    'MSO64': MsoInstrument,
+}
+
+
+def create_instrument(model='DSOX91604A', **kwargs):
+    """Return the simulated instrument of the model."""
+    return PERSONALITIES[model](model, **kwargs)
+
+
+class _ScpiHandler(socketserver.StreamRequestHandler):
+    chunk_size = 64 * 1024
+
+    def handle(self):
+        for line in self.rfile:
+            instrument = self.server.instrument
+            response = instrument.query(line.decode())
+            if response is None:
+                continue
+            for start in range(0, len(response), self.chunk_size):
+                chunk = response[start:start + self.chunk_size]
+                instrument.throttle(len(chunk))
+                self.wfile.write(chunk)
+
+
+class ScpiServer(socketserver.ThreadingTCPServer):
+    """Serve the instrument on a raw SCPI socket."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, instrument, address=('127.0.0.1', 5025)):
+        socketserver.ThreadingTCPServer.__init__(self, address, _ScpiHandler)
+        self.instrument = instrument
+
+
+class _RpcHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.packer = vxi11.Packer()
+        self.unpacker = vxi11.Unpacker(b'')
+        self.output = bytearray()
+
+    def handle(self):
+        while True:
+            try:
+                call = rpc.recvrecord(self.request)
+            except (EOFError, OSError):
+                return
+            self.unpacker.reset(call)
+            xid, prog, vers, proc, cred, verf = self.unpacker.unpack_callheader()
+            self.packer.reset()
+            self.packer.pack_replyheader(xid, verf)
+            getattr(self, 'handle_{}'.format(proc))()
+            rpc.sendrecord(self.request, self.packer.get_buf())
+
+
+class _Vxi11CoreHandler(_RpcHandler):
+    max_recv_size = 1024 * 1024
+
+    def handle_10(self):  # create_link
+        self.unpacker.unpack_create_link_parms()
+        self.packer.pack_create_link_resp(
+                (vxi11.ERR_NO_ERROR, 1, 0, self.max_recv_size))
+
+    def handle_11(self):  # device_write
+        link, timeout, lock_timeout, flags, data = \
+                self.unpacker.unpack_device_write_parms()
+        response = self.server.instrument.query(data.decode())
+        if response is not None:
+            self.output = bytearray(response)
+        self.packer.pack_device_write_resp((vxi11.ERR_NO_ERROR, len(data)))
+
+    def handle_12(self):  # device_read
+        link, request_size, timeout, lock_timeout, flags, term_char = \
+                self.unpacker.unpack_device_read_parms()
+        if not self.output:
+            # like an instrument with nothing to send
+            time.sleep(timeout / 1000.0)
+            self.packer.pack_device_read_resp(
+                    (vxi11.ERR_IO_TIMEOUT, vxi11.RX_END, b''))
+            return
+        data = bytes(self.output[:request_size])
+        del self.output[:request_size]
+        self.server.instrument.throttle(len(data))
+        reason = vxi11.RX_REQCNT if self.output else vxi11.RX_END
+        self.packer.pack_device_read_resp((vxi11.ERR_NO_ERROR, reason, data))
+
+    def handle_23(self):  # destroy_link
+        self.unpacker.unpack_device_link()
+        self.packer.pack_device_error(vxi11.ERR_NO_ERROR)
+
+
+class Vxi11Server(socketserver.ThreadingTCPServer):
+    """Serve the instrument on a VXI-11 core channel."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, instrument, address=('127.0.0.1', 0)):
+        socketserver.ThreadingTCPServer.__init__(self, address,
+                                                 _Vxi11CoreHandler)
+        self.instrument = instrument
+
+
+class _PortmapperHandler(_RpcHandler):
+    def handle_0(self):  # null
+        pass
+
+    def handle_3(self):  # getport
+        (prog, vers, prot, port) = [self.unpacker.unpack_uint()
+                                    for _ in range(4)]
+        self.packer.pack_uint(self.server.ports.get(prog, 0))
+
+
+class PortmapperServer(socketserver.ThreadingTCPServer):
+    """A portmapper which only knows the VXI-11 core channel.
+
+    ports maps RPC program numbers to their TCP ports.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, ports, address=('127.0.0.1', rpc.PMAP_PORT)):
+        socketserver.ThreadingTCPServer.__init__(self, address,
+                                                 _PortmapperHandler)
+        self.ports = ports
+
+
+def serve_in_background(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated oscilloscope.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--model', default='DSOX91604A',
+                        choices=sorted(PERSONALITIES))
+    parser.add_argument('--scpi-port', type=int, default=5025)
+    parser.add_argument('--vxi11-port', type=int, default=9009)
+    parser.add_argument('--portmapper-port', type=int, default=rpc.PMAP_PORT,
+                        help='0 disables the portmapper')
+    parser.add_argument('--points', type=int, default=1000,
+                        help='record length')
+    parser.add_argument('--latency', type=float,
+                        help='seconds each message takes')
+    parser.add_argument('--bandwidth', type=float,
+                        help='bytes per second of the responses')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.INFO)
+
+    instrument = create_instrument(args.model, points=args.points,
+                                   latency=args.latency,
+                                   bandwidth=args.bandwidth)
+    vxi11_server = Vxi11Server(instrument, (args.host, args.vxi11_port))
+    serve_in_background(vxi11_server)
+    if args.portmapper_port:
+        portmapper = PortmapperServer(
+                {vxi11.DEVICE_CORE_PROG: vxi11_server.server_address[1]},
+                (args.host, args.portmapper_port))
+        serve_in_background(portmapper)
+    scpi_server = ScpiServer(instrument, (args.host, args.scpi_port))
+    logging.info('simulator: {} with VXI-11 core channel on port {}, SCPI on '
+                 'port {}'.format(instrument.model,
+                                  vxi11_server.server_address[1],
+                                  args.scpi_port))
+    scpi_server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import math
+import numpy
+import operator
+
+from collections import namedtuple
+
+from osccap.errors import NoDataAvailable
+
+# samples start (inclusive) to stop (exclusive) of a record, None is the
+# start or end of the record
+SampleWindow = namedtuple('SampleWindow', 'start stop')
+
+# all samples between the times start and stop (in seconds, inclusive)
+TimeWindow = namedtuple('TimeWindow', 'start stop')
+
+# tolerance in samples when a time window is converted to sample indices
+_WINDOW_TOLERANCE = 1e-6
+
+
+class Waveform(object):
+    """The raw samples of one source together with their scaling.
+
+    The physical value of a sample is raw * increment + offset. The
+    conversion is done lazily: indexing or slicing only converts the
+    selected samples, numpy.asarray() converts the whole waveform.
+    """
+
+    def __init__(self, raw, increment, offset):
+        self.raw = raw
+        self.increment = increment
+        self.offset = offset
+
+    def __repr__(self):
+        return 'Waveform({} points, {}, increment={}, offset={})'.format(
+                len(self.raw), self.raw.dtype, self.increment, self.offset)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.scaled(key)
+        return float(self.raw[key]) * self.increment + self.offset
+
+    def __array__(self, dtype=None, copy=None):
+        return self.scaled(dtype=numpy.float64 if dtype is None else dtype)
+
+    def scaled(self, key=slice(None), dtype=numpy.float64):
+        """Return the samples selected by key in physical units.
+
+        Only one array of the requested dtype is allocated, the scaling is
+        done in place.
+        """
+        waveform = self.raw[key].astype(dtype)
+        waveform *= self.increment
+        waveform += self.offset
+        return waveform
+
+    def chunks(self, size, dtype=numpy.float64):
+        """Iterate over the waveform in physical units, size samples at a
+        time."""
+        for start in range(0, len(self.raw), size):
+            yield self.scaled(slice(start, start + size), dtype)
+
+    def window(self, first, count):
+        """Return the Waveform of count samples starting at sample first.
+
+        The raw samples are not copied."""
+        return Waveform(self.raw[first:first+count], self.increment,
+                        self.offset)
+
+    def value_table(self, dtype=numpy.float64):
+        """Return (codes, values) of all possible raw sample values.
+
+        This is used to format each distinct value only once.
+        """
+        info = numpy.iinfo(self.raw.dtype)
+        codes = numpy.arange(info.min, info.max + 1).astype(self.raw.dtype)
+        return (codes, Waveform(codes, self.increment, self.offset)
+                .scaled(dtype=dtype))
+
+
+class TimeAxis(object):
+    """The time of each sample, t0 + i * dt for i in range(n).
+
+    Like a Waveform, the axis is computed lazily on indexing, slicing or
+    numpy.asarray() and is never held in memory as a whole unless asked
+    to.
+    """
+
+    def __init__(self, t0, dt, n):
+        self.t0 = t0
+        self.dt = dt
+        self.n = n
+
+    def __repr__(self):
+        return 'TimeAxis(t0={}, dt={}, n={})'.format(self.t0, self.dt, self.n)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.scaled(key)
+        index = operator.index(key)
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError('time axis index out of range')
+        return index * self.dt + self.t0
+
+    def __array__(self, dtype=None, copy=None):
+        return self.scaled(dtype=numpy.float64 if dtype is None else dtype)
+
+    def scaled(self, key=slice(None), dtype=numpy.float64):
+        """Return the times of the samples selected by key."""
+        axis = numpy.arange(*key.indices(self.n), dtype=dtype)
+        axis *= self.dt
+        axis += self.t0
+        return axis
+
+    def chunks(self, size, dtype=numpy.float64):
+        """Iterate over the axis, size samples at a time."""
+        for start in range(0, self.n, size):
+            yield self.scaled(slice(start, start + size), dtype)
+
+    def window(self, first, count):
+        """Return the TimeAxis of count samples starting at sample first."""
+        return TimeAxis(self[first], self.dt, count)
+
+    def window_points(self, window):
+        """Return (first, count) of the samples within a SampleWindow or
+        TimeWindow, clipped to the axis."""
+        if isinstance(window, TimeWindow):
+            first = math.ceil((window.start - self.t0) / self.dt -
+                              _WINDOW_TOLERANCE)
+            stop = math.floor((window.stop - self.t0) / self.dt +
+                              _WINDOW_TOLERANCE) + 1
+        else:
+            (first, stop) = window
+            first = 0 if first is None else first
+            stop = self.n if stop is None else stop
+
+        first = max(first, 0)
+        stop = min(stop, self.n)
+        if stop <= first:
+            raise ValueError('{} is outside of the record'.format(window))
+        return (first, stop - first)
+
+
+def time_info(preamble):
+    """Return the TimeAxis of a waveform and the format of its times.
+
+    preamble has the fields points, x_increment, x_origin and x_reference,
+    the time of sample i is (i - x_reference) * x_increment + x_origin.
+    """
+
+    points = preamble.points
+    delta_t = preamble.x_increment
+    t_start = preamble.x_origin - preamble.x_reference * delta_t
+
+    logging.debug('points={} delta_t={} t_start={}'.format(points, delta_t, t_start))
+
+    if delta_t == 0.0:
+        raise NoDataAvailable()
+
+    # round t_start to the nearest multiple of delta_t, flooring would
+    # shift the axis by a whole sample if the division comes out just
+    # below an integer, e.g. 2.9999999
+    t_start = round(t_start / delta_t) * delta_t
+
+    t_end = t_start + points * delta_t
+
+    # determine the precision of the mantisse for the format output
+    mantisse_corner = math.floor( \
+            math.log(max(abs(t_start),abs(t_end)),10))
+    mantisse_delta_t = len(("%e" % delta_t).split('e')[0].rstrip('0')) - \
+            2 - math.floor(math.log(delta_t,10))
+    mantisse_time = str(mantisse_corner + mantisse_delta_t)
+
+    time_fmt = '%.{}e'.format(mantisse_time)
+
+    logging.debug('TIME t_start={} t_end={} delta_t={} time_format={}'
+                  .format(t_start, t_end, delta_t, time_fmt))
+
+    return (TimeAxis(t_start, delta_t, points), time_fmt)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reader for Tektronix .wfm (WFM#003) waveform files.
+
+Only the fields needed to scale the first frame of the curve buffer are
+parsed. The samples are not copied: they are a view into the file
+contents or a memory map of the file.
+"""
+
+import numpy
+import struct
+
+from osccap.waveform import TimeAxis, Waveform
+
+WFM_VERSION = b':WFM#003'
+
+# byte order marker at the start of the file
+_BYTE_ORDERS = {
+    b'\x0f\x0f': '<',
+    b'\xf0\xf0': '>',
+}
+
+# offset and struct format of the header fields
+_FIELDS = (
+    ('version', 2, '8s'),
+    ('bytes_per_point', 15, 'B'),
+    ('curve_offset', 16, 'i'),
+    ('frames', 72, 'I'),            # number of FastFrames - 1
+    ('y_scale', 168, 'd'),
+    ('y_offset', 176, 'd'),
+    ('format', 240, 'i'),
+    ('x_scale', 488, 'd'),
+    ('x_start', 496, 'd'),
+    ('trigger_fraction', 788, 'd'),
+    ('data_start', 822, 'I'),
+    ('postcharge_start', 826, 'I'),
+)
+
+# size of the header up to the last parsed field
+HEADER_SIZE = 830
+
+# numpy dtype of each curve buffer format
+_DTYPES = {
+    0: 'i2',
+    1: 'i4',
+    2: 'u4',
+    3: 'u8',
+    4: 'f4',
+    5: 'f8',
+    6: 'u1',
+    7: 'i1',
+}
+
+
+class WfmFile(object):
+    """A parsed .wfm file.
+
+    The sample value is raw * y_scale + y_offset, the time of sample i is
+    x_start + i * x_scale.
+    """
+
+    def __init__(self, header, raw):
+        self.__dict__.update(header)
+        self.raw = raw
+
+    @property
+    def points(self):
+        return len(self.raw)
+
+    @property
+    def waveform(self):
+        return Waveform(self.raw, self.y_scale, self.y_offset)
+
+    @property
+    def time_axis(self):
+        return TimeAxis(self.x_start, self.x_scale, len(self.raw))
+
+
+def parse_wfm_header(data):
+    """Parse the header from the first HEADER_SIZE bytes of a .wfm file."""
+    if len(data) < HEADER_SIZE:
+        raise ValueError('short .wfm header, {} bytes'.format(len(data)))
+    try:
+        byte_order = _BYTE_ORDERS[bytes(data[0:2])]
+    except KeyError:
+        raise ValueError('invalid .wfm byte order marker {!r}'
+                         .format(bytes(data[0:2])))
+
+    header = dict((name, struct.unpack_from(byte_order + fmt, data, offset)[0])
+                  for (name, offset, fmt) in _FIELDS)
+    if header['version'] != WFM_VERSION:
+        raise ValueError('unsupported .wfm version {!r}'
+                         .format(header['version']))
+    try:
+        dtype = numpy.dtype(_DTYPES[header['format']])
+    except KeyError:
+        raise ValueError('unsupported .wfm curve format {}'
+                         .format(header['format']))
+    if dtype.itemsize != header['bytes_per_point']:
+        raise ValueError('.wfm curve format {} with {} bytes per point'
+                         .format(header['format'], header['bytes_per_point']))
+
+    header['byte_order'] = byte_order
+    header['dtype'] = dtype.newbyteorder(byte_order)
+    return header
+
+
+def _curve_location(header):
+    """Return the offset and number of points of the first frame."""
+    offset = header['curve_offset'] + header['data_start']
+    points = ((header['postcharge_start'] - header['data_start']) //
+              header['bytes_per_point'])
+    return (offset, points)
+
+
+def parse_wfm(data):
+    """Parse the contents of a .wfm file, e.g. as read from the scope.
+
+    The samples are a view into data.
+    """
+    header = parse_wfm_header(data)
+    (offset, points) = _curve_location(header)
+    raw = numpy.frombuffer(data, dtype=header['dtype'], count=points,
+                           offset=offset)
+    return WfmFile(header, raw)
+
+
+def load_wfm(filename, mmap=True):
+    """Load a .wfm file.
+
+    If mmap is true, the samples are memory mapped instead of read.
+    """
+    if not mmap:
+        with open(filename, 'rb') as f:
+            return parse_wfm(f.read())
+
+    with open(filename, 'rb') as f:
+        header = parse_wfm_header(f.read(HEADER_SIZE))
+    (offset, points) = _curve_location(header)
+    raw = numpy.memmap(filename, dtype=header['dtype'], mode='r',
+                       offset=offset, shape=(points,))
+    return WfmFile(header, raw)
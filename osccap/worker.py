@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# Capture screenshots from DSOs
+# Copyright (c) 2011 Michael Walle
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A queue which runs the captures of the tray application.
+
+The captures run on a single worker thread, so the UI thread never waits
+for a scope. This module doesn't depend on wx, the results are passed to
+callbacks which are called on the worker thread.
+"""
+
+import collections
+import logging
+import threading
+
+from osccap.errors import CaptureCancelled
+
+
+class CaptureJob(object):
+    """A capture waiting in the queue or running."""
+
+    def __init__(self, key, fct, args):
+        self.key = key
+        self.fct = fct
+        self.args = args
+        self.cancelled = threading.Event()
+        self.result = None
+        self.error = None
+
+    def __repr__(self):
+        return 'CaptureJob({!r})'.format(self.key)
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class CaptureQueue(threading.Thread):
+    """Run the submitted captures one after another.
+
+    A capture is identified by its key, e.g. ('clipboard', scope).
+    Submitting a key which is already waiting or running returns the
+    pending job instead of queueing the same capture twice.
+
+    callback(job) is called when a job has finished, job.error is the
+    exception if it failed. state_callback(pending) is called whenever the
+    number of waiting and running jobs changes.
+    """
+
+    def __init__(self, callback=None, state_callback=None):
+        threading.Thread.__init__(self, name='osccap-capture')
+        self.daemon = True
+        self.callback = callback
+        self.state_callback = state_callback
+        # set here, so a stop() before the thread runs isn't lost
+        self.running = True
+        self.current = None
+        self._jobs = collections.deque()
+        self._cond = threading.Condition()
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._jobs) + (self.current is not None)
+
+    def _notify_state(self):
+        if self.state_callback is not None:
+            try:
+                self.state_callback(self.pending)
+            except Exception:
+                logging.exception('capture state callback failed')
+
+    def submit(self, key, fct, *args):
+        """Queue fct(*args) unless a job with the same key is pending."""
+        with self._cond:
+            for job in ([self.current] if self.current else []) + \
+                    list(self._jobs):
+                if job.key == key and not job.cancelled.is_set():
+                    logging.debug('capture: coalesced {}'.format(job))
+                    return job
+            job = CaptureJob(key, fct, args)
+            self._jobs.append(job)
+            self._cond.notify()
+        self._notify_state()
+        return job
+
+    def cancel(self, key=None):
+        """Cancel the pending jobs with the given key, or all of them.
+
+        Waiting jobs are dropped, a running job is asked to stop and has to
+        call check_cancelled() to do so.
+        """
+        with self._cond:
+            jobs = list(self._jobs)
+            if self.current is not None:
+                jobs.append(self.current)
+            for job in jobs:
+                if key is None or job.key == key:
+                    job.cancel()
+            self._jobs = collections.deque(j for j in self._jobs
+                                           if not j.cancelled.is_set())
+        self._notify_state()
+
+    def check_cancelled(self):
+        """Raise CaptureCancelled if the running job was cancelled.
+
+        Must be called while the job runs, e.g. in a progress callback or
+        on a thread the job waits for.
+        """
+        job = self.current
+        if job is not None and job.cancelled.is_set():
+            raise CaptureCancelled()
+
+    def _run_job(self, job):
+        try:
+            job.result = job.fct(*job.args)
+        except CaptureCancelled as e:
+            logging.info('capture: cancelled {}'.format(job))
+            job.error = e
+        except Exception as e:
+            logging.exception('capture: {} failed'.format(job))
+            job.error = e
+
+        if self.callback is not None:
+            try:
+                self.callback(job)
+            except Exception:
+                logging.exception('capture callback failed')
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self.running and not self._jobs:
+                    self._cond.wait()
+                if not self.running:
+                    break
+                self.current = self._jobs.popleft()
+
+            self._run_job(self.current)
+
+            with self._cond:
+                self.current = None
+            self._notify_state()
+
+    def stop(self):
+        """Cancel all jobs and stop the worker thread."""
+        self.cancel()
+        with self._cond:
+            self.running = False
+            self._cond.notify()
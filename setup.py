@@ -49,4 +49,7 @@ setup(name=name,
       packages=find_packages(),
       package_data={'osccap': ['data/*.png', 'data/osccap.ico']},
       scripts=['osccap_postinstall.py'],
+      entry_points={
+          'console_scripts': ['osccap = osccap.cli:main'],
+      },
 )
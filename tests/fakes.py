@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+class FakeDevice(object):
+    """A transport which replays canned responses.
+
+    Every query (a message whose header ends with '?') consumes the next
+    response.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.written = list()
+        self.timeout = 10
+        self._current = b''
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, message):
+        self.written.append(message)
+        if message.split(';')[-1].split()[0].endswith('?'):
+            response = self.responses.pop(0)
+            if isinstance(response, str):
+                response = response.encode() + b'\n'
+            self._current = bytearray(response)
+
+    def readinto(self, view):
+        n = min(len(view), len(self._current))
+        view[:n] = self._current[:n]
+        del self._current[:n]
+        return n
+
+    def read_raw(self):
+        data, self._current = bytes(self._current), bytearray()
+        return data
+
+    def read_raw_file(self):
+        return self.read_raw()
+
+    def read(self):
+        return self.read_raw().decode().rstrip('\r\n')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import tempfile
+import time
+
+from mock import MagicMock, patch
+from nose.tools import eq_
+
+from osccap.capture import capture_all
+from osccap.errors import CaptureCancelled
+
+
+def _scope(name, delay=0, error=None):
+    scope = MagicMock()
+    scope.name = name
+    scope.host = name
+    scope.selected_sources = []
+
+    def take_screenshot(image_format='png'):
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return b'png'
+    scope.take_screenshot.side_effect = take_screenshot
+    return scope
+
+
+def test_capture_all():
+    scopes = [_scope('osc01', 0.3), _scope('osc02', 0.3),
+              _scope('osc03', error=IOError('broken')),
+              _scope('osc04', delay=2)]
+
+    directory = tempfile.mkdtemp()
+    start = time.monotonic()
+    (bundle, results) = capture_all(scopes, directory, timeout=1)
+    elapsed = time.monotonic() - start
+
+    # all captures run concurrently
+    eq_(elapsed < 1.5, True)
+
+    errors = dict((r.scope.name, r.error) for r in results)
+    eq_(errors['osc01'], None)
+    eq_(errors['osc02'], None)
+    eq_('broken' in errors['osc03'], True)
+    eq_(errors['osc04'], 'timeout')
+
+    eq_(os.path.exists(os.path.join(bundle, 'osc01.png')), True)
+    with open(os.path.join(bundle, 'report.json')) as f:
+        report = json.load(f)
+    eq_(report['osc02']['ok'], True)
+    eq_(report['osc04']['ok'], False)
+
+
+def test_capture_all_same_second():
+    directory = tempfile.mkdtemp()
+    bundles = [capture_all([_scope('osc01')], directory)[0]
+               for _ in range(3)]
+    eq_(len(set(bundles)), 3)
+    for bundle in bundles:
+        eq_(os.path.exists(os.path.join(bundle, 'report.json')), True)
+
+
+def test_capture_all_late_files():
+    scopes = [_scope('osc01', delay=0.5)]
+    directory = tempfile.mkdtemp()
+    (bundle, results) = capture_all(scopes, directory, timeout=0.1)
+    eq_(results[0].error, 'timeout')
+
+    time.sleep(1)
+    with open(os.path.join(bundle, 'report.json')) as f:
+        report = json.load(f)
+    eq_(report['osc01']['files'], [])
+    eq_(report['osc01']['late_files'], ['osc01.png'])
+
+
+def test_capture_all_cancelled():
+    scopes = [_scope('osc01'), _scope('osc02')]
+    scopes[0].selected_sources = ['CHANNEL1']
+    cancelled = [False]
+
+    def check_cancelled():
+        if cancelled[0]:
+            raise CaptureCancelled()
+    # cancel once the screenshot was taken
+    scopes[0].take_screenshot.side_effect = \
+            lambda image_format: cancelled.__setitem__(0, True) or b'png'
+
+    directory = tempfile.mkdtemp()
+    (bundle, results) = capture_all(scopes, directory, waveform_fmt='npz',
+                                    check_cancelled=check_cancelled,
+                                    max_workers=1)
+    errors = dict((r.scope.name, r.error) for r in results)
+    eq_(errors, {'osc01': 'cancelled', 'osc02': 'cancelled'})
+    eq_(sorted(os.listdir(bundle)), ['report.json'])
+
+
+@patch('osccap.capture.save_waveform_to_file',
+       side_effect=IOError('broken'))
+def test_capture_all_error_keeps_files(save_waveform_to_file):
+    scopes = [_scope('osc01')]
+    scopes[0].selected_sources = ['CHANNEL1']
+    directory = tempfile.mkdtemp()
+    (bundle, results) = capture_all(scopes, directory, waveform_fmt='npz')
+    eq_('broken' in results[0].error, True)
+    eq_(results[0].files, [os.path.join(bundle, 'osc01.png')])
+    with open(os.path.join(bundle, 'report.json')) as f:
+        report = json.load(f)
+    eq_(report['osc01']['files'], ['osc01.png'])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import tempfile
+
+from mock import MagicMock, patch
+from nose.tools import eq_, raises
+
+from osccap import cli
+
+
+def _config():
+    config = MagicMock()
+    config.scopes = []
+    config.image_format = 'png'
+    config.metrics_port = None
+    config.trace_file = None
+    return config
+
+
+def test_cli_capture():
+    directory = tempfile.mkdtemp()
+    screenshot = os.path.join(directory, 'out.bmp')
+    waveform = os.path.join(directory, 'out.npz')
+    scope = MagicMock()
+    scope.take_screenshot.return_value = b'BM'
+
+    with patch('osccap.cli.get_configuration', return_value=_config()), \
+            patch('osccap.cli.Oscilloscope', return_value=scope), \
+            patch('osccap.export.save_waveform_to_file') as save:
+        eq_(cli.main(['capture', '--host', 'osc01', '--screenshot',
+                      screenshot, '--waveform', waveform, '--sources',
+                      'CHANNEL1,CHANNEL2']), 0)
+
+    scope.take_screenshot.assert_called_with(image_format='bmp')
+    with open(screenshot, 'rb') as f:
+        eq_(f.read(), b'BM')
+    eq_(scope.selected_sources, ['CHANNEL1', 'CHANNEL2'])
+    save.assert_called_with(scope, waveform, 'npz')
+    eq_(scope.close.called, True)
+
+
+@raises(SystemExit)
+def test_cli_capture_unknown_scope():
+    with patch('osccap.cli.get_configuration', return_value=_config()):
+        cli.main(['capture', '--scope', 'osc99', '--screenshot', 'out.png'])
+
+
+def test_cli_capture_unknown_formats():
+    for argv in (['--screenshot', 'out.jpeg'], ['--waveform', 'out.txt'],
+                 ['--waveform', 'out.csv', '--format', 'xls']):
+        with patch('osccap.cli.get_configuration') as get_configuration:
+            try:
+                cli.main(['capture', '--host', 'osc01'] + argv)
+            except SystemExit as e:
+                # argparse usage error
+                eq_(e.code, 2)
+            eq_(get_configuration.called, False)
+
+
+def test_cli_trace():
+    directory = tempfile.mkdtemp()
+    screenshot = os.path.join(directory, 'out.png')
+    trace = os.path.join(directory, 'trace.json')
+    scope = MagicMock()
+    scope.take_screenshot.return_value = b'PNG'
+
+    with patch('osccap.cli.get_configuration', return_value=_config()), \
+            patch('osccap.cli.Oscilloscope', return_value=scope):
+        eq_(cli.main(['--trace', trace, 'capture', '--host', 'osc01',
+                      '--screenshot', screenshot]), 0)
+
+    with open(trace) as f:
+        eq_(json.load(f), [{}])
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import tempfile
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_
+
+from osccap import config
+
+
+def _load(text):
+    if sys.platform.startswith('win'):
+        raise SkipTest('the ini file is only used on Linux')
+    directory = tempfile.mkdtemp()
+    try:
+        settings = config.ConfigSettingsLinux()
+        settings.filename = os.path.join(directory, 'osccaprc')
+        with open(settings.filename, 'w') as f:
+            f.write(text)
+        settings.load()
+    finally:
+        shutil.rmtree(directory)
+    return settings
+
+
+def test_image_formats():
+    settings = _load('[global]\nimage_format = JPG\n'
+                     '[scope_osc01]\nhost = osc01\nscreenshot_format = bmp\n')
+    eq_(settings.image_format, 'jpg')
+    eq_(settings.scopes[0].screenshot_format, 'bmp')
+
+
+def test_unknown_image_formats():
+    settings = _load('[global]\nimage_format = svg\n'
+                     '[scope_osc01]\nhost = osc01\nscreenshot_format = tiff\n')
+    eq_(settings.image_format, 'png')
+    eq_(settings.scopes[0].screenshot_format, 'png')
+
+
+def test_boolean():
+    settings = config.ConfigSettings()
+    for value in ('0', 0, 'no', 'False', 'off', '', 'maybe'):
+        eq_(settings._boolean(value, 'hardcopy'), False)
+    for value in ('1', 1, ' yes ', 'True', 'on'):
+        eq_(settings._boolean(value, 'hardcopy'), True)
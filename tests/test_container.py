@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import os
+import tempfile
+
+from nose.tools import eq_, raises
+
+from osccap.container import (ContainerWriter, load_container,
+                              save_container)
+from osccap.oscilloscope.agilent import Preamble
+from osccap.waveform import Waveform
+
+
+def test_container_roundtrip():
+    preamble = Preamble(format=2, type=0, points=4, count=1,
+                        x_increment=1e-9, x_origin=-2e-9, x_reference=0,
+                        y_increment=0.5, y_origin=1.0, y_reference=0)
+    raw = numpy.array([-2, -1, 0, 1], dtype='>i2')
+    filename = os.path.join(tempfile.mkdtemp(), 'waveform.npz')
+    save_container(filename, ['KEYSIGHT TECHNOLOGIES', 'DSOX91604A'],
+                   {'CHANNEL1': Waveform(raw, 0.5, 1.0)}, {'CHANNEL1': preamble})
+
+    container = load_container(filename)
+    eq_(container.sources, ['CHANNEL1'])
+    eq_(container.meta['idn'][1], 'DSOX91604A')
+    eq_(container.meta['sources']['CHANNEL1']['dtype'], '>i2')
+    eq_(isinstance(container.raw['CHANNEL1'], numpy.memmap), True)
+    eq_(container.raw['CHANNEL1'].dtype, numpy.dtype('>i2'))
+    eq_(list(container.waveform('CHANNEL1')), [0.0, 0.5, 1.0, 1.5])
+    eq_(numpy.allclose(container.time_array(), [-2e-9, -1e-9, 0.0, 1e-9]),
+        True)
+
+    # it is a plain npz file
+    with numpy.load(filename) as npz:
+        eq_(list(npz['CHANNEL1']), [-2, -1, 0, 1])
+
+
+@raises(ValueError)
+def test_save_container_no_sources():
+    save_container(os.path.join(tempfile.mkdtemp(), 'empty.npz'), None,
+                   {}, {})
+
+
+@raises(ValueError)
+def test_container_writer_no_sources():
+    ContainerWriter(os.path.join(tempfile.mkdtemp(), 'empty.npz'), None, {})
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import os
+import tempfile
+
+from nose.tools import eq_, raises
+
+from osccap.container import load_container
+from osccap.errors import CaptureCancelled
+from osccap.export import save_waveform_to_file, write_csv
+from osccap.oscilloscope.agilent import Preamble
+from osccap.waveform import TimeAxis, Waveform
+
+
+def _read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def test_write_csv_matches_savetxt():
+    directory = tempfile.mkdtemp()
+    time_array = numpy.arange(1000) * 1e-9 - 5e-7
+    channel = numpy.linspace(-1, 1, 1000)
+
+    expected = os.path.join(directory, 'expected.csv')
+    numpy.savetxt(expected, numpy.transpose(numpy.vstack((time_array,
+                                                          channel))),
+                  delimiter=',', fmt=['%.3e', '%.7e'])
+    actual = os.path.join(directory, 'actual.csv')
+    write_csv(actual, [time_array, channel], ['%.3e', '%.7e'],
+              chunk_rows=300)
+    eq_(_read(actual), _read(expected))
+
+    numpy.savetxt(expected, channel, delimiter=',', fmt='%.7e')
+    write_csv(actual, [channel], ['%.7e'], chunk_rows=300)
+    eq_(_read(actual), _read(expected))
+
+
+def test_write_csv_lookup_table():
+    directory = tempfile.mkdtemp()
+    time_array = TimeAxis(-5e-7, 1e-9, 1000)
+    # more samples than raw codes, formatted through the lookup table
+    raw = (numpy.arange(1000) % 256 - 128).astype('i1')
+    waveform = Waveform(raw, 7.8125e-3, 0.1)
+
+    expected = os.path.join(directory, 'expected.csv')
+    numpy.savetxt(expected, numpy.transpose(numpy.vstack(
+        (numpy.asarray(time_array), numpy.asarray(waveform)))), delimiter=',',
+                  fmt=['%.3e', '%.7e'])
+    actual = os.path.join(directory, 'actual.csv')
+    write_csv(actual, [time_array, waveform], ['%.3e', '%.7e'],
+              chunk_rows=300)
+    eq_(_read(actual), _read(expected))
+
+
+def test_write_csv_edge_values():
+    directory = tempfile.mkdtemp()
+    values = numpy.array([0.0, -0.0, 1.0, -1.0, 0.5, 2.5, 9.99999995,
+                          9.999999949e-5, 1.25e-101, -3.5e150, 1e-320,
+                          5e-324, 1.7976931348623157e308, numpy.nan,
+                          numpy.inf, -numpy.inf, 123456789.0])
+
+    for fmt in ('%.0e', '%.1e', '%.7e', '%.12e', '%.15e', '%g'):
+        actual = os.path.join(directory, 'actual.csv')
+        write_csv(actual, [values], [fmt])
+        eq_(_read(actual).decode('ascii'),
+            ''.join(fmt % v + '\n' for v in values))
+
+
+@raises(ValueError)
+def test_write_csv_no_columns():
+    write_csv(os.path.join(tempfile.mkdtemp(), 'empty.csv'), [], [])
+
+
+class FakeScope(object):
+    """Hands out the same waveforms whole or in chunks."""
+
+    name = 'osc01'
+
+    def __init__(self, points, chunk_points=None):
+        self.idn = ['KEYSIGHT TECHNOLOGIES', 'DSOX91604A']
+        self.chunk_points = chunk_points
+        self.preambles = dict((s, Preamble(
+                format=2, type=0, points=points, count=1, x_increment=1e-9,
+                x_origin=-5e-7, x_reference=0, y_increment=7.8125e-5 * i,
+                y_origin=0.1, y_reference=0)) for i, s in
+                ((1, 'CHANNEL1'), (2, 'CHANNEL2')))
+        self.raw = dict((s, (numpy.arange(points) * 7 % 65536 - 32768)
+                         .astype('>i2')) for s in self.preambles)
+        self.time_array = TimeAxis(-5e-7, 1e-9, points)
+
+    def _waveforms(self, start, stop):
+        return dict((s, Waveform(self.raw[s][start:stop],
+                                 p.y_increment, p.y_origin))
+                    for (s, p) in self.preambles.items())
+
+    def take_waveform(self, window=None, transfer_format=None):
+        return (self.time_array, '%.3e', self._waveforms(None, None),
+                self.preambles)
+
+    def take_waveform_chunked(self, consume, progress=None, window=None,
+                              transfer_format=None):
+        points = len(self.time_array)
+        for start in range(0, points, self.chunk_points):
+            stop = min(start + self.chunk_points, points)
+            consume(self.time_array[start:stop], '%.3e',
+                    self._waveforms(start, stop), self.preambles)
+            if progress is not None:
+                progress(stop, points)
+
+
+def test_save_waveform_chunked():
+    directory = tempfile.mkdtemp()
+    for fmt in ('combined', 'timed-separated'):
+        expected = os.path.join(directory, 'expected.csv')
+        save_waveform_to_file(FakeScope(70000), expected, fmt)
+        actual = os.path.join(directory, 'actual.csv')
+        progress = list()
+        save_waveform_to_file(FakeScope(70000, 30000), actual, fmt,
+                              progress=lambda *p: progress.append(p))
+        eq_(progress, [(30000, 70000), (60000, 70000), (70000, 70000)])
+        for name in sorted(os.listdir(directory)):
+            if name.startswith('actual'):
+                eq_(_read(os.path.join(directory, name)),
+                    _read(os.path.join(directory,
+                                       name.replace('actual', 'expected'))))
+
+    # the time axis shared by the separated files
+    scope = FakeScope(70000)
+    savetxt = os.path.join(directory, 'savetxt.csv')
+    numpy.savetxt(savetxt, numpy.transpose(numpy.vstack((
+        numpy.asarray(scope.time_array),
+        numpy.asarray(scope._waveforms(None, None)['CHANNEL2'])))),
+                  delimiter=',', fmt=['%.3e', '%.7e'])
+    eq_(_read(os.path.join(directory, 'expected_CHANNEL2.csv')),
+        _read(savetxt))
+
+    filename = os.path.join(directory, 'waveform.npz')
+    scope = FakeScope(1000, 300)
+    save_waveform_to_file(scope, filename, 'npz')
+    container = load_container(filename)
+    eq_(container.meta['time']['points'], 1000)
+    eq_(list(container.raw['CHANNEL2']), list(scope.raw['CHANNEL2']))
+
+
+def test_save_waveform_cancelled():
+    directory = tempfile.mkdtemp()
+
+    def progress(done, total):
+        if done > 30000:
+            raise CaptureCancelled()
+
+    for (fmt, chunk_points, kwargs) in (
+            ('timed-separated', 30000, {'progress': progress}),
+            ('separated', None, {'check_cancelled': _cancel_after(1)})):
+        try:
+            save_waveform_to_file(FakeScope(70000, chunk_points),
+                                  os.path.join(directory, 'w.csv'), fmt,
+                                  **kwargs)
+        except CaptureCancelled:
+            pass
+        else:
+            raise AssertionError('CaptureCancelled not raised')
+        # the partly written files are removed
+        eq_(os.listdir(directory), [])
+
+
+def _cancel_after(calls):
+    count = [0]
+
+    def check_cancelled():
+        count[0] += 1
+        if count[0] > calls:
+            raise CaptureCancelled()
+    return check_cancelled
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from nose.tools import eq_, raises
+
+from osccap import image
+from osccap.image import convert_image, image_format
+from osccap.simulator import bmp_image, png_image
+
+PIXELS = b'\x00\xff\x00' * 6
+
+
+def test_image_format():
+    eq_(image_format(png_image(3, 2, PIXELS)), 'png')
+    eq_(image_format(bmp_image(3, 2, PIXELS)), 'bmp')
+    eq_(image_format(b'\xff\xd8\xff\xe0'), 'jpg')
+    eq_(image_format(b'garbage'), None)
+
+
+def test_convert_image_same_format():
+    data = bmp_image(3, 2, PIXELS)
+    eq_(convert_image(data, 'BMP') is data, True)
+
+
+@raises(ValueError)
+def test_convert_image_unknown_format():
+    convert_image(png_image(3, 2, PIXELS), 'svg')
+
+
+def test_convert_image():
+    data = bmp_image(3, 2, PIXELS)
+    if image.Image is None:
+        try:
+            convert_image(data, 'png')
+        except RuntimeError:
+            return
+        raise AssertionError('RuntimeError not raised')
+
+    png = convert_image(data, 'png')
+    eq_(image_format(png), 'png')
+    eq_(image_format(convert_image(png, 'jpg')), 'jpg')
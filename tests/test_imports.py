@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+from nose.tools import eq_
+
+# seconds a cold import of osccap.oscilloscope may take
+IMPORT_BUDGET = 0.1
+
+
+def _import_times(module):
+    """Return the cumulative import time in seconds of each module imported
+    by a cold import of module."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                          'import ' + module], stderr=subprocess.PIPE,
+                         check=True).stderr.decode()
+    times = dict()
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        (_, cumulative, name) = line.split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_oscilloscope_import_is_lazy():
+    times = _import_times('osccap.oscilloscope')
+    for module in ('numpy', 'vxi11', 'wx', 'osccap.oscilloscope.agilent',
+                   'osccap.oscilloscope.tektronix'):
+        eq_(module in times, False, '{} is imported'.format(module))
+    eq_(times['osccap.oscilloscope'] < IMPORT_BUDGET, True,
+        'import took {:.3f}s'.format(times['osccap.oscilloscope']))
+
+
+def test_cli_import_is_lazy():
+    times = _import_times('osccap.cli')
+    for module in ('numpy', 'vxi11', 'wx'):
+        eq_(module in times, False, '{} is imported'.format(module))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from mock import MagicMock
+from nose.tools import eq_
+
+from osccap.oscilloscope import Oscilloscope
+from osccap.oscilloscope.liveness import LivenessCache
+
+
+def test_liveness_cache():
+    cache = LivenessCache()
+    eq_(cache.get('osc01', 10), None)
+    cache.update('osc01', True)
+    eq_(cache.get('osc01', 10), True)
+    cache.update('osc01', False, timestamp=0)
+    eq_(cache.get('osc01', 10), None)
+
+    # the monitor's result is kept until its next probe
+    now = time.monotonic()
+    cache.update('osc01', False, timestamp=now - 20, valid_until=now + 10)
+    eq_(cache.get('osc01', 10), False)
+    cache.update('osc01', False, timestamp=now - 20, valid_until=now - 1)
+    eq_(cache.get('osc01', 10), None)
+
+
+def test_is_alive_uses_cache():
+    cache = LivenessCache()
+    scope = Oscilloscope('osc01', 'osc01', liveness=cache)
+    scope.probe = MagicMock(return_value=False)
+
+    cache.update('osc01', True)
+    eq_(scope.is_alive(), True)
+    eq_(scope.probe.call_count, 0)
+
+    cache.invalidate('osc01')
+    eq_(scope.is_alive(), False)
+    eq_(scope.probe.call_count, 1)
+
+
+def test_probe_port_of_transport():
+    eq_(Oscilloscope('osc01', 'osc01').probe_port, 111)
+    eq_(Oscilloscope('osc01', 'osc01', transport='socket').probe_port, 5025)
+    eq_(Oscilloscope('osc01', 'osc01', transport='socket',
+                     port=5555).probe_port, 5555)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+
+from nose.tools import eq_, raises
+
+from osccap.metrics import (command_header, InstrumentedTransport, Metrics,
+                            phase, serve_metrics)
+from osccap.oscilloscope.scpi import read_block
+
+from fakes import FakeDevice
+
+
+def test_command_header():
+    eq_(command_header(':WAVEFORM:DATA? 1,1000;:WAVEFORM:POINTS?'),
+        ':WAVEFORM:DATA?')
+    eq_(command_header('DATA:START 1;STOP 10'), 'DATA:START')
+    eq_(command_header('*IDN?'), '*IDN?')
+    eq_(command_header(''), '')
+
+
+def test_histogram_buckets():
+    m = Metrics(buckets=(0.001, 0.01))
+    for seconds in (0.0005, 0.001, 0.005, 0.5):
+        m.record('osc01', 'query', '*IDN?', seconds, 10)
+    h = m.get('osc01', 'query', '*IDN?')
+    eq_(h.counts, [2, 1])
+    eq_(h.count, 4)
+    eq_(h.bytes, 40)
+    eq_(h.cumulative(), [(0.001, 2), (0.01, 3), (float('inf'), 4)])
+
+
+def test_render():
+    m = Metrics(buckets=(0.01,))
+    m.record('osc "1"', 'query', '*IDN?', 0.005, 42)
+    text = m.render()
+    labels = 'scope="osc \\"1\\"",phase="query",command="*IDN?"'
+    assert 'osccap_command_seconds_bucket{{{},le="0.01"}} 1\n' \
+            .format(labels) in text
+    assert 'osccap_command_seconds_bucket{{{},le="+Inf"}} 1\n' \
+            .format(labels) in text
+    assert 'osccap_command_seconds_count{{{}}} 1\n'.format(labels) in text
+    assert 'osccap_command_bytes_total{{{}}} 42\n'.format(labels) in text
+
+
+def test_instrumented_transport():
+    m = Metrics()
+    dev = InstrumentedTransport(FakeDevice(['1', b'#210' + bytes(10) +
+                                            b'\n']), 'osc01', m)
+    dev.write(':WAVEFORM:SOURCE CHANNEL1')
+    dev.write('*OPC?')
+    eq_(dev.read(), '1')
+    dev.write(':WAVEFORM:DATA?')
+    eq_(len(read_block(dev)), 10)
+    dev.close()
+
+    eq_(m.series(), [
+        ('osc01', 'command', ':WAVEFORM:SOURCE'),
+        ('osc01', 'query', '*OPC?'),
+        ('osc01', 'query', ':WAVEFORM:DATA?'),
+        ('osc01', 'transfer', ':WAVEFORM:DATA?'),
+    ])
+    eq_(m.get('osc01', 'query', '*OPC?').bytes, 1)
+    eq_(m.get('osc01', 'query', ':WAVEFORM:DATA?').bytes, 15)
+    eq_(m.get('osc01', 'transfer', ':WAVEFORM:DATA?').count, 1)
+    eq_(dev.timeout, 10)
+
+
+def test_phase():
+    m = Metrics()
+    with phase('osc01', 'export', 'npz', metrics=m) as event:
+        event.nbytes = 100
+    with phase(None, 'export', 'npz', metrics=m):
+        pass
+    eq_(m.series(), [('osc01', 'export', 'npz')])
+    eq_(m.get('osc01', 'export', 'npz').bytes, 100)
+
+
+@raises(ValueError)
+def test_phase_error():
+    m = Metrics()
+    try:
+        with phase('osc01', 'export', 'npz', metrics=m):
+            raise ValueError()
+    finally:
+        eq_(m.series(), [])
+
+
+def test_trace():
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'trace.json')
+        m = Metrics()
+        m.open_trace(filename)
+        m.record('osc01', 'query', '*IDN?', 0.002, 42)
+        m.close_trace()
+        m.record('osc01', 'query', '*IDN?', 0.002, 42)
+        with open(filename) as f:
+            events = json.load(f)
+    finally:
+        shutil.rmtree(directory)
+    eq_(len(events), 2)
+    eq_(events[0]['name'], '*IDN?')
+    eq_(events[0]['cat'], 'query')
+    eq_(events[0]['dur'], 2000)
+    eq_(events[0]['args'], {'scope': 'osc01', 'bytes': 42})
+
+
+def test_serve_metrics():
+    m = Metrics()
+    m.record('osc01', 'query', '*IDN?', 0.002, 42)
+    server = serve_metrics(('127.0.0.1', 0), m)
+    try:
+        url = 'http://127.0.0.1:{}/metrics'.format(server.server_address[1])
+        with urllib.request.urlopen(url) as response:
+            eq_(response.read().decode(), m.render())
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+import time
+
+from mock import MagicMock, patch
+from nose.tools import eq_
+
+from osccap.oscilloscope import Oscilloscope
+from osccap.oscilloscope.liveness import LivenessCache
+from osccap.oscilloscope.monitor import LivenessMonitor
+
+
+def test_monitor_probes_all_scopes():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+
+    alive_scope = Oscilloscope('127.0.0.1', 'alive')
+    alive_scope.probe_port = listener.getsockname()[1]
+    dead_scope = Oscilloscope('127.0.0.1', 'dead')
+    dead_scope.probe_port = closed.getsockname()[1]
+
+    results = dict()
+    done = threading.Event()
+
+    def callback(scope, alive):
+        results[scope.name] = alive
+        if len(results) == 2:
+            done.set()
+
+    cache = LivenessCache()
+    monitor = LivenessMonitor([alive_scope, dead_scope], callback=callback,
+                              liveness=cache)
+    monitor.start()
+    done.wait(5)
+    monitor.stop()
+    monitor.join(5)
+    listener.close()
+    closed.close()
+
+    eq_(results, {'alive': True, 'dead': False})
+    eq_(cache.get('127.0.0.1', 10) is not None, True)
+    eq_(monitor.is_alive(), False)
+
+
+def test_monitor_backoff_keeps_result():
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    cache = LivenessCache()
+    scope = Oscilloscope('127.0.0.1', 'dead', liveness=cache)
+    scope.probe_port = closed.getsockname()[1]
+
+    failures = list()
+    backed_off = threading.Event()
+
+    def callback(scope, alive):
+        failures.append(alive)
+        if len(failures) == 3:
+            backed_off.set()
+
+    monitor = LivenessMonitor([scope], callback=callback, interval=0.05,
+                              max_interval=10, jitter=0, liveness=cache)
+    monitor.start()
+    eq_(backed_off.wait(5), True)
+    # the result is older than max_age, but the next probe isn't due yet
+    time.sleep(0.1)
+    scope.probe = MagicMock(return_value=True)
+    eq_(scope.is_alive(max_age=0.05), False)
+    eq_(scope.probe.call_count, 0)
+    monitor.stop()
+    monitor.join(5)
+    closed.close()
+
+
+def test_monitor_stop_before_start():
+    monitor = LivenessMonitor([], liveness=LivenessCache())
+    monitor.stop()
+    monitor.start()
+    monitor.join(5)
+    eq_(monitor.is_alive(), False)
+
+
+def test_monitor_slow_lookup():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    port = listener.getsockname()[1]
+
+    alive_scope = Oscilloscope('127.0.0.1', 'alive')
+    alive_scope.probe_port = port
+    slow_scope = Oscilloscope('slow.invalid', 'slow')
+    slow_scope.probe_port = port
+
+    getaddrinfo = socket.getaddrinfo
+    release = threading.Event()
+
+    def slow_getaddrinfo(host, *args):
+        if host == 'slow.invalid':
+            release.wait(5)
+            raise socket.gaierror('not found')
+        return getaddrinfo(host, *args)
+
+    results = dict()
+    alive = threading.Event()
+
+    def callback(scope, state):
+        results[scope.name] = state
+        if scope.name == 'alive':
+            alive.set()
+
+    monitor = LivenessMonitor([slow_scope, alive_scope], callback=callback,
+                              liveness=LivenessCache(), jitter=0)
+    with patch('socket.getaddrinfo', side_effect=slow_getaddrinfo):
+        start = time.monotonic()
+        monitor.start()
+        # the lookup of the other scope doesn't hold up this probe
+        eq_(alive.wait(2), True)
+        eq_(time.monotonic() - start < 2, True)
+        eq_('slow' in results, False)
+        release.set()
+        for _ in range(100):
+            if 'slow' in results:
+                break
+            time.sleep(0.01)
+    monitor.stop()
+    monitor.join(5)
+    listener.close()
+
+    eq_(results, {'alive': True, 'slow': False})
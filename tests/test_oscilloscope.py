@@ -1,11 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from mock import MagicMock
-from nose.tools import eq_
+import numpy
 
+from mock import call, MagicMock
+from nose.tools import eq_, raises
+
+from fakes import FakeDevice
 from osccap.oscilloscope.agilent import (binary_block, convert_waveform_data,
+                                         parse_waveform_preamble,
+                                         select_transfer_format,
+                                         take_waveform_chunked,
                                          _take_waveform)
+from osccap.oscilloscope import agilent, tektronix
+from osccap.waveform import SampleWindow, TimeWindow
 
 
 def test_binary_block():
@@ -33,25 +41,225 @@ def test_convert_waveform_data():
     eq_(data[1], 612)
 
 
+PREAMBLE = ('2,0,2,1,1.00000E-09,-1.00000E-09,0,1.00000E+00,1.00000E+01,0,'
+            '1,1.00000E-08,-5.00000E-09,8.00000E-01,0.0,"18 OCT 2026",'
+            '"10:00:00:00","DSOX91604A:MY00000000",1,100,2,1,1.6E+10,0')
+
+
+def test_parse_waveform_preamble():
+    preamble = parse_waveform_preamble(PREAMBLE.replace('"', '').split(','))
+    eq_(preamble.format, 2)
+    eq_(preamble.points, 2)
+    eq_(preamble.x_increment, 1e-9)
+    eq_(preamble.x_origin, -1e-9)
+    eq_(preamble.y_increment, 1.0)
+    eq_(preamble.y_origin, 10.0)
+    eq_(preamble.y_reference, 0)
+
+
 def test_take_waveform():
+    device = FakeDevice([
+        PREAMBLE,
+        b'#14\x00\x01\x00\x02\n',
+    ])
+    (time_array, time_fmt, waveform, preambles) = \
+            _take_waveform(device, ['S1'])
+    eq_(waveform['S1'][0], 11)
+    eq_(waveform['S1'][1], 12)
+    eq_(preambles['S1'].points, 2)
+    eq_(len(time_array), 2)
+    eq_(time_array[0], -1e-9)
+    eq_(len([m for m in device.written if m.endswith('?')]), 2)
+
+
+def test_take_waveform_chunked():
+    device = FakeDevice([
+        PREAMBLE,
+        b'#12\x00\x01\n',
+        b'#12\x00\x02\n',
+    ])
+    chunks = list()
+    progress = list()
+    take_waveform_chunked(device, None, ['S1'],
+                          lambda *chunk: chunks.append(chunk), 1,
+                          progress=lambda *p: progress.append(p))
+    eq_(len(chunks), 2)
+    eq_([list(c[2]['S1']) for c in chunks], [[11], [12]])
+    eq_([list(c[0]) for c in chunks], [[-1e-9], [0.0]])
+    eq_(progress, [(1, 2), (2, 2)])
+    eq_([m for m in device.written if m.startswith(':WAVEFORM:DATA?')],
+        [':WAVEFORM:DATA? 1,1', ':WAVEFORM:DATA? 2,1'])
+
+
+def test_take_waveform_window():
+    preamble = PREAMBLE.replace('2,0,2,1,', '2,0,100,1,', 1)
+    device = FakeDevice([
+        preamble,
+        b'#14\x00\x01\x00\x02\n',
+    ])
+    (time_array, time_fmt, waveform, preambles) = \
+            _take_waveform(device, ['S1'], TimeWindow(9e-9, 1e-8))
+    # the preamble is queried once, for the window and the transfer
+    eq_(device.written.count(':WAVEFORM:PREAMBLE?'), 1)
+    eq_(list(waveform['S1']), [11, 12])
+    eq_(len(time_array), 2)
+    eq_(list(time_array), [9e-9, 1e-8])
+    eq_(device.written[-1], ':WAVEFORM:DATA? 11,2')
+
+
+TEK_PREAMBLE = '2;4;1.0E-9;-2.0E-9;0;5.0E-1;1.0E0;0.0E0'
+
+
+def test_tektronix_take_waveform():
+    device = FakeDevice([
+        '4',
+        TEK_PREAMBLE,
+        TEK_PREAMBLE,
+        b'#18\x01\x00\x02\x00\x03\x00\x04\x00;'
+        b'#18\xff\xff\xfe\xff\xfd\xff\xfc\xff\n',
+    ])
+    (time_array, time_fmt, waveforms, preambles) = \
+            tektronix.take_waveform(device, 'MSO58', ['CH1', 'CH2'])
+    eq_(list(waveforms['CH1']), [1.5, 2.0, 2.5, 3.0])
+    eq_(list(waveforms['CH2']), [0.5, 0.0, -0.5, -1.0])
+    eq_(numpy.allclose(time_array, [-2e-9, -1e-9, 0.0, 1e-9]), True)
+    eq_(preambles['CH1'].points, 4)
+    eq_(device.written[-2:], ['DATA:SOURCE CH1,CH2', 'CURVE?'])
+
+
+def test_tektronix_take_waveform_window():
+    device = FakeDevice([
+        '4',
+        TEK_PREAMBLE,
+        b'#14\x02\x00\x03\x00\n',
+    ])
+    (time_array, time_fmt, waveforms, preambles) = \
+            tektronix.take_waveform(device, 'MSO58', ['CH1'],
+                                    window=SampleWindow(1, 3))
+    eq_(list(waveforms['CH1']), [2.0, 2.5])
+    eq_(list(time_array), [-1e-9, 0.0])
+    eq_('DATA:START 2;STOP 3' in device.written, True)
+
+
+def test_tektronix_take_waveform_chunked():
+    device = FakeDevice([
+        '4',
+        TEK_PREAMBLE,
+        b'#14\x02\x00\x03\x00\n',
+        b'#12\x04\x00\n',
+    ])
+    chunks = list()
+    progress = list()
+    tektronix.take_waveform_chunked(
+            device, 'MSO58', ['CH1'], lambda *chunk: chunks.append(chunk), 2,
+            progress=lambda *p: progress.append(p),
+            window=SampleWindow(1, 4))
+    eq_([list(c[2]['CH1']) for c in chunks], [[2.0, 2.5], [3.0]])
+    eq_(numpy.allclose(numpy.concatenate([c[0] for c in chunks]),
+                       [-1e-9, 0.0, 1e-9]), True)
+    eq_(progress, [(2, 3), (3, 3)])
+    eq_([m for m in device.written if m.startswith('DATA:START')],
+        ['DATA:START 1;STOP 4', 'DATA:START 2;STOP 3',
+         'DATA:START 4;STOP 4'])
+
+
+@raises(NotImplementedError)
+def test_tektronix_save_waveform_window():
+    tektronix.take_waveform(FakeDevice([]), 'MSO58', ['CH1'], 'BINARY',
+                            window=SampleWindow(0, 10))
+
+
+def test_take_waveform_chunked_window():
+    device = FakeDevice([
+        PREAMBLE,
+        b'#12\x00\x02\n',
+    ])
+    chunks = list()
+    take_waveform_chunked(device, None, ['S1'],
+                          lambda *chunk: chunks.append(chunk), 10,
+                          window=SampleWindow(1, None))
+    eq_([list(c[2]['S1']) for c in chunks], [[12]])
+    eq_([list(c[0]) for c in chunks], [[0.0]])
+    eq_(device.written[-1], ':WAVEFORM:DATA? 2,1')
+
+
+def test_select_transfer_format():
+    eq_(select_transfer_format(FakeDevice([]), 'word'), 'WORD')
+    eq_(select_transfer_format(FakeDevice(['RTIM', '0']), 'AUTO'), 'BYTE')
+    eq_(select_transfer_format(FakeDevice(['RTIM', '1']), 'AUTO'), 'WORD')
+    eq_(select_transfer_format(FakeDevice(['HRES', '0']), 'AUTO'), 'WORD')
+
+
+@raises(ValueError)
+def test_select_transfer_format_unknown():
+    select_transfer_format(FakeDevice([]), 'LONG')
+
+
+def test_take_waveform_byte():
+    device = FakeDevice([
+        'RTIM',
+        '0',
+        PREAMBLE.replace('2,', '1,', 1),
+        b'#12\x01\xff\n',
+    ])
+    (time_array, time_fmt, waveform, preambles) = \
+            _take_waveform(device, ['S1'], transfer_format='AUTO')
+    eq_(':WAVEFORM:FORMAT BYTE' in device.written, True)
+    eq_(waveform['S1'].raw.dtype.itemsize, 1)
+    eq_(list(waveform['S1']), [11, 9])
+
+
+def test_tektronix_screenshot_deferred_delete():
+    device = MagicMock()
+    device.read.return_value = '1'
+    device.read_raw_file.return_value = b'PNG'
+    deferred = list()
+    img = tektronix.take_screenshot(device, 'MSO58',
+                                    defer=lambda *c: deferred.append(c))
+    eq_(img, b'PNG')
+    eq_(deferred, [(tektronix._delete_file, 'screen.png')])
+    eq_(call('FILESYSTEM:DELETE "screen.png"') in device.write.call_args_list,
+        False)
+
+    img = tektronix.take_screenshot(device, 'MSO58')
+    eq_(device.write.call_args_list[-1],
+        call('FILESYSTEM:DELETE "screen.png"'))
+
+
+def test_tektronix_screenshot_hardcopy():
     device = MagicMock()
-    device.read = MagicMock()
-    device.read.side_effect = [
-        2,  # POINTS
-        1,  # XINCREMENT
-        0,  # XORIGIN
-        2,  # POINTS
-        1,  # YINCREMENT
-        0,  # YORIGIN
-        2,  # POINTS
-        1,  # YINCREMENT
-        0,  # YORIGIN
-    ]
-    device.read_raw = MagicMock()
-    device.read_raw.side_effect = [
-            b'#232\x00\x01\x00\x02\x00\x03\xfdW\xfd+\xfc\xd0\xfa\xef\xfc\x8b\xfbB\xfcB\xfe\x0b\xfcl\xfbi\xfeR\xfdC\xfc\x8f\n',
-            b'#232\x00\x10\x00\x20\x00\x30\xfdW\xfd+\xfc\xd0\xfa\xef\xfc\x8b\xfbB\xfcB\xfe\x0b\xfcl\xfbi\xfeR\xfdC\xfc\x8f\n',
-        ]
-    (time_array, waveform) = _take_waveform(device, ['S1'])
-    eq_(waveform['S1'][0], 1)
-    eq_(waveform['S1'][1], 2)
+    device.read_raw_file.return_value = b'PNG'
+    eq_(tektronix.take_screenshot(device, 'MSO58', hardcopy=True), b'PNG')
+    eq_(device.write.call_args_list[-1], call('HARDCOPY START'))
+
+
+def test_agilent_screenshot_format():
+    device = FakeDevice([b'#12BM\n'])
+    eq_(agilent.take_screenshot(device, 'DSOX91604A', image_format='bmp'),
+        b'BM')
+    eq_(device.written, [':DISPLAY:DATA? BMP'])
+
+
+@raises(ValueError)
+def test_tektronix_screenshot_unknown_format():
+    tektronix.take_screenshot(MagicMock(), 'MSO58', image_format='svg')
+
+
+def test_tektronix_screenshot_format():
+    device = MagicMock()
+    device.read.return_value = '1'
+    device.read_raw_file.return_value = b'BM'
+    tektronix.take_screenshot(device, 'MSO58', image_format='bmp')
+    eq_(call('SAVE:IMAGE "screen.bmp"') in device.write.call_args_list, True)
+
+
+@raises(ValueError)
+def test_agilent_unknown_waveform_format():
+    agilent.take_waveform(FakeDevice([]), 'DSOX91604A', ['CHANNEL1'],
+                          waveform_format='WFM')
+
+
+@raises(ValueError)
+def test_tektronix_unknown_waveform_format():
+    tektronix.take_waveform(FakeDevice([]), 'MSO58', ['CH1'],
+                            waveform_format='CSV')
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from mock import MagicMock, call
+from nose.tools import eq_, raises
+
+from fakes import FakeDevice
+from osccap.errors import CompletionTimeout
+from osccap.oscilloscope.scpi import (read_block, read_blocks,
+                                      wait_for_completion)
+
+
+def test_read_block():
+    device = FakeDevice([b'#15hello\n'])
+    device.write('DATA?')
+    eq_(read_block(device, chunk_size=2), bytearray(b'hello'))
+
+
+def test_read_block_indefinite():
+    device = FakeDevice([b'#0hello\n'])
+    device.write('DATA?')
+    eq_(read_block(device), bytearray(b'hello'))
+
+
+def test_read_block_message_end():
+    # END came with the last data byte, there is no terminator to read
+    device = FakeDevice([b'#15hello'])
+    device.write('DATA?')
+    device.message_end = True
+    device.read_raw = MagicMock(side_effect=AssertionError('blocks'))
+    eq_(read_block(device), bytearray(b'hello'))
+
+
+@raises(EOFError)
+def test_read_block_short():
+    device = FakeDevice([b'#19hello'])
+    device.write('DATA?')
+    read_block(device)
+
+
+@raises(ValueError)
+def test_read_block_invalid_header():
+    device = FakeDevice([b'1.0\n'])
+    device.write('DATA?')
+    read_block(device)
+
+
+def test_read_blocks():
+    device = FakeDevice([b'#15hello;#211hello world\n'])
+    device.write('CURVE?')
+    eq_(read_blocks(device, 2), [bytearray(b'hello'),
+                                 bytearray(b'hello world')])
+
+
+@raises(ValueError)
+def test_read_blocks_missing_separator():
+    device = FakeDevice([b'#15hello#15world\n'])
+    device.write('CURVE?')
+    read_blocks(device, 2)
+
+
+def test_wait_for_completion_blocking_opc():
+    device = MagicMock()
+    device.timeout = 2
+    device.read.side_effect = ['1']
+    wait_for_completion(device, 30)
+    eq_(device.write.call_args_list, [call('*OPC?')])
+    eq_(device.timeout, 2)
+
+
+def test_wait_for_completion_polls_esr():
+    device = MagicMock()
+    device.read.side_effect = [
+        '0',  # *OPC?
+        '0',  # *ESR? (clear)
+        '0',  # *ESR?
+        '1',  # *ESR?
+    ]
+    wait_for_completion(device, 10)
+    eq_(device.write.call_args_list,
+        [call('*OPC?'), call('*ESR?'), call('*OPC'), call('*ESR?'),
+         call('*ESR?')])
+
+
+@raises(CompletionTimeout)
+def test_wait_for_completion_timeout():
+    device = MagicMock()
+    device.read.return_value = '0'
+    wait_for_completion(device, 0)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from mock import MagicMock
+from nose.tools import eq_, raises
+
+from osccap.oscilloscope.session import Session
+
+
+def _query(dev, cmd):
+    dev.write(cmd)
+    return dev.read()
+
+
+def test_session_reuses_link():
+    device = MagicMock()
+    device.read.return_value = 'ok'
+    factory = MagicMock(return_value=device)
+    session = Session('osc01', idle_timeout=None, factory=factory)
+
+    for _ in range(3):
+        eq_(session.run(_query, '*IDN?'), 'ok')
+
+    eq_(factory.call_count, 1)
+    eq_(device.open.call_count, 1)
+    eq_(session.opens, 1)
+    eq_(session.uses, 3)
+    eq_(session.saved_opens, 2)
+
+    session.close()
+    eq_(device.close.call_count, 1)
+    eq_(session.is_open, False)
+
+
+def test_session_reconnects_stale_link():
+    stale = MagicMock()
+    stale.read.side_effect = ['ok', EOFError()]
+    fresh = MagicMock()
+    fresh.read.return_value = 'ok'
+    factory = MagicMock(side_effect=[stale, fresh])
+    session = Session('osc01', idle_timeout=None, factory=factory)
+
+    eq_(session.run(_query, '*IDN?'), 'ok')
+    eq_(session.run(_query, '*IDN?'), 'ok')
+    eq_(session.opens, 2)
+    eq_(session.reconnects, 1)
+    eq_(stale.close.call_count, 1)
+
+
+def test_session_retry_drops_deferred_calls():
+    stale = MagicMock()
+    stale.read.side_effect = ['ok', EOFError()]
+    fresh = MagicMock()
+    fresh.read.return_value = 'ok'
+    session = Session('osc01', idle_timeout=None,
+                      factory=MagicMock(side_effect=[stale, fresh]))
+    cleanups = list()
+
+    def _screenshot(dev):
+        session.defer(lambda dev: cleanups.append(dev))
+        return _query(dev, 'SCREEN?')
+
+    eq_(session.run(_query, '*IDN?'), 'ok')
+    eq_(session.run(_screenshot), 'ok')
+    # the deferred call of the retry only, run before the next operation
+    eq_(session.run(_query, '*IDN?'), 'ok')
+    eq_(cleanups, [fresh])
+
+
+@raises(EOFError)
+def test_session_fresh_link_error_is_raised():
+    device = MagicMock()
+    device.read.side_effect = EOFError()
+    session = Session('osc01', idle_timeout=None,
+                      factory=MagicMock(return_value=device))
+    session.run(_query, '*IDN?')
+
+
+def test_session_closes_idle_link():
+    device = MagicMock()
+    session = Session('osc01', idle_timeout=0,
+                      factory=MagicMock(return_value=device))
+    session.run(_query, '*IDN?')
+    session._idle_timer.join()
+    eq_(session.is_open, False)
+    eq_(device.close.call_count, 1)
+
+
+def test_session_runs_deferred_calls_after_return():
+    device = MagicMock()
+    session = Session('osc01', idle_timeout=None,
+                      factory=MagicMock(return_value=device))
+    done = threading.Event()
+
+    def _cleanup(dev, filename):
+        dev.write('DELETE ' + filename)
+        done.set()
+
+    def _screenshot(dev):
+        session.defer(_cleanup, 'screen.png')
+        eq_(done.is_set(), False)
+        return 'img'
+
+    eq_(session.run(_screenshot), 'img')
+    eq_(done.wait(5), True)
+    device.write.assert_called_once_with('DELETE screen.png')
+
+    # the next operation runs pending deferred calls first
+    done.clear()
+    with session._lock:
+        session.run(_screenshot)
+        eq_(device.write.call_count, 1)
+        session.run(lambda dev: dev.write('*CLS'))
+        eq_(device.write.call_args_list[1:], [(('DELETE screen.png',),),
+                                              (('*CLS',),)])
+
+    session.defer(_cleanup, 'other.png')
+    session.close()
+    eq_(device.write.call_count, 3)
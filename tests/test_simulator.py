@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import os
+import shutil
+import tempfile
+import time
+
+from nose.tools import eq_
+from vxi11 import rpc
+from vxi11 import vxi11
+
+from osccap.container import load_container
+from osccap.export import save_waveform_to_file
+from osccap.metrics import metrics
+from osccap.oscilloscope import Oscilloscope
+from osccap.oscilloscope.liveness import LivenessCache
+from osccap.simulator import (create_instrument, PortmapperServer,
+                              program_units, ScpiServer, Vxi11Server,
+                              serve_in_background)
+from osccap.waveform import SampleWindow
+
+
+class _Simulator(object):
+    def __init__(self, model, server=Vxi11Server, **kwargs):
+        self.instrument = create_instrument(model, **kwargs)
+        self.server = server(self.instrument, ('127.0.0.1', 0))
+        serve_in_background(self.server)
+        self.port = self.server.server_address[1]
+
+    def scope(self, transport='vxi11', name='sim', **kwargs):
+        scope = Oscilloscope('127.0.0.1', name, liveness=LivenessCache(),
+                             transport=transport, port=self.port, **kwargs)
+        scope.probe_port = self.port
+        return scope
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_program_units():
+    eq_(program_units('DATA:START 1;STOP 10'),
+        [('DATA:START', '1'), ('DATA:STOP', '10')])
+    eq_(program_units(':wav:data? 1,2;*OPC?;:SAVE:IMAGE "a;b.png"'),
+        [('WAV:DATA?', '1,2'), ('*OPC?', ''), ('SAVE:IMAGE', '"a;b.png"')])
+
+
+def test_portmapper():
+    server = PortmapperServer({vxi11.DEVICE_CORE_PROG: 1234},
+                              ('127.0.0.1', 0))
+    serve_in_background(server)
+
+    class PortMapperClient(rpc.PartialPortMapperClient, rpc.RawTCPClient):
+        def __init__(self, host, port):
+            rpc.PartialPortMapperClient.__init__(self)
+            rpc.RawTCPClient.__init__(self, host, rpc.PMAP_PROG,
+                                      rpc.PMAP_VERS, port)
+
+    client = PortMapperClient('127.0.0.1', server.server_address[1])
+    eq_(client.get_port((vxi11.DEVICE_CORE_PROG, vxi11.DEVICE_CORE_VERS,
+                         rpc.IPPROTO_TCP, 0)), 1234)
+    eq_(client.get_port((1, 1, rpc.IPPROTO_TCP, 0)), 0)
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_agilent_end_to_end():
+    sim = _Simulator('DSOX91604A', points=1000)
+    scope = sim.scope(screenshot_format='bmp')
+    eq_(scope.get_manufacturer(), 'KEYSIGHT TECHNOLOGIES')
+    eq_(scope.get_model(), 'DSOX91604A')
+
+    scope.selected_sources = ['CHANNEL1', 'CHANNEL2']
+    (time_array, time_fmt, waveforms, preambles) = scope.take_waveform()
+    eq_(len(time_array), 1000)
+    for source in scope.selected_sources:
+        eq_(numpy.allclose(waveforms[source],
+                           sim.instrument.samples(source) * 1e-4), True)
+
+    (time_array, time_fmt, waveforms, preambles) = scope.take_waveform(
+            window=SampleWindow(100, 110), transfer_format='BYTE')
+    eq_(len(time_array), 10)
+    eq_(waveforms['CHANNEL1'].raw.dtype.itemsize, 1)
+    eq_(numpy.allclose(waveforms['CHANNEL1'],
+                       sim.instrument.samples('CHANNEL1')[100:110] * 1e-4,
+                       atol=256e-4), True)
+
+    scope.chunk_points = 300
+    chunks = list()
+    scope.take_waveform_chunked(
+            lambda t, f, w, p: chunks.append(len(w['CHANNEL2'])))
+    eq_(chunks, [300, 300, 300, 100])
+
+    eq_(scope.take_screenshot(image_format=None)[:2], b'BM')
+    eq_(scope.take_screenshot(image_format='bmp')[:2], b'BM')
+    scope.close()
+    sim.close()
+
+
+def test_metrics_end_to_end():
+    sim = _Simulator('DSOX91604A', points=1000)
+    scope = sim.scope(name='sim-metrics')
+    scope.selected_sources = ['CHANNEL1']
+    directory = tempfile.mkdtemp()
+    try:
+        save_waveform_to_file(scope, os.path.join(directory, 'w.csv'),
+                              'timed-combined')
+        size = os.path.getsize(os.path.join(directory, 'w.csv'))
+    finally:
+        shutil.rmtree(directory)
+    scope.close()
+    sim.close()
+
+    eq_(metrics.get('sim-metrics', 'query', '*IDN?').count, 1)
+    data = metrics.get('sim-metrics', 'transfer', ':WAVEFORM:DATA?')
+    eq_(data.count, 1)
+    eq_(data.bytes, 2 + 4 + 2000 + 1)
+    eq_(metrics.get('sim-metrics', 'export', 'timed-combined').bytes, size)
+    assert metrics.get('sim-metrics', 'command', ':WAVEFORM:SOURCE') \
+            is not None
+
+
+def test_windowed_container_time_axis():
+    directory = tempfile.mkdtemp()
+    try:
+        for (model, source) in (('DSOX91604A', 'CHANNEL1'),
+                                ('MSO58', 'CH1')):
+            sim = _Simulator(model, points=1000)
+            scope = sim.scope()
+            scope.selected_sources = [source]
+            window = SampleWindow(100, 200)
+            (time_array, time_fmt, waveforms, preambles) = \
+                    scope.take_waveform(window=window)
+            for chunk_points in (None, 30):
+                scope.chunk_points = chunk_points
+                filename = os.path.join(directory, 'w.npz')
+                save_waveform_to_file(scope, filename, 'npz', window=window)
+                container = load_container(filename, mmap=False)
+                eq_(len(container.time_array()), 100)
+                eq_(numpy.allclose(container.time_array(), time_array,
+                                   rtol=0, atol=1e-15), True)
+            scope.close()
+            sim.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_vxi11_without_terminator():
+    # the responses end with VXI-11 END only
+    for (model, sources) in (('DSOX91604A', ['CHANNEL1']),
+                             ('MSO58', ['CH1', 'CH3'])):
+        sim = _Simulator(model, points=1000)
+        sim.instrument.terminator = b''
+        scope = sim.scope()
+        scope.selected_sources = sources
+        started = time.monotonic()
+        (time_array, time_fmt, waveforms, preambles) = scope.take_waveform()
+        # reading a terminator would wait for the I/O timeout
+        assert time.monotonic() - started < 5
+        eq_(numpy.allclose(waveforms[sources[-1]],
+                           sim.instrument.samples(sources[-1]) * 1e-4,
+                           atol=256e-4), True)
+        scope.close()
+        sim.close()
+
+
+def test_tektronix_end_to_end():
+    sim = _Simulator('MSO58', points=1000)
+    scope = sim.scope()
+    eq_(scope.get_manufacturer(), 'TEKTRONIX')
+
+    scope.selected_sources = ['CH1', 'CH3']
+    (time_array, time_fmt, waveforms, preambles) = scope.take_waveform()
+    eq_(len(time_array), 1000)
+    for source in scope.selected_sources:
+        eq_(numpy.allclose(waveforms[source],
+                           sim.instrument.samples(source) * 1e-4), True)
+
+    (time_array, time_fmt, waveforms, preambles) = \
+            scope.take_waveform('WFM', window=SampleWindow(0, 10))
+    eq_(numpy.allclose(waveforms['CH3'],
+                       sim.instrument.samples('CH3')[:10] * 1e-4), True)
+
+    scope.chunk_points = 300
+    chunks = list()
+    scope.take_waveform_chunked(
+            lambda t, f, w, p: chunks.append(numpy.asarray(w['CH3'])))
+    eq_([len(c) for c in chunks], [300, 300, 300, 100])
+    eq_(numpy.allclose(numpy.concatenate(chunks),
+                       sim.instrument.samples('CH3') * 1e-4), True)
+    scope.chunk_points = None
+
+    eq_(scope.take_screenshot()[:4], b'\x89PNG')
+    # the image file is deleted in the background
+    for _ in range(100):
+        if not sim.instrument.files:
+            break
+        time.sleep(0.01)
+    eq_(sim.instrument.files, {})
+
+    scope.hardcopy = True
+    eq_(scope.take_screenshot()[:4], b'\x89PNG')
+
+    # the MSO can't send TIFF, PNG is used instead
+    scope.screenshot_format = 'tif'
+    eq_(scope.take_screenshot(image_format=None)[:4], b'\x89PNG')
+    eq_(scope.screenshot_format, 'png')
+    scope.close()
+    sim.close()
+
+
+def test_tektronix_socket_transport():
+    sim = _Simulator('MSO64', server=ScpiServer, points=500, latency=0.001,
+                     bandwidth=100e6)
+    scope = sim.scope(transport='socket', transfer_format='BYTE')
+    scope.selected_sources = ['CH2', 'CH4']
+    (time_array, time_fmt, waveforms, preambles) = scope.take_waveform(
+            window=SampleWindow(50, 150))
+    eq_(len(time_array), 100)
+    eq_(waveforms['CH4'].raw.dtype.itemsize, 1)
+    eq_(list(waveforms['CH4'].raw),
+        list(sim.instrument.samples('CH4')[50:150] >> 8))
+
+    # the raw files are not framed, the PNG signature contains '\r\n'
+    png = scope.take_screenshot(image_format=None)
+    eq_(png, sim.instrument.screenshot_data('png'))
+    scope.hardcopy = True
+    eq_(scope.take_screenshot(image_format=None), png)
+
+    (time_array, time_fmt, waveforms, preambles) = \
+            scope.take_waveform('WFM')
+    eq_(len(time_array), 500)
+    eq_(numpy.allclose(waveforms['CH2'],
+                       sim.instrument.samples('CH2') * 1e-4), True)
+    scope.close()
+    sim.close()
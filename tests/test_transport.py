@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+
+from nose.tools import eq_, raises
+
+from osccap.oscilloscope.scpi import read_block
+from osccap.oscilloscope.transport import (file_length, SocketTransport,
+                                           Vxi11Transport)
+from osccap.simulator import (bmp_image, create_instrument, png_image,
+                              ScpiServer, serve_in_background, Vxi11Server,
+                              wfm_file)
+
+
+def _check_transport(dev):
+    dev.open()
+    dev.write('*IDN?')
+    eq_(dev.read(), 'KEYSIGHT TECHNOLOGIES,DSOX91604A,SIM0001,1.0')
+    dev.write(':WAVEFORM:DATA?')
+    data = dev.read_raw()
+    eq_(data[:6], b'#42000')
+    eq_(len(data), 2 + 4 + 2000 + 1)
+    dev.write(':WAVEFORM:DATA?')
+    eq_(len(read_block(dev, chunk_size=300)), 2000)
+    dev.write('*OPC?')
+    eq_(dev.read(), '1')
+    dev.close()
+
+
+def test_socket_transport():
+    server = ScpiServer(create_instrument(points=1000), ('127.0.0.1', 0))
+    serve_in_background(server)
+    _check_transport(SocketTransport('127.0.0.1',
+                                     port=server.server_address[1]))
+    server.shutdown()
+    server.server_close()
+
+
+def test_vxi11_transport():
+    server = Vxi11Server(create_instrument(points=1000), ('127.0.0.1', 0))
+    serve_in_background(server)
+    _check_transport(Vxi11Transport('127.0.0.1',
+                                    port=server.server_address[1]))
+    server.shutdown()
+    server.server_close()
+
+
+def test_file_length():
+    png = png_image(2, 2, b'\xff' * 12)
+    bmp = bmp_image(2, 2, b'\xff' * 12)
+    wfm = wfm_file([1, 2, 3], 1.0, 0.0, 1e-9, 0.0)
+    # SOI, an APP0 segment, SOS with entropy coded data, EOI
+    jpeg = (b'\xff\xd8\xff\xe0\x00\x04ab\xff\xda\x00\x03c'
+            b'\x12\xff\x00\x34\xff\xd9')
+    for data in (png, bmp, wfm, jpeg):
+        eq_(file_length(data[:7]), None)
+        eq_(file_length(data + b'trailing'), len(data))
+    eq_(file_length(png[:-12]), None)
+    eq_(file_length(jpeg[:-2]), None)
+
+
+@raises(ValueError)
+def test_file_length_unknown():
+    file_length(b'II*\x00\x08\x00\x00\x00')
+
+
+@raises(socket.timeout)
+def test_socket_read_raw_file_stall():
+    # the instrument stops sending in the middle of the image
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    png = png_image(2, 2, b'\xff' * 12)
+
+    def serve():
+        (conn, _) = listener.accept()
+        conn.recv(64)
+        conn.sendall(png[:-12])
+        stop.wait(5)
+        conn.close()
+
+    stop = threading.Event()
+    thread = threading.Thread(target=serve)
+    thread.start()
+    dev = SocketTransport('127.0.0.1', port=listener.getsockname()[1],
+                          timeout=0.2)
+    try:
+        dev.write('FILESYSTEM:READFILE "screen.png"')
+        dev.read_raw_file()
+    finally:
+        stop.set()
+        thread.join()
+        dev.close()
+        listener.close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+
+from nose.tools import eq_, raises
+
+from osccap.oscilloscope.agilent import Preamble
+from osccap.waveform import (SampleWindow, TimeAxis, TimeWindow, Waveform,
+                             time_info)
+
+
+def test_waveform_scaling():
+    raw = numpy.array([-2, -1, 0, 1, 2], dtype='>i2')
+    waveform = Waveform(raw, 0.5, 1.0)
+    eq_(len(waveform), 5)
+    eq_(waveform[0], 0.0)
+    eq_(waveform[-1], 2.0)
+    eq_(list(waveform[1:3]), [0.5, 1.0])
+    eq_(list(numpy.asarray(waveform)), [0.0, 0.5, 1.0, 1.5, 2.0])
+
+    # the raw samples are not touched
+    eq_(list(raw), [-2, -1, 0, 1, 2])
+
+
+def test_waveform_dtype():
+    waveform = Waveform(numpy.arange(10, dtype='>i2'), 0.25, 0)
+    eq_(waveform.scaled(dtype=numpy.float32).dtype, numpy.float32)
+    eq_(numpy.asarray(waveform).dtype, numpy.float64)
+    eq_(numpy.asarray(waveform, dtype=numpy.float32).dtype, numpy.float32)
+
+
+def test_waveform_chunks():
+    waveform = Waveform(numpy.arange(10, dtype='>i2'), 2, 1)
+    chunks = list(waveform.chunks(4))
+    eq_([len(c) for c in chunks], [4, 4, 2])
+    eq_(list(numpy.concatenate(chunks)), list(numpy.asarray(waveform)))
+
+
+def test_waveform_value_table():
+    waveform = Waveform(numpy.zeros(1, dtype='i1'), 2, 1)
+    (codes, values) = waveform.value_table()
+    eq_(len(codes), 256)
+    eq_(codes[0], -128)
+    eq_(values[0], -255)
+    eq_(values[-1], 255)
+
+
+def test_time_axis():
+    axis = TimeAxis(-1.0, 0.5, 5)
+    eq_(len(axis), 5)
+    eq_(axis[0], -1.0)
+    eq_(axis[-1], 1.0)
+    eq_(list(axis[1:3]), [-0.5, 0.0])
+    eq_(list(numpy.asarray(axis)), [-1.0, -0.5, 0.0, 0.5, 1.0])
+    eq_([len(c) for c in axis.chunks(2)], [2, 2, 1])
+
+
+@raises(IndexError)
+def test_time_axis_index_error():
+    TimeAxis(0, 1, 5)[5]
+
+
+def test_time_axis_length():
+    # numpy.arange(1, 1.3, 0.1) has four elements
+    eq_(len(numpy.asarray(TimeAxis(1, 0.1, 3))), 3)
+
+
+def test_time_axis_window():
+    axis = TimeAxis(-1e-6, 1e-9, 2000)
+    eq_(axis.window_points(SampleWindow(10, 20)), (10, 10))
+    eq_(axis.window_points(SampleWindow(None, 20)), (0, 20))
+    eq_(axis.window_points(SampleWindow(1990, None)), (1990, 10))
+    eq_(axis.window_points(SampleWindow(1990, 3000)), (1990, 10))
+    eq_(axis.window_points(TimeWindow(-5e-9, 5e-9)), (995, 11))
+    eq_(axis.window_points(TimeWindow(-5.5e-9, 5.5e-9)), (995, 11))
+    eq_(axis.window_points(TimeWindow(-2e-6, -9.9e-7)), (0, 11))
+
+    window = axis.window(995, 11)
+    eq_(len(window), 11)
+    eq_(window[0], axis[995])
+
+
+@raises(ValueError)
+def test_time_axis_window_outside():
+    TimeAxis(0, 1e-9, 100).window_points(TimeWindow(1e-6, 2e-6))
+
+
+def _time_preamble(x_origin, x_increment):
+    return Preamble(format=2, type=0, points=10, count=1,
+                    x_increment=x_increment, x_origin=x_origin,
+                    x_reference=0, y_increment=1.0, y_origin=0.0,
+                    y_reference=0)
+
+
+def test_time_info_rounds_to_nearest_sample():
+    (time_array, time_fmt) = time_info(_time_preamble(2.9999999, 1.0))
+    eq_(time_array[0], 3.0)
+    (time_array, time_fmt) = time_info(_time_preamble(-5e-7, 1e-9))
+    eq_(time_array[0], -500 * 1e-9)
+    (time_array, time_fmt) = time_info(_time_preamble(0.3, 0.1))
+    eq_(time_array[0], 3 * 0.1)
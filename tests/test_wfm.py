@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+import os
+import struct
+import tempfile
+
+from nose.tools import eq_, raises
+
+from osccap.oscilloscope.tektronix import waveforms_from_wfm
+from osccap.waveform import SampleWindow
+from osccap.wfm import load_wfm, parse_wfm
+
+CURVE_OFFSET = 838
+
+
+def make_wfm(samples, byte_order='<', y_scale=0.5, y_offset=1.0,
+             x_scale=1e-9, x_start=-2e-9):
+    """Build a WFM#003 file with two precharge and postcharge points."""
+    samples = numpy.asarray(samples, dtype=byte_order + 'i2')
+    data = bytearray(CURVE_OFFSET)
+    data[0:2] = b'\x0f\x0f' if byte_order == '<' else b'\xf0\xf0'
+    for (offset, fmt, value) in (
+            (2, '8s', b':WFM#003'),
+            (15, 'B', 2),
+            (16, 'i', CURVE_OFFSET),
+            (168, 'd', y_scale),
+            (176, 'd', y_offset),
+            (240, 'i', 0),
+            (488, 'd', x_scale),
+            (496, 'd', x_start),
+            (822, 'I', 4),
+            (826, 'I', 4 + samples.nbytes)):
+        struct.pack_into(byte_order + fmt, data, offset, value)
+    return bytes(data) + b'\0' * 4 + samples.tobytes() + b'\0' * 4
+
+
+# A little endian WFM#003 file with four int16 samples and two precharge and
+# postcharge points each, laid out after the field table of the Tektronix
+# reference waveform file format rather than the offsets of the parser. It
+# includes fields the parser ignores, like the units and dimension sizes.
+SPEC_WFM = b''.join([
+    # 0x000 static file info: byte order, version, 3 digits, 839 bytes to
+    # EOF, 2 bytes per point, curve buffer at 838
+    bytes.fromhex('0f0f3a57 464d2330 30330347 03000002 46030000'),
+    bytes(0x0a8 - 0x014),
+    # 0x0a8 explicit dimension 1: scale 1e-3, offset -0.25, size 65536,
+    # units "V", format 0 (int16) follows
+    bytes.fromhex('fca9f1d2 4d62503f 00000000 0000d0bf 00000100 56'),
+    bytes(0x1e8 - 0x0bd),
+    # 0x1e8 implicit dimension 1: scale 2e-10, offset -4e-10, size 8,
+    # units "s"
+    bytes.fromhex('bbbdd7d9 df7ceb3d bbbdd7d9 df7cfbbd 08000000 73'),
+    bytes(0x314 - 0x1fd),
+    # 0x314 update spec: trigger at 0.5 samples
+    bytes.fromhex('00000000 0000e03f'),
+    bytes(0x332 - 0x31c),
+    # 0x332 curve info: precharge start 0, data start 4, postcharge start
+    # 12, postcharge stop 16, end of curve buffer 16
+    bytes.fromhex('00000000 04000000 0c000000 10000000 10000000'),
+    # 0x346 curve buffer
+    bytes.fromhex('00000000 6400 38ff 2c01 70fe 00000000'),
+])
+
+
+def test_parse_wfm_spec_example():
+    wfm = parse_wfm(SPEC_WFM)
+    eq_(wfm.bytes_per_point, 2)
+    eq_(wfm.frames, 0)
+    eq_(wfm.trigger_fraction, 0.5)
+    eq_(list(wfm.raw), [100, -200, 300, -400])
+    eq_(numpy.allclose(wfm.waveform, [-0.15, -0.45, 0.05, -0.65]), True)
+    eq_(numpy.allclose(wfm.time_axis, [-4e-10, -2e-10, 0.0, 2e-10]), True)
+
+
+def test_parse_wfm():
+    for byte_order in '<>':
+        wfm = parse_wfm(make_wfm([1, 2, 3, -1], byte_order))
+        eq_(wfm.points, 4)
+        eq_(list(wfm.raw), [1, 2, 3, -1])
+        eq_(list(wfm.waveform), [1.5, 2.0, 2.5, 0.5])
+        eq_(numpy.allclose(wfm.time_axis, [-2e-9, -1e-9, 0.0, 1e-9]), True)
+
+
+def test_load_wfm():
+    filename = os.path.join(tempfile.mkdtemp(), 'waveform.wfm')
+    with open(filename, 'wb') as f:
+        f.write(make_wfm(numpy.arange(1000)))
+
+    wfm = load_wfm(filename)
+    eq_(isinstance(wfm.raw, numpy.memmap), True)
+    eq_(list(wfm.raw[-2:]), [998, 999])
+    eq_(list(load_wfm(filename, mmap=False).raw), list(range(1000)))
+    del wfm
+
+
+@raises(ValueError)
+def test_parse_wfm_version():
+    parse_wfm(make_wfm([1]).replace(b':WFM#003', b':WFM#001'))
+
+
+def test_waveforms_from_wfm():
+    (time_array, time_fmt, waveforms, preambles) = waveforms_from_wfm(
+            {'CH1': make_wfm([1, 2, 3, 4]), 'CH2': make_wfm([0, 0, 1, 1])},
+            SampleWindow(1, 3))
+    eq_(list(waveforms['CH1']), [2.0, 2.5])
+    eq_(list(waveforms['CH2']), [1.0, 1.5])
+    eq_(len(time_array), 2)
+    eq_(preambles['CH1'].points, 4)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from nose.tools import eq_
+
+from osccap.errors import CaptureCancelled
+from osccap.worker import CaptureQueue
+
+
+def _queue():
+    done = list()
+    states = list()
+    finished = threading.Event()
+
+    def callback(job):
+        done.append(job)
+        finished.set()
+
+    queue = CaptureQueue(callback=callback, state_callback=states.append)
+    return (queue, done, states, finished)
+
+
+def test_capture_queue_runs_jobs():
+    (queue, done, states, finished) = _queue()
+    queue.start()
+    job = queue.submit('a', lambda x: x * 2, 21)
+    finished.wait(5)
+    queue.stop()
+    queue.join(5)
+
+    eq_(done, [job])
+    eq_(job.result, 42)
+    eq_(job.error, None)
+    eq_(states[0], 1)
+    eq_(states[-1], 0)
+
+
+def test_capture_queue_coalesce_and_cancel():
+    (queue, done, states, finished) = _queue()
+    running = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        running.set()
+        release.wait(5)
+        queue.check_cancelled()
+        return 'slow'
+
+    queue.start()
+    job = queue.submit('a', slow)
+    running.wait(5)
+
+    # the same capture while it is running isn't queued again
+    eq_(queue.submit('a', slow) is job, True)
+    other = queue.submit('b', lambda: 'b')
+    eq_(queue.pending, 2)
+
+    queue.cancel('b')
+    eq_(other.cancelled.is_set(), True)
+    eq_(queue.pending, 1)
+
+    queue.cancel()
+    release.set()
+    finished.wait(5)
+    queue.stop()
+    queue.join(5)
+
+    eq_(done, [job])
+    eq_(isinstance(job.error, CaptureCancelled), True)
+    eq_(states[-1], 0)
+
+
+def test_capture_queue_stop_before_start():
+    (queue, done, states, finished) = _queue()
+    queue.stop()
+    queue.start()
+    queue.join(5)
+    eq_(queue.is_alive(), False)